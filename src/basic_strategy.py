@@ -5,12 +5,26 @@ class BasicStrategy:
 
     def __init__(self):
         self.eng = None
+        self.data_depth = None # order book depth read from snapshots in on_tick, None = exchange max depth
 
     def set_engine(self, eng):
         self.eng = eng
 
+    def subscriptions(self) -> list:
+        '''
+        wake-up conditions from subscription.py, on_tick is only called when one of them fires.
+        [] (default) wakes the strategy on the first order after >= 10 time units
+        '''
+        return []
+
+    def __getstate__(self):
+        # the engine is re-attached by Engine.restore(), order callbacks must be picklable (no lambdas / closures)
+        state = self.__dict__.copy()
+        state['eng'] = None
+        return state
+
     def buy(self, symbol: str, price: float, volume: float, timestamp: int, callback = None):
-        self.eng.place_order({
+        return self.eng.place_order({
             'symbol': symbol,
             'price': price,
             'volume': volume,
@@ -23,7 +37,7 @@ class BasicStrategy:
         }, 'test')
 
     def sell(self, symbol: str, price: float, volume: float, timestamp: int, callback = None):
-        self.eng.place_order({
+        return self.eng.place_order({
             'symbol': symbol,
             'price': price,
             'volume': volume,
@@ -36,7 +50,7 @@ class BasicStrategy:
         }, 'test')
 
     def short(self, symbol: str, price: float, volume: float, timestamp: int, callback = None):
-        self.eng.place_order({
+        return self.eng.place_order({
             'symbol': symbol,
             'price': price,
             'volume': volume,
@@ -49,7 +63,7 @@ class BasicStrategy:
         }, 'test')
 
     def long(self, symbol: str, price: float, volume: float, timestamp: int,callback = None):
-        self.eng.place_order({
+        return self.eng.place_order({
             'symbol': symbol,
             'price': price,
             'volume': volume,
@@ -61,5 +75,25 @@ class BasicStrategy:
             'timestamp': timestamp
         }, 'test')
     
+    def cover(self, symbol: str, price: float, volume: float, timestamp: int, callback = None):
+        # buy back a short position
+        return self.eng.place_order({
+            'symbol': symbol,
+            'price': price,
+            'volume': volume,
+            'is_history': False,
+            'order_type': OrderType.LIMIT,
+            'direction': Direction.SHORT,
+            'offset': Offset.CLOSE,
+            'callback': callback,
+            'timestamp': timestamp
+        }, 'test')
+
+    def cancel(self, symbol: str, order_id: int) -> bool:
+        return self.eng.exchange.cancel_order(symbol, order_id)
+
+    def amend(self, symbol: str, order_id: int, price: float = None, volume: float = None, timestamp: int = None):
+        return self.eng.exchange.amend_order(symbol, order_id, price, volume, timestamp)
+
     def get_account(self):
         return self.eng.exchange.accounts['test']
@@ -0,0 +1,239 @@
+import argparse, gc, gzip, json, os, platform, shutil, sys, tempfile, time
+import numpy as np
+from typing import Any, Callable, Dict, List
+from constant import Direction, Offset, OrderType
+from data_loader import DataLoader, TradeTape
+from engine import Engine
+from grid_trading import GridTrading
+from item import OrderData, TickData
+from simulator import Future
+'''
+Benchmark suite of the hot paths, every input comes from a generator with a fixed seed so runs on the
+same machine are comparable :
+    python benchmark.py --save benchmark_baseline.json     # record a baseline
+    python benchmark.py --compare benchmark_baseline.json  # rerun and compare with it
+micro : Future matching (sweep of the best levels), algo order cancel and snapshot at several book depths
+        and queue lengths, ob500 feed parsing
+macro : full GridTrading replay of a synthetic trade tape, step by step and with replay_block
+Each benchmark reports the best of repeat runs, ns_per_op is seconds / ops. The macro benchmarks also
+store the final balance, a different balance means the change altered results, not only speed.
+'''
+
+SYMBOL = 'BENCH'
+START_PRICE = 92000.0
+TICK = 0.1
+
+def synthetic_trades(n: int, seed: int = 0, symbol: str = SYMBOL, start_price: float = START_PRICE) -> TradeTape:
+    '''
+    random walk of n trades : price moves by a few ticks, exponential gaps of ~20 ms, lognormal sizes
+    '''
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([-1, 0, 1], size=n) * rng.integers(0, 30, size=n)
+    price = np.round(start_price + TICK * np.cumsum(steps), 1)
+    timestamp = 1732665600000 + np.cumsum(rng.exponential(20, size=n)).astype(np.int64)
+    side = np.where(rng.random(n) < 0.5, 1, -1).astype(np.int8)
+    side[0] = -1 # a first buy would leave only bids in the book before any mid price exists
+    size = np.round(rng.lognormal(-4, 1.2, size=n) + 0.001, 3)
+    return TradeTape({'timestamp': timestamp, 'price': price, 'size': size, 'side': side,
+                      'symbol': np.zeros(n, dtype=np.int16)}, [symbol])
+
+def synthetic_ob500(path: str, n: int, seed: int = 0, levels: int = 500, symbol: str = SYMBOL):
+    '''
+    Bybit ob500 style feed (one snapshot, then deltas of a few levels per message), gzip if path ends with .gz
+    '''
+    rng = np.random.default_rng(seed)
+    opener = gzip.open if path.endswith('.gz') else open
+    fmt = lambda p, v: [f'{p:.1f}', f'{v:.3f}']
+    with opener(path, 'wt') as f:
+        bids = [fmt(START_PRICE - TICK * (i + 1), rng.random()) for i in range(levels)]
+        asks = [fmt(START_PRICE + TICK * (i + 1), rng.random()) for i in range(levels)]
+        f.write(json.dumps({'topic': f'orderbook.500.{symbol}', 'type': 'snapshot', 'ts': 1732665600000,
+                            'data': {'s': symbol, 'b': bids, 'a': asks}}) + '\n')
+        for i in range(n):
+            offsets = rng.integers(1, levels, size=(2, 4))
+            volumes = np.where(rng.random((2, 4)) < 0.2, 0.0, rng.random((2, 4)))
+            b = [fmt(START_PRICE - TICK * o, v) for o, v in zip(offsets[0], volumes[0])]
+            a = [fmt(START_PRICE + TICK * o, v) for o, v in zip(offsets[1], volumes[1])]
+            f.write(json.dumps({'topic': f'orderbook.500.{symbol}', 'type': 'delta', 'ts': 1732665600000 + 10 * (i + 1),
+                                'data': {'s': symbol, 'b': b, 'a': a}}) + '\n')
+
+def build_future(depth: int, queue_len: int, seed: int = 0, algo: bool = True) -> Future:
+    '''
+    book of depth levels per side around START_PRICE, queue_len historical orders per level and
+    (algo = True) one algo order in the middle of every queue
+    '''
+    rng = np.random.default_rng(seed)
+    future = Future(SYMBOL, TickData({'data_depth': 0}), 5)
+    sizes = np.round(rng.lognormal(-3, 1, size=(2, depth, queue_len)) + 0.001, 3).tolist()
+    for side, direction, sign in ((0, Direction.LONG, -1), (1, Direction.SHORT, 1)):
+        for level in range(depth):
+            price = round(START_PRICE + sign * TICK * (level + 1), 1)
+            for k, size in enumerate(sizes[side][level]):
+                if algo and k == queue_len // 2:
+                    future.place_order(OrderData({'symbol': SYMBOL, 'price': price, 'volume': 0.01, 'direction': direction,
+                                                  'offset': Offset.OPEN, 'order_type': OrderType.LIMIT, 'timestamp': 0}))
+                future.place_order(OrderData.history(SYMBOL, price, size, direction, 0))
+    return future
+
+def timed(func: Callable[[], Any]) -> float:
+    # like timeit, the garbage collector is off while timing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        t = time.perf_counter()
+        func()
+        return time.perf_counter() - t
+    finally:
+        if enabled:
+            gc.enable()
+
+def rounds(ops: int, target: int = 2000) -> int:
+    # a single sweep / cancel pass is too short to time, every repeat sums enough fresh books for ~target ops
+    return max(1, min(50, target // max(ops, 1)))
+
+def bench_match(depth: int, queue_len: int, repeat: int) -> Dict[str, Any]:
+    # one historical buy sweeping the best min(depth, 10) ask levels
+    levels = min(depth, 10)
+    n = rounds(levels * queue_len)
+    best = float('inf')
+    for _ in range(repeat):
+        total = 0.0
+        for _ in range(n):
+            future = build_future(depth, queue_len)
+            asks = future.sell_book.keys()[:levels]
+            volume = sum(future.sell_book[p].history_amount() for p in asks)
+            order = OrderData.history(SYMBOL, asks[-1], volume, Direction.LONG, 1)
+            total += timed(lambda: future.place_order(order))
+        best = min(best, total)
+    return {'seconds': best, 'ops': n * levels * queue_len}
+
+def bench_cancel(depth: int, queue_len: int, repeat: int) -> Dict[str, Any]:
+    # cancel every resting algo order (one per level and side)
+    n = rounds(2 * depth)
+    best = float('inf')
+    for _ in range(repeat):
+        total = 0.0
+        for _ in range(n):
+            future = build_future(depth, queue_len)
+            order_ids = list(future.orders)
+            total += timed(lambda: [future.cancel_order(order_id) for order_id in order_ids])
+        best = min(best, total)
+    return {'seconds': best, 'ops': n * 2 * depth}
+
+def bench_snapshot(depth: int, queue_len: int, repeat: int, n: int = 2000) -> Dict[str, Any]:
+    future = build_future(depth, queue_len)
+    best = min(timed(lambda: [future.snapshot() for _ in range(n)]) for _ in range(repeat))
+    return {'seconds': best, 'ops': n}
+
+def bench_ob500(n: int, repeat: int, workdir: str) -> Dict[str, Any]:
+    path = os.path.join(workdir, 'ob500.data.gz')
+    synthetic_ob500(path, n)
+    best = min(timed(lambda: sum(1 for _ in DataLoader().iter_order_book(path))) for _ in range(repeat))
+    return {'seconds': best, 'ops': n + 1}
+
+def bench_replay(n: int, batch: bool, repeat: int, workdir: str) -> Dict[str, Any]:
+    tape_path = os.path.join(workdir, f'trades{n}.tape')
+    if not os.path.exists(tape_path):
+        synthetic_trades(n).save(tape_path, 'synthetic')
+    best, balance = float('inf'), None
+    for _ in range(repeat):
+        engine = Engine()
+        engine.symbol = SYMBOL
+        engine.init_exchange()
+        engine.exchange.add_account('test', 1000000)
+        engine.load_data(tape_path, SYMBOL, opts={'head_num': None}) # head_num defaults to 10 rows
+        strategy = GridTrading(SYMBOL, START_PRICE - 1000, START_PRICE + 1000, 10, 10, 0.1, 200)
+        strategy.set_engine(engine)
+        engine.set_strategy(strategy)
+        best = min(best, timed(lambda: engine.start(batch=batch, history_file=None, progress_bar=False)))
+        balance = engine.exchange.accounts['test'].balance
+    return {'seconds': best, 'ops': n, 'balance': balance}
+
+def benchmarks(quick: bool, workdir: str) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    depths, queue_lens = ((10, 100), (1, 10)) if quick else ((10, 100, 1000), (1, 10, 100))
+    trades = 20000 if quick else 200000
+    cases = {}
+    for depth in depths:
+        for queue_len in queue_lens:
+            if depth * queue_len > 20000: # building the book would dominate the run
+                continue
+            cases[f'match/depth={depth}/queue={queue_len}'] = lambda r, d=depth, q=queue_len: bench_match(d, q, r)
+            cases[f'cancel/depth={depth}/queue={queue_len}'] = lambda r, d=depth, q=queue_len: bench_cancel(d, q, r)
+        cases[f'snapshot/depth={depth}'] = lambda r, d=depth: bench_snapshot(d, 1, r)
+    cases['ob500_parse'] = lambda r: bench_ob500(2000 if quick else 20000, r, workdir)
+    cases['replay/step'] = lambda r: bench_replay(trades, False, r, workdir)
+    cases['replay/batch'] = lambda r: bench_replay(trades, True, r, workdir)
+    return cases
+
+def machine() -> Dict[str, str]:
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count()
+    }
+
+def run(quick: bool = False, repeat: int = 5, select: str = None) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='simulator-bench-')
+    results = {}
+    try:
+        for name, case in benchmarks(quick, workdir).items():
+            if select is not None and select not in name:
+                continue
+            result = case(repeat)
+            result['ns_per_op'] = result['seconds'] / max(result['ops'], 1) * 1e9
+            results[name] = result
+            print(f'{name:<32}{result["ns_per_op"]:>14.0f} ns/op{result["seconds"] * 1e3:>12.2f} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'machine': machine(), 'quick': quick, 'repeat': repeat, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1) -> List[str]:
+    '''
+    print current against baseline, returns the names that are slower than baseline by more than tolerance
+    or whose balance changed
+    '''
+    if current['machine'] != baseline['machine']:
+        print('warning : the baseline was recorded on another machine / environment')
+    if current.get('quick') != baseline.get('quick'):
+        print('warning : quick and full runs use different sizes')
+    regressions = []
+    print(f'{"benchmark":<32}{"baseline":>14}{"current":>14}{"ratio":>8}')
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f'{name:<32}{"-":>14}{result["ns_per_op"]:>14.0f}')
+            continue
+        ratio = result['ns_per_op'] / base['ns_per_op']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = ' slower'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = ' faster'
+        if 'balance' in base and result.get('balance') != base['balance']:
+            flag += f' balance {base["balance"]} -> {result.get("balance")}'
+            regressions.append(name)
+        print(f'{name:<32}{base["ns_per_op"]:>14.0f}{result["ns_per_op"]:>14.0f}{ratio:>8.2f}{flag}')
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='simulator hot path benchmarks')
+    parser.add_argument('--save', help='write the results to this JSON baseline')
+    parser.add_argument('--compare', help='compare the results with this JSON baseline')
+    parser.add_argument('--quick', action='store_true', help='smaller books and tapes')
+    parser.add_argument('--repeat', type=int, default=5, help='best of repeat runs')
+    parser.add_argument('--select', help='only run benchmarks whose name contains this')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown reported as regression by --compare')
+    args = parser.parse_args()
+
+    current = run(args.quick, args.repeat, args.select)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(current, baseline, args.tolerance) else 0)
@@ -1,91 +1,382 @@
 import json
+import os, shutil, gzip, time, logging
+import sortedcontainers
+from itertools import islice
 import datetime as dt
-from typing import List, Dict
-from item import TickData
+from typing import List, Dict, Iterator, Optional
+from item import TickData, HistoryTrade
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger('data_loader')
+
+# orjson / msgspec are optional, both are several times faster than json on the ob500 feed
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+        json_loads = msgspec.json.decode
+    except ImportError:
+        json_loads = json.loads
+
+TRADE_COLUMNS = ['timestamp', 'symbol', 'side', 'size', 'price']
+TRADE_DTYPES = {'timestamp': 'float64', 'symbol': 'str', 'side': 'str', 'size': 'float64', 'price': 'float64'}
+# column layout of the binary trade tape, side is 1 for Buy and -1 for Sell
+TAPE_COLUMNS = {'timestamp': np.int64, 'price': np.float64, 'size': np.float64, 'side': np.int8, 'symbol': np.int16}
+SIDE_NAMES = {1: 'Buy', -1: 'Sell'}
+
+class TradeTape:
+    """
+    Columnar trade tape: one raw binary file per column plus meta.json (length, symbol dictionary).
+    Columns are opened with np.memmap, so every process reading the same tape shares the page cache
+    and select() only returns views.
+    """
+    timestamp: np.ndarray # int64, milliseconds
+    price: np.ndarray
+    size: np.ndarray
+    side: np.ndarray      # int8, 1 = Buy, -1 = Sell
+    symbol: np.ndarray    # int16 code into symbols
+    symbols: List[str]
+
+    def __init__(self, columns: Dict[str, np.ndarray], symbols: List[str], is_sorted: bool = True):
+        for k in TAPE_COLUMNS:
+            setattr(self, k, columns[k])
+        self.symbols = symbols
+        self.is_sorted = is_sorted
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @staticmethod
+    def open(path: str) -> 'TradeTape':
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        columns = {}
+        for k, dtype in TAPE_COLUMNS.items():
+            if meta['length'] == 0:
+                columns[k] = np.empty(0, dtype=dtype)
+            else:
+                columns[k] = np.memmap(os.path.join(path, k + '.bin'), dtype=dtype, mode='r', shape=(meta['length'],))
+        return TradeTape(columns, meta['symbols'], meta['sorted'])
+
+    def save(self, path: str, source: str = '') -> str:
+        '''
+        write the tape as a TradeTape directory, TradeTape.open(path) / Engine.load_data(path) read it back
+        '''
+        os.makedirs(path, exist_ok=True)
+        for k, dtype in TAPE_COLUMNS.items():
+            np.ascontiguousarray(getattr(self, k), dtype=dtype).tofile(os.path.join(path, k + '.bin'))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'length': len(self), 'symbols': list(self.symbols), 'sorted': self.is_sorted, 'source': source}, f)
+        return path
+
+    def take(self, index) -> 'TradeTape':
+        return TradeTape({k: getattr(self, k)[index] for k in TAPE_COLUMNS}, self.symbols, self.is_sorted)
+
+    def select(self, opts = {}) -> 'TradeTape':
+        """
+        Apply the same head_num / start_timestamp / end_timestamp filters as DataLoader.load_data
+        """
+        tape = self
+        if opts.get('head_num', 10) is not None:
+            tape = tape.take(slice(0, opts.get('head_num', 10)))
+        if not tape.is_sorted:
+            mask = np.ones(len(tape), dtype=bool)
+            if 'start_timestamp' in opts:
+                mask &= tape.timestamp > opts['start_timestamp']
+            if 'end_timestamp' in opts:
+                mask &= tape.timestamp < opts['end_timestamp']
+            return tape.take(mask)
+        lo, hi = 0, len(tape)
+        if 'start_timestamp' in opts:
+            lo = int(np.searchsorted(tape.timestamp, opts['start_timestamp'], side='right'))
+        if 'end_timestamp' in opts:
+            hi = int(np.searchsorted(tape.timestamp, opts['end_timestamp'], side='left'))
+        return tape.take(slice(lo, max(lo, hi)))
+
+    def iter_trades(self, chunk_size: int = 100000) -> Iterator[HistoryTrade]:
+        for start in range(0, len(self), chunk_size):
+            end = start + chunk_size
+            yield from map(HistoryTrade._make, zip(
+                self.timestamp[start:end].tolist(),
+                [self.symbols[c] for c in self.symbol[start:end].tolist()],
+                [SIDE_NAMES[c] for c in self.side[start:end].tolist()],
+                self.size[start:end].tolist(),
+                self.price[start:end].tolist()))
+
+    def iter_blocks(self, chunk_size: int = 100000) -> Iterator['TradeTape']:
+        for start in range(0, len(self), chunk_size):
+            yield self.take(slice(start, start + chunk_size))
+
+def merge_trade_blocks(block_iters: List[Iterator[TradeTape]]) -> Iterator[TradeTape]:
+    """
+    Streaming k-way merge of time ordered TradeTape block streams (one per symbol) into time ordered blocks.
+    Only the current block of every stream is held. A block is cut below the smallest last timestamp of the
+    streams that are not finished, trades with equal timestamps keep the order of block_iters
+    (same as heapq.merge over the trades).
+    """
+    streams = [[it, None, False] for it in block_iters] # [iterator, pending block, exhausted]
+    symbols: Dict[str, int] = {}
+
+    def extend(stream):
+        block = next(stream[0], None)
+        if block is None:
+            stream[2] = True
+        elif stream[1] is None or len(stream[1]) == 0:
+            stream[1] = block
+        else:
+            # symbol codes of a stream are stable, later blocks can only add symbols
+            stream[1] = TradeTape({k: np.concatenate([getattr(stream[1], k), getattr(block, k)]) for k in TAPE_COLUMNS}, block.symbols)
+    for stream in streams:
+        extend(stream)
+    while True:
+        streams = [stream for stream in streams if not (stream[2] and (stream[1] is None or len(stream[1]) == 0))]
+        if len(streams) == 0:
+            return
+        for stream in streams:
+            while not stream[2] and (stream[1] is None or len(stream[1]) == 0):
+                extend(stream)
+        open_ends = [int(stream[1].timestamp[-1]) for stream in streams if not stream[2] and len(stream[1])]
+        cut = min(open_ends) if open_ends else None
+        parts = []
+        for stream in streams:
+            block = stream[1]
+            if block is None or len(block) == 0:
+                continue
+            k = len(block) if cut is None else int(np.searchsorted(block.timestamp, cut, side='left'))
+            if k == 0:
+                continue
+            lut = np.array([symbols.setdefault(sym, len(symbols)) for sym in block.symbols], dtype=np.int16)
+            part = {k_: getattr(block, k_)[:k] for k_ in TAPE_COLUMNS}
+            part['symbol'] = lut[part['symbol']]
+            parts.append(part)
+            stream[1] = block.take(slice(k, None))
+        if len(parts) == 0: # the earliest open stream only has trades at cut left, read its next block
+            for stream in streams:
+                if not stream[2] and len(stream[1]) and int(stream[1].timestamp[-1]) == cut:
+                    extend(stream)
+            continue
+        columns = {k: np.concatenate([part[k] for part in parts]) for k in TAPE_COLUMNS}
+        if len(parts) > 1:
+            order = np.argsort(columns['timestamp'], kind='stable')
+            columns = {k: v[order] for k, v in columns.items()}
+        yield TradeTape(columns, list(symbols))
+
+def frame_columns(df: pd.DataFrame, symbols: Dict[str, int]) -> Dict[str, np.ndarray]:
+    """
+    Convert a trade chunk from iter_trade_chunks to tape columns, new symbols are added to symbols
+    """
+    for s in df['symbol'].unique():
+        symbols.setdefault(s, len(symbols))
+    return {
+        'timestamp': df['timestamp'].to_numpy(np.int64),
+        'price': df['price'].to_numpy(np.float64),
+        'size': df['size'].to_numpy(np.float64),
+        'side': np.where(df['side'].to_numpy() == 'Buy', 1, -1).astype(np.int8),
+        'symbol': df['symbol'].map(symbols).to_numpy(np.int16),
+    }
+
 class DataLoader:   
-    def process_order_book(self, file_path: str) -> List[TickData]:
-        # Initialize lists to store all bid/ask prices and volumes
-        bid_prices: Dict[float, float] = {}  # price -> volume
-        ask_prices: Dict[float, float] = {}  # price -> volume
-        tick_list = []
+    def iter_order_book(self, file_path: str, data_depth: int = 5) -> Iterator[TickData]:
+        """
+        Replay the ob500 snapshot/delta feed lazily, yielding the top data_depth levels after every message.
+        Both sides are kept in SortedDict and updated in place by the deltas,
+        so each tick only walks the first data_depth keys instead of sorting the whole book.
+        .gz files are decompressed on the fly. Parse throughput is kept in self.order_book_stats.
+        """
+        bid_prices = sortedcontainers.SortedDict()  # price -> volume
+        ask_prices = sortedcontainers.SortedDict()  # price -> volume
+        messages, parse_time = 0, 0.0
         
-        with open(file_path, 'r') as f:
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rb') as f:
             for line in f:
-                data = json.loads(line)
-                timestamp = data['ts']
+                start = time.perf_counter()
+                data = json_loads(line)
+                book = data['data']
                 
                 if data['type'] == 'snapshot':
                     bid_prices.clear()
                     ask_prices.clear()
-                    
-                    for price_str, volume_str in data['data']['b']:
-                        bid_prices[float(price_str)] = float(volume_str)
-                    for price_str, volume_str in data['data']['a']:
-                        ask_prices[float(price_str)] = float(volume_str)
+                    bid_prices.update((float(p), float(v)) for p, v in book['b'])
+                    ask_prices.update((float(p), float(v)) for p, v in book['a'])
                         
                 elif data['type'] == 'delta':
                     # Update based on delta rules
-                    for price_str, volume_str in data['data']['b']:
+                    for price_str, volume_str in book['b']:
                         price, volume = float(price_str), float(volume_str)
                         if volume == 0:  # Delete if volume is 0
                             bid_prices.pop(price, None)
                         else:  # Insert new or update existing
                             bid_prices[price] = volume
                             
-                    for price_str, volume_str in data['data']['a']:
+                    for price_str, volume_str in book['a']:
                         price, volume = float(price_str), float(volume_str)
                         if volume == 0:  # Delete if volume is 0
                             ask_prices.pop(price, None)
                         else:  # Insert new or update existing
                             ask_prices[price] = volume
                 
-                tick = TickData({'data_depth': 5})
-                tick.timestamp = timestamp
-                
-                # Sort and get top 5 bids (highest prices)
-                sorted_bids = sorted(bid_prices.items(), reverse=True)  
-                for i in range(min(5, len(sorted_bids))):
-                    tick.bid_price[i] = sorted_bids[i][0]
-                    tick.bid_volume[i] = sorted_bids[i][1]
+                tick = TickData({'data_depth': data_depth})
+                tick.timestamp = data['ts']
                 
-                # Sort and get top 5 asks (lowest prices)
-                sorted_asks = sorted(ask_prices.items()) 
-                for i in range(min(5, len(sorted_asks))):
-                    tick.ask_price[i] = sorted_asks[i][0]
-                    tick.ask_volume[i] = sorted_asks[i][1]
+                # top bids (highest prices) and top asks (lowest prices)
+                for i, price in enumerate(islice(reversed(bid_prices), data_depth)):
+                    tick.bid_price[i] = price
+                    tick.bid_volume[i] = bid_prices[price]
+                for i, price in enumerate(islice(ask_prices, data_depth)):
+                    tick.ask_price[i] = price
+                    tick.ask_volume[i] = ask_prices[price]
                 
-                tick_list.append(tick)
-                    
-        return tick_list
+                messages += 1
+                parse_time += time.perf_counter() - start
+                yield tick
+        
+        self.order_book_stats = {
+            'messages': messages,
+            'seconds': parse_time,
+            'msg_per_sec': messages / parse_time if parse_time > 0 else 0.0,
+        }
+        logger.info(f'parsed {messages} order book messages in {parse_time:.3f}s '
+                    f'({self.order_book_stats["msg_per_sec"]:.0f} msg/s, decoder: {json_loads.__module__})')
+
+    def process_order_book(self, file_path: str, data_depth: int = 5) -> List[TickData]:
+        return list(self.iter_order_book(file_path, data_depth))
     
+    def iter_trade_chunks(self, filename: str, symbol: str, opts = {}) -> Iterator[pd.DataFrame]:
+        """
+        Stream trade data from CSV file in chunks of opts['chunk_size'] rows.
+        head_num / start_timestamp / end_timestamp are applied while reading,
+        Bybit trade files are in time order so reading stops at end_timestamp.
+        """
+        head_num = opts.get('head_num', 10)
+        chunk_size = opts.get('chunk_size', 100000)
+        reader = pd.read_csv(filename, usecols=TRADE_COLUMNS, dtype=TRADE_DTYPES,
+                             nrows=head_num, chunksize=min(chunk_size, head_num) if head_num else chunk_size)
+        with reader:
+            for df in reader:
+                # Convert datetime by * 1000 and the round to int
+                df['timestamp'] = df['timestamp'].mul(1000).round().astype('int64')
+                done = False
+                if 'start_timestamp' in opts:
+                    df = df[df['timestamp'] > opts['start_timestamp']]
+                if 'end_timestamp' in opts:
+                    done = len(df) > 0 and df['timestamp'].iat[-1] >= opts['end_timestamp']
+                    df = df[df['timestamp'] < opts['end_timestamp']]
+                if len(df) > 0:
+                    yield df[TRADE_COLUMNS]
+                if done:
+                    break
+
+    def iter_trades(self, filename: str, symbol: str, opts = {}) -> Iterator[HistoryTrade]:
+        """
+        Stream trade data one HistoryTrade at a time, memory is bounded by one chunk
+        """
+        tape = self.load_trade_tape(filename, opts)
+        if tape is not None:
+            yield from tape.iter_trades(opts.get('chunk_size', 100000))
+            return
+        for df in self.iter_trade_chunks(filename, symbol, opts):
+            yield from map(HistoryTrade._make, zip(
+                df['timestamp'].tolist(), df['symbol'].tolist(), df['side'].tolist(),
+                df['size'].tolist(), df['price'].tolist()))
+
+    def iter_trade_blocks(self, filename: str, symbol: str, opts = {}) -> Iterator[TradeTape]:
+        """
+        Stream trade data as columnar TradeTape blocks of opts['chunk_size'] rows, for Engine batch replay
+        """
+        tape = self.load_trade_tape(filename, opts)
+        if tape is not None:
+            yield from tape.iter_blocks(opts.get('chunk_size', 100000))
+            return
+        symbols: Dict[str, int] = {}
+        for df in self.iter_trade_chunks(filename, symbol, opts):
+            columns = frame_columns(df, symbols)
+            yield TradeTape(columns, list(symbols))
+
+    def tape_path(self, filename: str) -> str:
+        for ext in ['.gz', '.csv']:
+            if filename.endswith(ext):
+                filename = filename[:-len(ext)]
+        return filename + '.tape'
+
+    def convert_trade_tape(self, filename: str, tape_path: Optional[str] = None, opts = {}) -> str:
+        """
+        One-time conversion of a trade CSV to a TradeTape directory, timestamps are rescaled here once.
+        Reads the whole file unless opts['head_num'] is given.
+        """
+        if tape_path is None:
+            tape_path = self.tape_path(filename)
+        opts = {'head_num': None, **opts}
+        tmp_path = tape_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        symbols: Dict[str, int] = {}
+        length, prev_ts, is_sorted = 0, None, True
+        files = {k: open(os.path.join(tmp_path, k + '.bin'), 'wb') for k in TAPE_COLUMNS}
+        try:
+            for df in self.iter_trade_chunks(filename, None, opts):
+                columns = frame_columns(df, symbols)
+                ts = columns['timestamp']
+                is_sorted = is_sorted and bool(np.all(ts[1:] >= ts[:-1])) and (prev_ts is None or bool(ts[0] >= prev_ts))
+                prev_ts = ts[-1]
+                for k in TAPE_COLUMNS:
+                    columns[k].tofile(files[k])
+                length += len(df)
+        finally:
+            for f in files.values():
+                f.close()
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'length': length, 'symbols': list(symbols), 'sorted': is_sorted, 'source': os.path.basename(filename),
+                       'source_stamp': self.source_stamp(filename)}, f)
+        shutil.rmtree(tape_path, ignore_errors=True)
+        os.replace(tmp_path, tape_path)
+        return tape_path
+
+    def load_trade_tape(self, filename: str, opts = {}) -> Optional[TradeTape]:
+        """
+        Open filename as a TradeTape if it is one, or if opts['cache'] is set convert the CSV
+        on first use and reuse the tape afterwards. Returns None for a plain CSV without cache.
+        """
+        if not os.path.isdir(filename) and not opts.get('cache', False):
+            return None
+        return TradeTape.open(self.cached_tape_path(filename)).select(opts)
+
+    def cached_tape_path(self, filename: str) -> str:
+        """
+        filename if it is a TradeTape already, else the tape next to the CSV, converted on first use
+        and again whenever the CSV changed since (size / mtime differ from the stamp in meta.json)
+        """
+        if os.path.isdir(filename):
+            return filename
+        tape_path = self.tape_path(filename)
+        if not self.tape_is_current(tape_path, filename):
+            self.convert_trade_tape(filename, tape_path)
+        return tape_path
+
+    def source_stamp(self, filename: str) -> List[int]:
+        stat = os.stat(filename)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def tape_is_current(self, tape_path: str, filename: str) -> bool:
+        try:
+            with open(os.path.join(tape_path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get('source_stamp') == self.source_stamp(filename)
+
     def load_data(self, filename: str, symbol: str, opts = {}):
         """
         Load trade data from CSV file
-        Expected CSV columns: datetime, price, volume, direction
+        Expected CSV columns: timestamp, symbol, side, size, price
         """
-        #read only the first 10 rows
-        if 'head_num' in opts:
-            head_num = opts['head_num']
-        else:
-            head_num = 10
-        df = pd.read_csv(filename).head(head_num) #chagne this to see different orderbook depth
-        
-        # Convert datetime by * 1000 and the round to int
-        df['timestamp'] = (round(df['timestamp'] * 1000)).astype(int)
-
-        # Apply date filters if provided
-        if 'start_timestamp' in opts:
-            df = df[df['timestamp'] > opts['start_timestamp']]
-        if 'end_timestamp' in opts:
-            df = df[df['timestamp'] < opts['end_timestamp']]
-        
-        # Store as list of dictionaries for easier processing
-        self.order_data = df.to_dict('records')
-        self.tick_idx = 0
-        
-        return df
+        chunks = list(self.iter_trade_chunks(filename, symbol, opts))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=TRADE_COLUMNS)
+        return pd.concat(chunks, ignore_index=True)
     
 if __name__ == "__main__":
     file_path = "../data/2024-11-27_BTCUSDT_ob500_truncated.data"
@@ -1,11 +1,15 @@
 import datetime as dt
+import pickle, heapq
+from operator import attrgetter
+import numpy as np
 import pandas as pd
 from constant import OrderType, Direction, Offset
 import logging
 from simulator import Exchange
-from item import TickData
+from history_sink import open_sink
+from item import TickData, OrderData, Snapshot
 from tqdm import tqdm
-from data_loader import DataLoader
+from data_loader import DataLoader, TradeTape, merge_trade_blocks
 logger = logging.getLogger('engine')
 
 class Engine:
@@ -13,42 +17,84 @@ class Engine:
     Engine aggregates basic functions, it loads data, runs simulator and strategies.
     '''
     def __init__(self):
-        self.order_data = []  
+        self.streams = {} # symbol -> (order iterator, block iterator, number of orders)
+        self.order_iter = iter(())
+        self.block_iter = iter(())
+        self.order_total = None
         self.tick_idx = 0   
-        self.symbol = 'BTCUSDT'  
+        self.symbol = 'BTCUSDT' # default symbol of init_exchange()
         self.exchange = None
         self.current_time = None
-        self.prev_time = 0
+        self.prev_time = {} # symbol -> time of its previous order
         self.data_loader = DataLoader()
         self.strategy = None
+        self.strategies = []
+        self.polling = [] # strategies without subscriptions, woken every >= 10 time units
+        self.event_strategies = [] # (strategy, subscriptions), woken when a subscription fires
         self.account_history = {} # timestamp, balance, position total value, long position, short position, price
     
     def load_data(self, filename: str, symbol: str, opts = {}):
         """
-        Load trade data from CSV file
+        Open a trade data stream from CSV file or trade tape, rows are read lazily by step()
+        opts['cache'] = True converts the CSV to a memory-mapped trade tape once and reuses it
+        Call it once per symbol to replay several symbols, the streams are merged by timestamp
+        (heap based k-way merge, one chunk per stream in memory). Loading a symbol again replaces its stream.
         """
-        df = self.data_loader.load_data(filename, symbol, opts)
-        
-        # Store as list of dictionaries for easier processing
-        self.order_data = df.to_dict('records')
+        chunk_size = opts.get('chunk_size', 100000)
+        tape = self.data_loader.load_trade_tape(filename, opts)
+        if tape is not None:
+            self.streams[symbol] = (tape.iter_trades(chunk_size), tape.iter_blocks(chunk_size), len(tape))
+        else:
+            self.streams[symbol] = (self.data_loader.iter_trades(filename, symbol, opts),
+                                    self.data_loader.iter_trade_blocks(filename, symbol, opts),
+                                    opts.get('head_num', 10))
+        streams = list(self.streams.values())
+        if len(streams) == 1:
+            self.order_iter, self.block_iter = streams[0][0], streams[0][1]
+        else:
+            self.order_iter = heapq.merge(*[stream[0] for stream in streams], key=attrgetter('timestamp'))
+            self.block_iter = merge_trade_blocks([stream[1] for stream in streams])
+        totals = [stream[2] for stream in streams]
+        self.order_total = None if None in totals else sum(totals)
         self.tick_idx = 0
-        
-        return df
-
-    def init_exchange(self):
-        snapshot = {'BTCUSDT': TickData({
-            'symbol': 'BTCUSDT',
-            'bid_price': [0,0,0,0,0],
-            'bid_volume': [0,0,0,0,0],
-            'ask_price': [0,0,0,0,0],
-            'ask_volume': [0,0,0,0,0],
-            'data_depth': 5
-        })}
-        self.exchange = Exchange(snapshot, 5)
+
+    def init_exchange(self, latency = 0, snapshot: Snapshot = None, symbols: list = None):
+        """
+        Create the exchange with one Future per symbol, each one built from its own initial TickData in snapshot.
+        Without snapshot every symbol in symbols (default [self.symbol]) starts from an empty book.
+        """
+        if snapshot is None:
+            snapshot = {}
+            for symbol in (symbols if symbols is not None else [self.symbol]):
+                snapshot[symbol] = TickData({
+                    'symbol': symbol,
+                    'bid_price': [0,0,0,0,0],
+                    'bid_volume': [0,0,0,0,0],
+                    'ask_price': [0,0,0,0,0],
+                    'ask_volume': [0,0,0,0,0],
+                    'data_depth': 5
+                })
+        self.exchange = Exchange(snapshot, 5, latency)
         self.account_history['test'] = []
     
     def set_strategy(self, strategy):
-        self.strategy = strategy
+        self.strategy = None
+        self.strategies, self.polling, self.event_strategies = [], [], []
+        self.add_strategy(strategy)
+
+    def add_strategy(self, strategy):
+        '''
+        run several strategies, a strategy with a symbol attribute is only woken by orders of that symbol.
+        strategy.subscriptions() (see subscription.py) is read once here, an empty list keeps the 10 time unit polling
+        '''
+        if self.strategy is None:
+            self.strategy = strategy
+        self.strategies.append(strategy)
+        subscriptions = strategy.subscriptions() if hasattr(strategy, 'subscriptions') else []
+        if subscriptions:
+            self.event_strategies.append((strategy, subscriptions))
+        else:
+            self.polling.append(strategy)
 
     def set_exchange(self, exchange):
         self.exchange = exchange
@@ -58,47 +104,190 @@ class Engine:
         Process one order at a time
         Returns the current market snapshot or None if finished
         """
-        # Check if we've processed all orders
-        if self.tick_idx >= len(self.order_data):
+        # Get next order, None if we've processed all orders
+        next_order = next(self.order_iter, None)
+        if next_order is None:
             print('backtesting finished')
             return None
-            
-        # Get next order
-        next_order = self.order_data[self.tick_idx]
         
         # Update current time and tick index
-        self.current_time = round(next_order['timestamp'] * 1000)
+        self.current_time = round(next_order.timestamp * 1000)
         self.tick_idx += 1
         
-        # Send order to exchange
+        # Release algo orders / cancels whose latency has elapsed, then send order to exchange
+        self.exchange.advance_time(self.current_time)
         self.exchange.place_order({
-            'symbol': next_order['symbol'],
-            'price': next_order['price'],
-            'volume': next_order['size'],
-            'direction': Direction.LONG if next_order['side'] == 'Buy' else Direction.SHORT,
+            'symbol': next_order.symbol,
+            'price': next_order.price,
+            'volume': next_order.size,
+            'direction': Direction.LONG if next_order.side == 'Buy' else Direction.SHORT,
             'order_type': OrderType.LIMIT,
             'offset': Offset.OPEN,
             'is_history': True,
             'timestamp': self.current_time
         },'test')
-        # Get current orderbook data snapshot
-        tick = self.exchange.snapshot()
-        cur_price = float(self.exchange.cur_price[self.symbol])
-        # Pass the current orderbook data and price to the strategy every 5 milliseconds
-        if self.current_time - self.prev_time >= 10:
-            self.strategy.on_tick(tick,cur_price,self.current_time)
-
-        self.prev_time = self.current_time
+        # Current orderbook snapshot, a symbol's TickData is only built if the strategy reads it
+        tick = self.exchange.lazy_snapshot(getattr(self.strategy, 'data_depth', None))
+        # Pass the current orderbook data and price to the strategies of this symbol every 10 time units
+        symbol = next_order.symbol
+        if self.event_strategies:
+            self.dispatch(symbol, self.current_time)
+        if self.current_time - self.prev_time.get(symbol, 0) >= 10:
+            self.notify(symbol)
+
+        self.prev_time[symbol] = self.current_time
         return tick
+
+    def notify(self, symbol: str):
+        cur_price = float(self.exchange.cur_price[symbol])
+        for strategy in self.polling:
+            if getattr(strategy, 'symbol', None) in (None, symbol):
+                strategy.on_tick(self.exchange.lazy_snapshot(getattr(strategy, 'data_depth', None)), cur_price, self.current_time)
+
+    def dispatch(self, symbol: str, timestamp: int):
+        '''
+        poll every subscription after an order of symbol, on_tick is called once per strategy if any of them fired
+        '''
+        self.current_time = timestamp
+        exchange = self.exchange
+        for strategy, subscriptions in self.event_strategies:
+            fired = False
+            for subscription in subscriptions:
+                if subscription.poll(exchange, symbol, timestamp): # every subscription is polled to keep its state current
+                    fired = True
+            if fired:
+                cur_price = float(exchange.cur_price[getattr(strategy, 'symbol', None) or symbol])
+                strategy.on_tick(exchange.lazy_snapshot(getattr(strategy, 'data_depth', None)), cur_price, timestamp)
+
+    def quiet_band(self, symbol: str):
+        '''
+        intersection of Subscription.band over all event strategies : (lo, hi, until) in which dispatch
+        fires nothing for orders of symbol, None if some subscription has to see every order
+        '''
+        lo, hi, until = float('-inf'), float('inf'), float('inf')
+        exchange = self.exchange
+        for strategy, subscriptions in self.event_strategies:
+            for subscription in subscriptions:
+                band = subscription.band(exchange, symbol)
+                if band is None:
+                    return None
+                lo, hi, until = max(lo, band[0]), min(hi, band[1]), min(until, band[2])
+        return lo, hi, until
     
+    def replay_block(self, block: TradeTape):
+        """
+        Process a block of orders, same result as calling step() once per order.
+        Strategy wake-ups are found from the timestamp column up front, the trades between
+        two wake-ups are placed by a single Exchange.replay_history call. Event strategies are
+        dispatched once per run of trades in which their subscriptions stay quiet (quiet_band).
+        """
+        n = len(block)
+        if n == 0:
+            return
+        times = block.timestamp.astype(np.int64) * 1000
+        # wake-ups are computed per symbol, against the previous order of the same symbol
+        wake = np.zeros(n, dtype=bool)
+        for code, symbol in enumerate(block.symbols):
+            idx = np.flatnonzero(block.symbol == code)
+            if len(idx) == 0:
+                continue
+            wake[idx] = np.diff(times[idx], prepend=self.prev_time.get(symbol, 0)) >= 10
+            self.prev_time[symbol] = int(times[idx[-1]])
+        wake_idx = np.flatnonzero(wake).tolist() if self.polling else [] # no polling strategy: only subscriptions or history only replay
+        after_trade = self.dispatch if self.event_strategies else None
+        quiet = self.quiet_band if self.event_strategies else None
+        times = times.tolist()
+        symbols = np.array(block.symbols, dtype=object)[block.symbol].tolist()
+        prices = block.price.tolist()
+        sizes = block.size.tolist()
+        buys = (block.side == 1).tolist()
+        start, tick_idx = 0, self.tick_idx
+        for i in wake_idx:
+            self.exchange.replay_history(symbols[start:i + 1], times[start:i + 1], prices[start:i + 1], sizes[start:i + 1], buys[start:i + 1], after_trade, quiet)
+            start = i + 1
+            self.current_time = times[i]
+            self.tick_idx = tick_idx + start
+            self.notify(symbols[i])
+        if start < n:
+            self.exchange.replay_history(symbols[start:], times[start:], prices[start:], sizes[start:], buys[start:], after_trade, quiet)
+        self.current_time = times[-1]
+        self.tick_idx = tick_idx + n
+
+    def checkpoint(self) -> bytes:
+        """
+        Serialize the simulation state: both books of every Future, accounts, resting algo orders,
+        account history and the strategy. The data stream position is not included.
+        """
+        return pickle.dumps({
+            'exchange': self.exchange,
+            'strategies': self.strategies,
+            'polling': self.polling,
+            'event_strategies': self.event_strategies,
+            'tick_idx': self.tick_idx,
+            'current_time': self.current_time,
+            'prev_time': self.prev_time,
+            'order_count': OrderData.order_count
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self, data: bytes):
+        """
+        Replace the simulation state by a checkpoint(), then load_data() the trades that follow it
+        """
+        state = pickle.loads(data)
+        # the old strategies would trade in the restored exchange
+        old_exchange = self.exchange
+        self.detach()
+        self.exchange = state['exchange']
+        self.strategies = state['strategies']
+        self.polling = state['polling']
+        self.event_strategies = state['event_strategies']
+        self.strategy = self.strategies[0] if self.strategies else None
+        for strategy in self.strategies:
+            strategy.set_engine(self)
+        self.tick_idx = state['tick_idx']
+        self.current_time = state['current_time']
+        self.prev_time = state['prev_time']
+        # order ids must stay unique inside the restored exchange
+        OrderData.order_count = max(OrderData.order_count, state['order_count'])
+        del old_exchange
+
+    def detach(self):
+        '''
+        detach the strategies from the running simulation : freeing its books fills the resting algo orders
+        in OrderQueue.__del__, and those callbacks must not reach the strategies or the ledgers any more
+        '''
+        for strategy in self.strategies:
+            strategy.set_engine(None)
+        if self.exchange is not None:
+            for order in self.exchange.pending_orders.values():
+                order.callback = None
+            for future in self.exchange.futures.values():
+                for order in future.orders.values():
+                    order.callback = None
+
     def save_trade_history(self, filename):
         self.exchange.save_trade_history(filename)
 
-    def start(self):
+    def start(self, batch: bool = False, history_file = 'account_history.csv', progress_bar: bool = True, profiler = None):
         """
         Run the simulation until all orders are processed
+        batch = True replays the data block by block with replay_block() instead of step()
+        history_file is a .csv / .npy / .parquet path or a history_sink.HistorySink, the account history
+        is streamed to it in chunks during the run (written on a background thread)
+        history_file = None keeps the account history in self.exchange.trade_history instead of saving it
+        profiler = profiler.Profiler() times the main stages of the run and prints its report at the end
         """
-        for _ in tqdm(range(len(self.order_data)), desc='processing orders'):
+        sink = open_sink(history_file) if isinstance(history_file, str) else history_file
+        self.exchange.set_history_sink(sink)
+        if profiler is not None:
+            profiler.attach(self)
+        progress = tqdm(total=self.order_total, desc='processing orders', disable=not progress_bar)
+        if batch:
+            for block in self.block_iter:
+                self.replay_block(block)
+                progress.update(len(block))
+            print('backtesting finished')
+        while not batch:
             tick = self.step()
             # if len(tick['BTCUSDT'].ask_price) == 0 and len(tick['BTCUSDT'].bid_price) == 0:
             #     continue
@@ -107,7 +296,15 @@ class Engine:
             # tick['BTCUSDT'].show()
             if tick is None:
                 break
-        self.save_trade_history('account_history.csv')
+            progress.update()
+        progress.close()
+        if profiler is not None:
+            profiler.detach()
+            print(profiler.report())
+        if sink is not None:
+            self.exchange.flush_trade_history()
+            self.exchange.set_history_sink(None)
+            sink.close()
 
     def place_order(self, order_dict, account_name=None):
         """
@@ -129,7 +326,6 @@ if __name__ == '__main__':
     exchange.add_account('test')
     engine = Engine()
 
-    engine.load_data('../data/BTCUSDT2024-11-27.csv', 'BTCUSDT', opts = {'head_num': 200000})
+    engine.load_data('../data/BTCUSDT2024-11-27.csv.gz', 'BTCUSDT', opts = {'head_num': 200000})
     engine.set_exchange(exchange)
-    engine.start()
-    engine.save_trade_history('trade_history.csv')
\ No newline at end of file
+    engine.start(history_file='trade_history.csv') # the account history is streamed to the file during the run
\ No newline at end of file
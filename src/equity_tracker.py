@@ -0,0 +1,105 @@
+import math
+from typing import Dict, List, Tuple
+'''
+Mark-to-market equity of an account, sampled by Exchange.update_cur_price every interval time units
+(engine time is in microseconds, the default interval is 1 second). Every sample is O(1) :
+running peak and max drawdown, Welford mean / variance of the per-interval returns for the Sharpe ratio,
+and traded notional for turnover, so report() needs no pass over the data.
+'''
+
+YEAR = 365 * 24 * 3600 * 1000000 # crypto futures trade around the clock
+
+class EquityTracker:
+    def __init__(self, account_name: str, interval: int = 1000000, periods_per_year: float = None, keep_curve: bool = True):
+        self.account_name = account_name
+        self.interval = interval
+        self.periods_per_year = periods_per_year if periods_per_year is not None else YEAR / interval
+        self.next_time = float('-inf') # the first price is always sampled
+        self.last_time = None
+        self.curve: List[Tuple[int, float]] = [] if keep_curve else None
+
+        self.samples = 0
+        self.start_equity = None
+        self.equity = None
+        self.peak = None
+        self.max_drawdown = 0.0 # peak - equity
+        self.max_drawdown_pct = 0.0 # (peak - equity) / peak
+        # Welford statistics of the simple return of every interval
+        self.returns = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.traded_notional = 0.0
+
+    def account_equity(self, account, prices: Dict[str, float]) -> float:
+        equity = account.balance
+        for symbol, position in account.position.items():
+            net = position['long'] - position['short']
+            if net:
+                equity += net * prices[symbol]
+        return equity
+
+    def sample(self, account, prices: Dict[str, float], timestamp: int):
+        equity = self.account_equity(account, prices)
+        if self.equity is None:
+            self.start_equity = self.peak = equity
+        else:
+            # intervals without any trade have a return of 0, they are merged into the statistics at once
+            skipped = timestamp // self.interval - self.last_time // self.interval - 1
+            if skipped > 0:
+                self._add_zero_returns(skipped)
+            self._add_return(equity / self.equity - 1 if self.equity else 0.0)
+        self.equity = equity
+        self.last_time = timestamp
+        self.next_time = (timestamp // self.interval + 1) * self.interval
+        self.samples += 1
+        if equity > self.peak:
+            self.peak = equity
+        drawdown = self.peak - equity
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+        if self.peak > 0 and drawdown / self.peak > self.max_drawdown_pct:
+            self.max_drawdown_pct = drawdown / self.peak
+        if self.curve is not None:
+            self.curve.append((timestamp, equity))
+
+    def _add_return(self, r: float):
+        self.returns += 1
+        delta = r - self.mean
+        self.mean += delta / self.returns
+        self.m2 += delta * (r - self.mean)
+
+    def _add_zero_returns(self, k: int):
+        # parallel Welford merge with k returns of 0 (mean 0, m2 0)
+        n = self.returns + k
+        delta = -self.mean
+        self.m2 += delta * delta * self.returns * k / n
+        self.mean += delta * k / n
+        self.returns = n
+
+    def add_fills(self, notional: float):
+        self.traded_notional += notional
+
+    @property
+    def sharpe(self) -> float:
+        if self.returns < 2 or self.m2 <= 0:
+            return 0.0
+        return self.mean / math.sqrt(self.m2 / (self.returns - 1)) * math.sqrt(self.periods_per_year)
+
+    @property
+    def turnover(self) -> float:
+        # traded notional in multiples of the starting equity
+        return self.traded_notional / self.start_equity if self.start_equity else 0.0
+
+    def report(self) -> dict:
+        return {
+            'account': self.account_name,
+            'samples': self.samples,
+            'start_equity': self.start_equity,
+            'equity': self.equity,
+            'peak': self.peak,
+            'max_drawdown': self.max_drawdown,
+            'max_drawdown_pct': self.max_drawdown_pct,
+            'sharpe': self.sharpe,
+            'traded_notional': self.traded_notional,
+            'turnover': self.turnover
+        }
@@ -3,7 +3,10 @@ from basic_strategy import BasicStrategy
 import sys, os, logging
 from engine import Engine
 from simulator import Exchange
-import numpy as np
+from functools import partial
+from collections import deque
+from metabolic_gm11 import MetabolicGM11
+from indicators import SMA, ReturnStd
 
 class GMStrategy(BasicStrategy):
     def __init__(self, symbol: str, history_length: int, mu: float, trading_options: list, 
@@ -20,19 +23,28 @@ class GMStrategy(BasicStrategy):
         - short_ma_period: Period for short-term moving average
         - long_ma_period: Period for long-term moving average
         """
+        if max(history_length, long_ma_period) < 2:
+            raise ValueError(f'history_length or long_ma_period must be >= 2, got {history_length} and {long_ma_period}')
         super().__init__()
         self.symbol = symbol
         self.history_length = history_length
         self.mu = mu
         self.trading_options = trading_options
         self.min_balance = min_balance
+        self.data_depth = 0 # decisions only use the mid price
         
         # MA parameters
         self.short_ma_period = short_ma_period
         self.long_ma_period = long_ma_period
         
         # Price history for both GM(1,1) and MA calculations
-        self.price_history = []
+        self.price_history = deque(maxlen=max(history_length, long_ma_period))
+        # GM(1,1) on the last history_length prices, updated in O(1) per tick
+        self.gm = MetabolicGM11(history_length)
+        # Rolling indicators, updated in O(1) per tick
+        self.short_ma = SMA(short_ma_period)
+        self.long_ma = SMA(long_ma_period)
+        self.volatility = ReturnStd(self.price_history.maxlen - 1) # returns of the whole price history
         
         # MA signals
         self.prev_short_ma = None
@@ -42,45 +54,23 @@ class GMStrategy(BasicStrategy):
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(f"GMStrategy-{self.symbol}")
 
-    def predict_gm11(self, data: list) -> float:
+    def predict_gm11(self) -> float:
         """
-        Predict the next price using GM(1,1) model.
+        Predict the next price using GM(1,1) model on the last history_length prices.
+        a, b come from the running sums of self.gm (closed-form 2x2 solve) instead of
+        rebuilding and inverting B.T @ B every tick.
         """
-        n = len(data)
-        if n < 4:  # Need at least 4 points for reliable prediction
-            return data[-1]
+        window = self.gm.price_window
+        if len(window) < 4:  # Need at least 4 points for reliable prediction
+            return window[-1]
 
-        # Step 1: Accumulated Generating Operation (AGO)
-        x1 = np.cumsum(data)
-
-        # Step 2: Adjacent Mean Sequence
-        z1 = 0.5 * (x1[:-1] + x1[1:])
-
-        # Step 3: Build matrices for least squares estimation
-        B = np.column_stack((-z1, np.ones(n-1)))
-        Y = data[1:]
-
-        # Step 4: Parameter estimation
-        try:
-            theta = np.linalg.inv(B.T @ B) @ B.T @ Y
-            a, b = theta
-        except np.linalg.LinAlgError:
+        if not self.gm.solve():
             self.logger.error("Matrix inversion failed in GM(1,1)")
-            return data[-1]
-
-        # Step 5: Predict next value
-        def f(k):
-            return (data[0] - b/a) * np.exp(-a * k) + b/a
+            return window[-1]
 
-        # Predict x1(n+1)
-        x1_pred = f(n)
+        return self.gm.predict_ago()
 
-        # Step 6: Inverse AGO to get final prediction
-        x0_pred = x1_pred - x1[-1]
-
-        return x0_pred
-
-    def calculate_ma_signals(self, prices: list) -> tuple:
+    def calculate_ma_signals(self) -> tuple:
         """
         Calculate short-term and long-term moving averages and generate signals.
         
@@ -91,12 +81,12 @@ class GMStrategy(BasicStrategy):
             -1: bearish (short MA crosses below long MA)
             0: no signal
         """
-        if len(prices) < self.long_ma_period:
+        if not self.long_ma.ready:
             return None, None, 0
 
-        # Calculate current MAs
-        short_ma = np.mean(prices[-self.short_ma_period:])
-        long_ma = np.mean(prices[-self.long_ma_period:])
+        # Current MAs
+        short_ma = self.short_ma.value
+        long_ma = self.long_ma.value
 
         # Generate MA signal
         ma_signal = 0
@@ -118,14 +108,12 @@ class GMStrategy(BasicStrategy):
         """
         Calculate risk based on historical price volatility.
         """
-        if len(self.price_history) < 2:
+        if not self.volatility.ready:
             return 0.0
-            
-        returns = np.diff(self.price_history) / self.price_history[:-1]
-        return np.std(returns)
+        return self.volatility.value
 
     def calculate_objective(self, action: str, amount: float, current_price: float, 
-                          predicted_price: float) -> float:
+                          predicted_price: float, risk: float = None) -> float:
         """
         Calculate objective function value for a given action and amount.
         """
@@ -135,8 +123,10 @@ class GMStrategy(BasicStrategy):
         else:  # sell
             expected_return = (current_price - predicted_price) / current_price * amount
 
-        # Calculate risk
-        risk = self.calculate_risk() * amount
+        # Calculate risk, pass risk to reuse one calculate_risk() for every amount
+        if risk is None:
+            risk = self.calculate_risk()
+        risk = risk * amount
 
         # Calculate objective function value
         objective_value = self.mu * expected_return - (1 - self.mu) * risk
@@ -150,12 +140,13 @@ class GMStrategy(BasicStrategy):
         """
         best_option = None
         max_objective = float('-inf')
+        risk = self.calculate_risk() # once for every amount
 
         for amount in self.trading_options:
             # Check if we have enough balance to buy this amount
             if available_balance >= amount * current_price:
                 objective_value = self.calculate_objective(
-                    'buy', amount, current_price, predicted_price
+                    'buy', amount, current_price, predicted_price, risk
                 )
                 if objective_value > max_objective:
                     max_objective = objective_value
@@ -174,12 +165,13 @@ class GMStrategy(BasicStrategy):
         """
         best_option = None
         max_objective = float('-inf')
+        risk = self.calculate_risk() # once for every amount
 
         for amount in self.trading_options:
             # Check if we have enough holdings to sell this amount
             if available_holdings >= amount: # 可能不用check
                 objective_value = self.calculate_objective(
-                    'sell', amount, current_price, predicted_price
+                    'sell', amount, current_price, predicted_price, risk
                 )
                 if objective_value > max_objective:
                     max_objective = objective_value
@@ -201,7 +193,7 @@ class GMStrategy(BasicStrategy):
                 current_price,
                 trade_option['amount'],
                 timestamp,
-                lambda: self.logger.info(f"Buy order completed: {trade_option}")
+                partial(self.logger.info, f"Buy order completed: {trade_option}")
             )
             self.logger.info(f"Placed buy order: {trade_option}")
             
@@ -211,7 +203,7 @@ class GMStrategy(BasicStrategy):
                 current_price,
                 trade_option['amount'],
                 timestamp,
-                lambda: self.logger.info(f"Sell order completed: {trade_option}")
+                partial(self.logger.info, f"Sell order completed: {trade_option}")
             )
             self.logger.info(f"Placed sell order: {trade_option}")
 
@@ -221,8 +213,10 @@ class GMStrategy(BasicStrategy):
         """
         # Update price history
         self.price_history.append(cur_price)
-        if len(self.price_history) > max(self.history_length, self.long_ma_period):
-            self.price_history.pop(0)
+        self.gm.append(cur_price)
+        self.short_ma.update(cur_price)
+        self.long_ma.update(cur_price)
+        self.volatility.update(cur_price)
 
         # Wait for enough price history
         if len(self.price_history) < max(self.history_length, self.long_ma_period):
@@ -234,7 +228,7 @@ class GMStrategy(BasicStrategy):
             return
 
         # 1. First determine market direction using MA crossover
-        _, _, ma_signal = self.calculate_ma_signals(self.price_history)
+        _, _, ma_signal = self.calculate_ma_signals()
         
         # If no clear signal, hold position
         if ma_signal == 0:
@@ -242,7 +236,7 @@ class GMStrategy(BasicStrategy):
             return
 
         # 2. Get predicted price using GM(1,1)
-        predicted_price = self.predict_gm11(self.price_history[-self.history_length:])
+        predicted_price = self.predict_gm11()
 
         # 3. Find best trading amount based on MA signal direction
         if ma_signal == 1:  # Bullish signal - optimize buying
@@ -272,7 +266,7 @@ def main():
     engine.exchange.add_account('test', 1000000)  # Initial balance of 1,000,000
 
     # Load historical data
-    engine.load_data('../data/BTCUSDT2024-11-27.csv', 'BTCUSDT', opts={'head_num': 200000})
+    engine.load_data('../data/BTCUSDT2024-11-27.csv.gz', 'BTCUSDT', opts={'head_num': 200000})
 
     # Define possible trading options (amounts)
     trading_options = [0.1, 0.2, 0.3, 0.4, 0.5]  # Example trading amounts
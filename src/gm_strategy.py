@@ -1,4 +1,6 @@
-import numpy as np
+from collections import deque
+from indicators import ReturnStd
+from metabolic_gm11 import MetabolicGM11
 
 class GMPositionSizer:
     def __init__(self, symbol: str, history_length: int, mu: float, trading_options: list, min_balance: float):
@@ -7,65 +9,46 @@ class GMPositionSizer:
         
         Parameters:
         - symbol: Trading symbol
-        - history_length: Length of price history for GM(1,1)
+        - history_length: Length of price history for GM(1,1), at least 2 (the risk is the std of its returns)
         - mu: Weight coefficient for objective function (0 < mu < 1)
         - trading_options: List of possible trading amounts
         - min_balance: Minimum balance required
         """
+        if history_length < 2:
+            raise ValueError(f'history_length must be >= 2, got {history_length}')
         self.symbol = symbol
         self.history_length = history_length
         self.mu = mu
         self.trading_options = trading_options
         self.min_balance = min_balance
-        self.price_history = []
+        self.price_history = deque(maxlen=history_length)
+        # GM(1,1) on the price history, running sums updated in O(1) per price (same model as GMStrategy)
+        self.gm = MetabolicGM11(history_length)
+        self.volatility = ReturnStd(history_length - 1) # returns of the whole price history
 
-    def predict_gm11(self, data: list) -> float:
+    def predict_gm11(self) -> float:
         """
-        Predict the next price using GM(1,1) model.
+        Predict the next price using GM(1,1) model on the price history.
+        a, b are solved in closed form from the running sums of self.gm, the history is not
+        accumulated and B.T @ B is not inverted again on every call.
         """
-        n = len(data)
-        if n < 4:  # Need at least 4 points for reliable prediction
-            return data[-1]
+        window = self.gm.price_window
+        if len(window) < 4:  # Need at least 4 points for reliable prediction
+            return window[-1]
 
-        # Step 1: Accumulated Generating Operation (AGO)
-        x1 = np.cumsum(data)
+        if not self.gm.solve(): # singular normal equations (e.g. a constant price)
+            return window[-1]
 
-        # Step 2: Adjacent Mean Sequence
-        z1 = 0.5 * (x1[:-1] + x1[1:])
-
-        # Step 3: Build matrices for least squares estimation
-        B = np.column_stack((-z1, np.ones(n-1)))
-        Y = data[1:]
-
-        # Step 4: Parameter estimation
-        try:
-            theta = np.linalg.inv(B.T @ B) @ B.T @ Y
-            a, b = theta
-        except np.linalg.LinAlgError:
-            self.logger.error("Matrix inversion failed in GM(1,1)")
-            return data[-1]
-
-        # Step 5: Predict next value
-        def f(k):
-            return (data[0] - b/a) * np.exp(-a * k) + b/a
-
-        # Predict x1(n+1)
-        x1_pred = f(n)
-
-        # Step 6: Inverse AGO to get final prediction
-        x0_pred = x1_pred - x1[-1]
-
-        return x0_pred        
+        return self.gm.predict_ago()
 
     def calculate_risk(self) -> float:
         """Calculate risk based on historical price volatility."""
-        if len(self.price_history) < 2:
+        if not self.volatility.ready:
             return 0.0
-        returns = np.diff(self.price_history) / self.price_history[:-1]
-        return np.std(returns)
+        return self.volatility.value
 
     def calculate_objective(self, action: str, amount: float, current_price: float, 
-                          predicted_price: float) -> float:
+                          predicted_price: float, risk: float = None) -> float:
         """Calculate objective function value for a given action and amount."""
         # Expected return calculation
         if action == 'buy':
@@ -73,8 +56,10 @@ class GMPositionSizer:
         else:  # sell
             expected_return = (current_price - predicted_price) / current_price * amount
 
-        # Risk calculation
-        risk = self.calculate_risk() * amount
+        # Risk calculation, pass risk to reuse one calculate_risk() for every amount
+        if risk is None:
+            risk = self.calculate_risk()
+        risk = risk * amount
         
         # Objective function
         return self.mu * expected_return - (1 - self.mu) * risk
@@ -90,36 +75,36 @@ class GMPositionSizer:
         - available_balance: Available balance for buying
         - available_holdings: Available holdings for selling
         """
-        if len(self.price_history) < self.history_length:
-            return None
-
         # Update price history
         self.price_history.append(current_price)
-        if len(self.price_history) > self.history_length:
-            self.price_history.pop(0)
+        self.gm.append(current_price)
+        self.volatility.update(current_price)
+        if len(self.price_history) < self.history_length:
+            return None
 
         # Get price prediction
-        predicted_price = self.predict_gm11(self.price_history)
+        predicted_price = self.predict_gm11()
+        risk = self.calculate_risk() # once for every amount
 
         # Find optimal position size based on signal
         if signal == "buy":
-            best_option = self._find_best_buy_option(current_price, predicted_price, available_balance)
+            best_option = self._find_best_buy_option(current_price, predicted_price, available_balance, risk)
         elif signal == "sell":
-            best_option = self._find_best_sell_option(current_price, predicted_price, available_holdings)
+            best_option = self._find_best_sell_option(current_price, predicted_price, available_holdings, risk)
         else:
             return None
 
         return best_option
 
     def _find_best_buy_option(self, current_price: float, predicted_price: float, 
-                           available_balance: float) -> dict:
+                           available_balance: float, risk: float = None) -> dict:
         """Find the optimal buying amount."""
         best_option = None
         max_objective = float('-inf')
 
         for amount in self.trading_options:
             if available_balance >= amount * current_price:
-                objective_value = self.calculate_objective('buy', amount, current_price, predicted_price)
+                objective_value = self.calculate_objective('buy', amount, current_price, predicted_price, risk)
                 if objective_value > max_objective:
                     max_objective = objective_value
                     best_option = {
@@ -131,14 +116,14 @@ class GMPositionSizer:
         return best_option
 
     def _find_best_sell_option(self, current_price: float, predicted_price: float, 
-                            available_holdings: float) -> dict:
+                            available_holdings: float, risk: float = None) -> dict:
         """Find the optimal selling amount."""
         best_option = None
         max_objective = float('-inf')
 
         for amount in self.trading_options:
             if available_holdings >= amount:
-                objective_value = self.calculate_objective('sell', amount, current_price, predicted_price)
+                objective_value = self.calculate_objective('sell', amount, current_price, predicted_price, risk)
                 if objective_value > max_objective:
                     max_objective = objective_value
                     best_option = {
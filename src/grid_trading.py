@@ -1,13 +1,27 @@
 from item import TickData
 from basic_strategy import BasicStrategy
 import sys, os, logging
+import numpy as np
+from functools import partial
+from subscription import PriceCross, Fills
 from engine import Engine
 from simulator import Exchange
 
+# cell states, a cell cycles idle -> pending (entry order resting) -> cover (exit order resting) -> idle
+IDLE, PENDING, COVER = 0, 1, 2
+LONG, SHORT = 1, -1
+
 class GridTrading(BasicStrategy):
-    def __init__(self, symbol: str, low_price: float, high_price: float, step_price: float, profit: float, amount: float, min_balance: float):
+    def __init__(self, symbol: str, low_price: float, high_price: float, step_price: float, profit: float, amount: float, min_balance: float,
+                 event_driven: bool = True, mode: str = 'long'):
+        """
+        mode : 'long' buys at the lower line of a cell and sells profit higher,
+               'short' shorts at the upper line of a cell and covers profit lower,
+               'neutral' opens long cells when the price falls through them and short cells when it rises through them
+        """
         super().__init__()
-        self.grids = []
+        self.event_driven = event_driven # False: woken by the engine every >= 10 time units
+        self.mode = mode
         self.low_price = low_price
         grid_num = int((high_price - low_price) / step_price) + 1
         self.high_price = grid_num * step_price + low_price
@@ -16,46 +30,80 @@ class GridTrading(BasicStrategy):
         self.amount = amount
         self.symbol = symbol
         self.min_balance = min_balance
-        for idx in range(grid_num - 1):
-            self.grids.append({
-                'buy_price': round(low_price + step_price * idx, 1),
-                'amount': amount,
-                'state': 'idle', # idle -> pending -> cover -> idle
-                'sell_price': round(low_price + step_price * idx + profit, 1),
-                'orderId': -1
-            })
+        self.data_depth = 0 # only the mid price is used, snapshots are never materialised
+        # one entry per cell, cell idx covers [low_price + step_price * idx, low_price + step_price * (idx + 1))
+        lines = [round(low_price + step_price * idx, 1) for idx in range(grid_num)]
+        self.buy_price = np.array(lines[:-1])                                   # long entry
+        self.sell_price = np.array([round(p + profit, 1) for p in lines[:-1]])  # long exit
+        self.short_price = np.array(lines[1:])                                  # short entry
+        self.cover_price = np.array([round(p - profit, 1) for p in lines[1:]])  # short exit
+        self.state = np.full(grid_num - 1, IDLE, dtype=np.int8)
+        self.side = np.full(grid_num - 1, SHORT if mode == 'short' else LONG, dtype=np.int8)
+        self.order_id = np.full(grid_num - 1, -1, dtype=np.int64) # resting entry / exit order of the cell
+        self.prev_idx = None # cell of the previous in-range price
+
+    def subscriptions(self):
+        if not self.event_driven:
+            return []
+        # a new cell can only be entered when the mid price crosses a grid line,
+        # and a cell only becomes idle again when its exit order is filled
+        lines = [self.low_price + self.step_price * idx for idx in range(len(self.state) + 1)]
+        return [PriceCross(self.symbol, lines), Fills()]
 
     def on_tick(self, snapshot, cur_price,timestamp):
         """
         Place order based on the current market condition (orderbook and price)
+        Every idle cell between the previous cell and the current one is activated in one pass,
+        so a price jump over several grid lines between two wake-ups does not skip cells.
         """
-        tick = snapshot[self.symbol]
-
         if cur_price < self.low_price or cur_price > self.high_price:
             return
         
         idx = int((cur_price - self.low_price) / self.step_price)
-        if idx < 0 or idx >= len(self.grids):
+        if idx < 0 or idx >= len(self.state):
             return
-        
-        cell = self.grids[idx]
-        if cell['state'] != 'idle':
+        prev = idx if self.prev_idx is None else self.prev_idx
+        self.prev_idx = idx
+
+        lo, hi = min(prev, idx), max(prev, idx)
+        cells = lo + np.flatnonzero(self.state[lo:hi + 1] == IDLE)
+        if len(cells) == 0:
             return
-        
+        if self.mode == 'neutral' and idx != prev:
+            self.side[cells] = LONG if idx < prev else SHORT
+
         account = self.get_account()
-        if account.balance < self.min_balance:
-            print('no enough balance, stop sending order.')
-            return
+        # the cells closest to the current price first
+        for cell in (cells[::-1] if idx < prev else cells).tolist():
+            if account.balance < self.min_balance:
+                print('no enough balance, stop sending order.')
+                return
+            self.activate(cell, timestamp)
 
-        def on_cover_order_finish():
-            cell['state'] = 'idle'
+    def activate(self, cell: int, timestamp: int):
+        self.state[cell] = PENDING # set first, the entry order can be filled immediately
+        callback = partial(self.on_entry_filled, cell, timestamp)
+        if self.side[cell] == LONG:
+            order = self.buy(self.symbol, float(self.buy_price[cell]), self.amount, timestamp, callback)
+        else:
+            order = self.short(self.symbol, float(self.short_price[cell]), self.amount, timestamp, callback)
+        if self.state[cell] == PENDING and order is not None:
+            self.order_id[cell] = order.order_id
 
-        def on_buy_order_finish():
-            cell['state'] = 'cover'
-            self.sell(self.symbol, cell['sell_price'], self.amount, timestamp, on_cover_order_finish)
+    # order callbacks are bound methods wrapped in partial so the strategy can be pickled in a checkpoint
+    def on_entry_filled(self, cell: int, timestamp: int):
+        self.state[cell] = COVER
+        callback = partial(self.on_exit_filled, cell)
+        if self.side[cell] == LONG:
+            order = self.sell(self.symbol, float(self.sell_price[cell]), self.amount, timestamp, callback)
+        else:
+            order = self.cover(self.symbol, float(self.cover_price[cell]), self.amount, timestamp, callback)
+        if self.state[cell] == COVER and order is not None:
+            self.order_id[cell] = order.order_id
 
-        cell['state'] = 'pending'
-        self.buy(self.symbol, cell['buy_price'], self.amount, timestamp, on_buy_order_finish)
+    def on_exit_filled(self, cell: int):
+        self.state[cell] = IDLE
+        self.order_id[cell] = -1
 
 if __name__ == '__main__':
 
@@ -63,7 +111,7 @@ if __name__ == '__main__':
     engine.init_exchange()
     engine.exchange.add_account('test', 1000000)
 
-    engine.load_data('../data/BTCUSDT2024-11-27.csv', 'BTCUSDT', opts = {'head_num': 200000})
+    engine.load_data('../data/BTCUSDT2024-11-27.csv.gz', 'BTCUSDT', opts = {'head_num': 200000})
     st = GridTrading('BTCUSDT', 91000, 93000, 10, 10, 0.1, 200)
     st.set_engine(engine)
     engine.set_strategy(st)
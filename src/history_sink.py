@@ -0,0 +1,165 @@
+import csv, os, queue, struct, threading
+import numpy as np
+from typing import Dict
+from simulator import LEDGER_COLUMNS, LEDGER_DTYPES
+# pyarrow is optional, only ParquetSink needs it
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+'''
+Streaming account history. Exchange hands the rows of its ledgers to a sink in chunks of
+chunk_rows during the run (see Exchange.set_history_sink), so the history in memory stays bounded.
+Chunks are written on a background thread, write() only queues a chunk.
+Back-pressure : at most max_pending chunks wait for the writer, when the queue is full write() blocks
+until the writer catches up (waits counts how often), so a slow disk slows the run down instead of
+letting the queued history grow to max_pending * chunk_rows rows and beyond. max_pending = None
+never blocks and keeps any number of chunks in memory.
+A chunk is a dict column name -> array with the columns of LEDGER_COLUMNS.
+'''
+
+class HistorySink:
+    def __init__(self, filename: str, chunk_rows: int = 100000, background: bool = True, max_pending: int = 8):
+        if max_pending is not None and max_pending < 1:
+            raise ValueError(f'max_pending must be >= 1 or None (unbounded), got {max_pending}')
+        self.filename = filename
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.waits = 0 # write() calls that found max_pending chunks queued and blocked
+        self.error = None
+        self.queue = None
+        self.thread = None
+        if background:
+            self.queue = queue.Queue(max_pending or 0) # 0 : unbounded
+            self.thread = threading.Thread(target=self._run, name=f'history-{os.path.basename(filename)}', daemon=True)
+            self.thread.start()
+
+    def write(self, chunk: Dict[str, np.ndarray]):
+        if len(chunk['timestamp']) == 0:
+            return
+        self.rows += len(chunk['timestamp'])
+        if self.queue is None:
+            self._write(chunk)
+            return
+        try:
+            self.queue.put_nowait(chunk)
+        except queue.Full: # back-pressure, wait for the writer thread
+            self.waits += 1
+            self.queue.put(chunk)
+
+    def close(self):
+        '''
+        write every queued chunk and close the file, errors of the writer thread are raised here
+        '''
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        else:
+            self._close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self._write(chunk)
+                except Exception as e: # keep draining, the run must not block on a full queue
+                    self.error = e
+        try:
+            self._close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def _write(self, chunk: Dict[str, np.ndarray]):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+class CSVSink(HistorySink):
+    '''
+    same format as Exchange.save_trade_history
+    '''
+    def __init__(self, filename: str, **kwargs):
+        self.file = open(filename, 'w')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(LEDGER_COLUMNS)
+        super().__init__(filename, **kwargs)
+
+    def _write(self, chunk):
+        self.writer.writerows(zip(*(chunk[name].tolist() for name in LEDGER_COLUMNS)))
+
+    def _close(self):
+        self.file.close()
+
+NPY_SYMBOL = 'U32'
+NPY_DTYPE = np.dtype([(name, NPY_SYMBOL if name == 'symbol' else dtype)
+                      for name, dtype in zip(LEDGER_COLUMNS, LEDGER_DTYPES)])
+
+class NpySink(HistorySink):
+    '''
+    one structured array (NPY_DTYPE) appended chunk by chunk, np.load(filename) reads it back.
+    The header is written with room for any row count and rewritten with the real shape on close
+    '''
+    def __init__(self, filename: str, **kwargs):
+        self.file = open(filename, 'wb')
+        # magic + version + header length + header + '\n', 64 bytes aligned, large enough for any row count
+        self.header_size = -(-(11 + len(self._descr(2 ** 63 - 1))) // 64) * 64
+        self.file.write(self._header(0))
+        self.written = 0
+        super().__init__(filename, **kwargs)
+
+    @staticmethod
+    def _descr(rows: int) -> str:
+        return repr({'descr': np.lib.format.dtype_to_descr(NPY_DTYPE), 'fortran_order': False, 'shape': (rows,)})
+
+    def _header(self, rows: int) -> bytes:
+        header = self._descr(rows).ljust(self.header_size - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', self.header_size - 10) + header.encode('latin1')
+
+    def _write(self, chunk):
+        rows = np.empty(len(chunk['timestamp']), dtype=NPY_DTYPE)
+        for name in LEDGER_COLUMNS:
+            rows[name] = chunk[name]
+        self.file.write(rows.tobytes())
+        self.written += len(rows)
+
+    def _close(self):
+        self.file.seek(0)
+        self.file.write(self._header(self.written))
+        self.file.close()
+
+class ParquetSink(HistorySink):
+    '''
+    one row group per chunk, needs pyarrow
+    '''
+    def __init__(self, filename: str, **kwargs):
+        if pyarrow is None:
+            raise ImportError('ParquetSink needs pyarrow, pip install pyarrow')
+        self.schema = pyarrow.schema([(name, pyarrow.string() if name == 'symbol' else pyarrow.from_numpy_dtype(dtype))
+                                      for name, dtype in zip(LEDGER_COLUMNS, LEDGER_DTYPES)])
+        self.parquet = pyarrow.parquet.ParquetWriter(filename, self.schema)
+        super().__init__(filename, **kwargs)
+
+    def _write(self, chunk):
+        self.parquet.write_table(pyarrow.table({name: chunk[name] for name in LEDGER_COLUMNS}, schema=self.schema))
+
+    def _close(self):
+        self.parquet.close()
+
+SINKS = {'.csv': CSVSink, '.npy': NpySink, '.parquet': ParquetSink}
+
+def open_sink(filename: str, **kwargs) -> HistorySink:
+    '''
+    sink for the extension of filename : .csv, .npy or .parquet
+    '''
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in SINKS:
+        raise ValueError(f'unknown history file type {ext}, expected one of {list(SINKS)}')
+    return SINKS[ext](filename, **kwargs)
@@ -0,0 +1,163 @@
+import math
+from collections import deque
+'''
+Rolling indicators with O(1) updates. Every indicator keeps a ring buffer (deque with maxlen)
+of the values in its window and running sums, update() adds one value and returns the new value
+of the indicator, value is None until the window is full.
+Running sums are recomputed from the buffer every resync updates to bound floating point drift.
+'''
+
+class SMA:
+    '''
+    simple moving average of the last period values
+    '''
+    def __init__(self, period: int, resync: int = 1000):
+        self.period = period
+        self.resync = resync
+        self.buffer = deque(maxlen=period)
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, x: float):
+        if len(self.buffer) == self.period:
+            self.total -= self.buffer[0]
+        self.buffer.append(x)
+        self.total += x
+        self.updates += 1
+        if self.updates >= self.resync:
+            self.total = math.fsum(self.buffer)
+            self.updates = 0
+        return self.value
+
+    @property
+    def ready(self) -> bool:
+        return len(self.buffer) == self.period
+
+    @property
+    def value(self):
+        return self.total / self.period if self.ready else None
+
+class EMA:
+    '''
+    exponential moving average, alpha = 2 / (period + 1), seeded with the first value
+    '''
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2 / (period + 1)
+        self.value = None
+
+    def update(self, x: float):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    @property
+    def ready(self) -> bool:
+        return self.value is not None
+
+class RollingStd:
+    '''
+    population standard deviation (np.std, ddof = 0) of the last period values,
+    sliding Welford update of the mean and the sum of squared deviations
+    '''
+    def __init__(self, period: int, resync: int = 1000):
+        self.period = period
+        self.resync = resync
+        self.buffer = deque(maxlen=period)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.nonfinite = 0 # nan / inf values in the buffer
+        self.updates = 0
+
+    def update(self, x: float):
+        n = len(self.buffer)
+        old = self.buffer[0] if n == self.period else 0.0
+        self.buffer.append(x)
+        dirty = self.nonfinite > 0
+        self.nonfinite += (not math.isfinite(x)) - (not math.isfinite(old))
+        if self.nonfinite: # nan while a nan / inf is in the window, like np.std
+            return self.value
+        if dirty: # the last nan / inf has left the window
+            self._resync()
+        elif n == self.period:
+            mean = self.mean + (x - old) / n
+            self.m2 += (x - old) * (x - mean + old - self.mean)
+            self.mean = mean
+        else:
+            delta = x - self.mean
+            self.mean += delta / (n + 1)
+            self.m2 += delta * (x - self.mean)
+        self.updates += 1
+        if self.updates >= self.resync:
+            self._resync()
+        return self.value
+
+    def _resync(self):
+        n = len(self.buffer)
+        self.mean = math.fsum(self.buffer) / n
+        self.m2 = math.fsum((x - self.mean) ** 2 for x in self.buffer)
+        self.updates = 0
+
+    @property
+    def ready(self) -> bool:
+        return len(self.buffer) == self.period
+
+    @property
+    def value(self):
+        if not self.ready:
+            return None
+        if self.nonfinite:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / self.period)
+
+class ReturnStd(RollingStd):
+    '''
+    rolling std of simple returns (p[i] - p[i-1]) / p[i-1] over the last period returns,
+    update() takes prices. Same as np.std(np.diff(p) / p[:-1]) over the last period + 1 prices
+    '''
+    def __init__(self, period: int, resync: int = 1000):
+        super().__init__(period, resync)
+        self.prev_price = None
+
+    def update(self, price: float):
+        prev, self.prev_price = self.prev_price, price
+        if prev is None:
+            return None
+        return super().update((price - prev) / prev if prev != 0 else math.nan)
+
+class VWAP:
+    '''
+    volume weighted average price of the last period (price, volume) pairs
+    '''
+    def __init__(self, period: int, resync: int = 1000):
+        self.period = period
+        self.resync = resync
+        self.buffer = deque(maxlen=period)
+        self.pv = 0.0
+        self.volume = 0.0
+        self.updates = 0
+
+    def update(self, price: float, volume: float):
+        if len(self.buffer) == self.period:
+            p, v = self.buffer[0]
+            self.pv -= p * v
+            self.volume -= v
+        self.buffer.append((price, volume))
+        self.pv += price * volume
+        self.volume += volume
+        self.updates += 1
+        if self.updates >= self.resync:
+            self.pv = math.fsum(p * v for p, v in self.buffer)
+            self.volume = math.fsum(v for _, v in self.buffer)
+            self.updates = 0
+        return self.value
+
+    @property
+    def ready(self) -> bool:
+        return len(self.buffer) == self.period
+
+    @property
+    def value(self):
+        return self.pv / self.volume if self.ready and self.volume > 0 else None
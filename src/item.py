@@ -1,6 +1,6 @@
 import numpy as np
 import datetime as dt
-from typing import List, Dict, Callable, Any
+from typing import List, Dict, Callable, Any, NamedTuple
 from constant import OrderType, Direction, Offset, Status
 import logging
 
@@ -18,20 +18,25 @@ class Account:
         for s in symbols:
             self.position[s] = {'long': 0, 'short': 0}
 
+BID_PRICE, ASK_PRICE, BID_VOLUME, ASK_VOLUME = range(4)
+
 class TickData:
+    """
+    bid/ask price and volume share one preallocated (4, capacity) float64 buffer,
+    bid_price, ask_price, bid_volume, ask_volume are views of its first data_depth columns.
+    """
+    __slots__ = ('symbol', 'timestamp', 'data_depth', 'buffer')
     symbol: str
     timestamp: int
 
     data_depth: int
-    bid_price: List[float] # large -> small
-    ask_price: List[float] # small -> large
-    bid_volume: List[float]
-    ask_volume: List[float]
-
+    buffer: np.ndarray
+    # bid_price : large -> small
+    # ask_price : small -> large
 
-    def __init__(self, d = {}):
-        if d == {}:
-            pass
+    def __init__(self, d = {}, capacity: int = 0):
+        self.data_depth = 0
+        self.buffer = np.zeros((4, capacity))
         if 'data_depth' in d:
             self.set_data_depth(d['data_depth'])
         keys = ['symbol', 'timestamp', 'bid_price', 'ask_price', 'bid_volume', 'ask_volume']
@@ -40,11 +45,29 @@ class TickData:
                 setattr(self, k, d[k])
 
     def set_data_depth(self, data_depth):
+        # reuse the buffer whenever it is large enough, only the visible part is reset
+        if data_depth > self.buffer.shape[1]:
+            self.buffer = np.zeros((4, data_depth))
+        else:
+            self.buffer[:, :max(data_depth, self.data_depth)] = 0
         self.data_depth = data_depth
-        self.bid_price = [0 for i in range(data_depth)]
-        self.ask_price = [0 for i in range(data_depth)]
-        self.bid_volume = [0 for i in range(data_depth)]
-        self.ask_volume = [0 for i in range(data_depth)]
+
+    def _row(self, row: int) -> np.ndarray:
+        return self.buffer[row, :self.data_depth]
+
+    def _set_row(self, row: int, values):
+        if len(values) > self.data_depth:
+            if len(values) > self.buffer.shape[1]:
+                buffer = np.zeros((4, len(values)))
+                buffer[:, :self.data_depth] = self.buffer[:, :self.data_depth]
+                self.buffer = buffer
+            self.data_depth = len(values)
+        self.buffer[row, :len(values)] = values
+
+    bid_price = property(lambda self: self._row(BID_PRICE), lambda self, v: self._set_row(BID_PRICE, v))
+    ask_price = property(lambda self: self._row(ASK_PRICE), lambda self, v: self._set_row(ASK_PRICE, v))
+    bid_volume = property(lambda self: self._row(BID_VOLUME), lambda self, v: self._set_row(BID_VOLUME, v))
+    ask_volume = property(lambda self: self._row(ASK_VOLUME), lambda self, v: self._set_row(ASK_VOLUME, v))
 
     def show(self):
         print(f'symbol: {self.symbol}')
@@ -54,12 +77,40 @@ class TickData:
         for i in range(self.data_depth):
             print(f'bid_price: {self.bid_price[i]}, bid_volume: {self.bid_volume[i]}')
         print('')
+
+class TickRing:
+    """
+    A fixed ring of preallocated TickData, next() hands out the oldest one again,
+    so producing a snapshot does not allocate. A tick stays valid until the ring wraps around.
+    """
+    ticks: List[TickData]
+
+    def __init__(self, symbol: str, capacity: int, size: int = 16):
+        self.ticks = [TickData({'symbol': symbol}, capacity) for _ in range(size)]
+        self.idx = 0
+
+    def next(self) -> TickData:
+        tick = self.ticks[self.idx]
+        self.idx = (self.idx + 1) % len(self.ticks)
+        return tick
+
 # exchange snapshot is a dict from symbols to tick data
 Snapshot = Dict[str, TickData]
 
+class HistoryTrade(NamedTuple):
+    """
+    One row of the historical trade tape, timestamp already rescaled to milliseconds.
+    """
+    timestamp: int
+    symbol: str
+    side: str
+    size: float
+    price: float
+
 class OrderData:
+    __slots__ = ('symbol', 'is_history', 'order_id', 'order_type', 'direction', 'offset', 'price',
+                 'volume', 'traded', 'status', 'callback', 'timestamp')
     order_count: int = 0
-    order_dict: Dict[int, 'OrderData'] = {}
     estimated_latency: int = 5
     symbol: str
     is_history: bool
@@ -71,35 +122,41 @@ class OrderData:
     volume: float
     traded: float
     status: Status
-    callback: Callable[['OrderData'], None]
+    callback: Callable[[], None]
     timestamp: int
 
     def __init__(self, d: Dict[str, Any]):
+        self.is_history = False
+        self.traded = 0
+        self.status = Status.SUBMITTING
+        self.callback = None
         keys = ['symbol', 'is_history', 'order_type', 'direction', 'offset', 'price', 'volume', 'traded', 'status', 'callback', 'timestamp']
         for k in keys:
             if k in d:
                 setattr(self, k, d[k])
         OrderData.order_count += 1
         self.order_id = OrderData.order_count
-        OrderData.order_dict[self.order_id] = self
-
-    def remain(self):
-        return self.volume - self.traded
 
     @staticmethod
-    def get_order(order_id: int) -> 'OrderData':
-        return OrderData.order_dict[order_id]
-
-class TradeData():
-    """
-    Trade data contains information of a fill of an order. 
-    One order can have several trade fills.
-    """
-    order_id: int
-    price: float
-    fill_amount: float
+    def history(symbol: str, price: float, volume: float, direction: Direction, timestamp: int) -> 'OrderData':
+        '''
+        historical trade as a LIMIT OPEN order, same as OrderData({... 'is_history': True}) without the dict
+        '''
+        order = OrderData.__new__(OrderData)
+        order.symbol = symbol
+        order.is_history = True
+        order.order_type = OrderType.LIMIT
+        order.direction = direction
+        order.offset = Offset.OPEN
+        order.price = price
+        order.volume = volume
+        order.traded = 0
+        order.status = Status.SUBMITTING
+        order.callback = None
+        order.timestamp = timestamp
+        OrderData.order_count += 1
+        order.order_id = OrderData.order_count
+        return order
 
-    def __init__(self, order_id, price, fill_amount):
-        self.order_id = order_id
-        self.price = price
-        self.fill_amount = fill_amount
+    def remain(self):
+        return self.volume - self.traded
@@ -1,79 +1,185 @@
+import collections
+import math
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def gm11_params(windows: np.ndarray):
+    """
+    Closed-form least squares of GM(1,1) for every row of windows (shape (..., n)), vectorized.
+    With background values z[i] = (x1[i] + x1[i+1]) / 2 of the AGO x1 and Y = x0[1:],
+    B = [-z, 1] gives the 2x2 normal equations
+        [ Σz²  -Σz ] [a]   [-ΣzY]
+        [ -Σz   m  ] [b] = [ ΣY ]
+    so det = mΣz² - (Σz)², a = (ΣzΣY - mΣzY) / det, b = (Σz²ΣY - ΣzΣzY) / det.
+    Returns (a, b), nan where det == 0
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    x1 = np.cumsum(windows, axis=-1)
+    z = 0.5 * (x1[..., :-1] + x1[..., 1:])
+    y = windows[..., 1:]
+    m = z.shape[-1]
+    sz, szz, sy, szy = z.sum(-1), (z * z).sum(-1), y.sum(-1), (z * y).sum(-1)
+    det = m * szz - sz * sz
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = np.where(det != 0, (sz * sy - m * szy) / det, np.nan)
+        b = np.where(det != 0, (szz * sy - sz * szy) / det, np.nan)
+    return a, b
 
 class MetabolicGM11:
-    def __init__(self, window_size=4):
+    '''
+    Sliding-window GM(1,1). The window keeps running sums of the normal equations (Σz, Σz², ΣzY, ΣY),
+    a new price updates them in O(1) and a, b are solved in closed form (see gm11_params).
+    z and Y are summed relative to offsets (cz, cy) taken at the last resync, which keeps the sums small
+    and avoids cancellation; they are recomputed from the window every resync updates to bound drift.
+    '''
+    def __init__(self, window_size=4, resync=1000):
         self.window_size = window_size
-        self.price_window = []
+        self.resync = resync
+        self.price_window = collections.deque(maxlen=window_size)
         self.a = None  # Development coefficient
         self.b = None  # Grey input
-        
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self.window_sum = 0.0 # Σx0, also the last AGO value
+        self.sz = self.szz = self.szy = self.sy = 0.0 # sums of z - cz and Y - cy
+        self.updates = 0
+
     def fit(self, data):
         """Initial fit of the model with first window of data"""
         if len(data) >= self.window_size:
-            self.price_window = list(data[-self.window_size:])
+            self.price_window.clear()
+            self.price_window.extend(data[-self.window_size:])
+            self._resync()
             self._update_parameters()
-            
-    def _create_accumulated_sequence(self, data):
-        """Create accumulated generating operation (AGO) sequence"""
-        return np.cumsum(data)
-        
-    def _create_background_values(self, ago_sequence):
-        """Create background values (Z) from AGO sequence"""
-        z = np.zeros(len(ago_sequence) - 1)
-        for i in range(len(z)):
-            z[i] = -0.5 * (ago_sequence[i] + ago_sequence[i + 1])
-        return z
-        
+
+    def _resync(self):
+        """Recompute the running sums from the window"""
+        self._reset_sums()
+        window = list(self.price_window)
+        x1 = np.cumsum(window).tolist()
+        z = [0.5 * (x1[i] + x1[i + 1]) for i in range(len(window) - 1)]
+        self.cz = sum(z) / len(z) if z else 0.0
+        self.cy = sum(window) / len(window) if window else 0.0
+        for zi, yi in zip(z, window[1:]):
+            zi, yi = zi - self.cz, yi - self.cy
+            self.sz += zi
+            self.szz += zi * zi
+            self.szy += zi * yi
+            self.sy += yi
+        self.window_sum = x1[-1] if x1 else 0.0
+
+    def append(self, new_price):
+        """Add a price to the window and update the running sums, O(1)"""
+        new_price = float(new_price)
+        window = self.price_window
+        if len(window) == self.window_size:
+            if self.window_size < 2:
+                window.append(new_price)
+                self._resync()
+                return
+            # drop the first pair (z0 = x0[0] + x0[1] / 2, Y0 = x0[1]) ...
+            d, y0 = window[0], window[1]
+            z0 = d + 0.5 * y0 - self.cz
+            y0 -= self.cy
+            self.sz -= z0
+            self.szz -= z0 * z0
+            self.szy -= z0 * y0
+            self.sy -= y0
+            # ... and the AGO of every remaining z loses d
+            k = len(window) - 2
+            self.szz += -2 * d * self.sz + k * d * d
+            self.szy -= d * self.sy
+            self.sz -= k * d
+            self.window_sum -= d
+        window.append(new_price)
+        if len(window) < self.window_size:
+            self._resync() # offsets are only taken from a full window
+            return
+        z = self.window_sum + 0.5 * new_price - self.cz
+        y = new_price - self.cy
+        self.sz += z
+        self.szz += z * z
+        self.szy += z * y
+        self.sy += y
+        self.window_sum += new_price
+        self.updates += 1
+        if self.updates >= self.resync:
+            self._resync()
+
+    def solve(self) -> bool:
+        """
+        Solve a and b from the running sums, returns False and leaves them unchanged
+        when the normal equations are singular (every background value z equal, e.g. less than 3 prices)
+        """
+        m = len(self.price_window) - 1
+        det = m * self.szz - self.sz * self.sz
+        if m < 1 or det == 0:
+            return False
+        self.a = (self.sz * self.sy - m * self.szy) / det
+        # intercept of Y - cy on z - cz, moved back to Y on z
+        self.b = (self.szz * self.sy - self.sz * self.szy) / det + self.a * self.cz + self.cy
+        return True
+
     def _update_parameters(self):
         """Update model parameters a and b"""
-        # Create AGO sequence
-        ago_sequence = self._create_accumulated_sequence(self.price_window)
-        
-        # Create background values
-        z = self._create_background_values(ago_sequence)
-        
-        # Create B matrix and Y vector
-        B = np.vstack([z, np.ones_like(z)]).T
-        Y = np.array(self.price_window[1:])
-        
-        # Calculate parameters using least squares
-        try:
-            params = np.linalg.inv(B.T @ B) @ B.T @ Y
-            self.a, self.b = params[0], params[1]
-        except np.linalg.LinAlgError:
+        if not self.solve():
             print("Matrix inverse failed. Parameters unchanged.")
-            
+            return False
+        return True
+
     def predict_next(self):
         """Predict the next value"""
         if self.a is None or self.b is None:
             return None
-            
+
         k = len(self.price_window) + 1
         x0 = self.price_window[0]
-        
-        # Calculate x1(k+1)
-        x1_next = (x0 - self.b/self.a) * np.exp(-self.a * k) + self.b/self.a
-        
-        # Calculate x1(k)
-        x1_current = (x0 - self.b/self.a) * np.exp(-self.a * (k-1)) + self.b/self.a
-        
-        # Calculate x0(k+1) = x1(k+1) - x1(k)
-        x0_next = x1_next - x1_current
-        
-        return x0_next
-        
+        a, b = self.a, self.b
+        if a == 0: # limit a -> 0 of the expression below
+            return b
+
+        # x0(k+1) = x1(k+1) - x1(k)
+        return (x0 - b/a) * (math.exp(-a * k) - math.exp(-a * (k-1)))
+
+    def predict_ago(self):
+        """
+        Predict the next value as the fitted x1(n+1) minus the observed x1(n) (the window sum),
+        the form used by GMStrategy
+        """
+        if self.a is None or self.b is None:
+            return None
+
+        n = len(self.price_window)
+        x0 = self.price_window[0]
+        a, b = self.a, self.b
+        if a == 0: # limit a -> 0 of f(n) = (x0 - b/a) * exp(-a * n) + b/a
+            return x0 + b * n - self.window_sum
+        # f(n) written with expm1, b/a does not cancel when a is close to 0
+        return x0 * math.exp(-a * n) - b * math.expm1(-a * n) / a - self.window_sum
+
     def update(self, new_price):
         """Update model with new price data"""
         # Add new price and remove oldest if window is full
-        self.price_window.append(new_price)
-        if len(self.price_window) > self.window_size:
-            self.price_window.pop(0)
-            
+        self.append(new_price)
+
         # Update model parameters
         self._update_parameters()
-        
+
         return self.predict_next()
 
+    def predict_batch(self, prices) -> np.ndarray:
+        """
+        predict_next() after every full window of prices, vectorized: element i is the prediction
+        of a model whose window is prices[i:i + window_size]
+        """
+        windows = sliding_window_view(np.asarray(prices, dtype=np.float64), self.window_size)
+        a, b = gm11_params(windows)
+        k = self.window_size + 1
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            pred = (windows[:, 0] - b/a) * (np.exp(-a * k) - np.exp(-a * (k-1)))
+        return np.where(a == 0, b, pred)
+
 # Example usage
 def simulate_market_feed():
     """Simulate real-time market price feed"""
@@ -81,24 +187,27 @@ def simulate_market_feed():
     initial_prices = [100, 105, 102, 108, 112, 115]
     # New incoming prices
     new_prices = [118, 122, 125, 121]
-    
+
     # Initialize model
     model = MetabolicGM11(window_size=4)
     model.fit(initial_prices)
-    
-    print("Initial window:", model.price_window)
+
+    print("Initial window:", list(model.price_window))
     print("Initial prediction:", model.predict_next())
-    
+
     # Simulate receiving new prices
     print("\nProcessing new prices:")
     for price in new_prices:
         prediction = model.update(price)
         print(f"New price: {price}")
-        print(f"Current window: {model.price_window}")
+        print(f"Current window: {list(model.price_window)}")
         print(f"Next prediction: {prediction:.2f}")
         print(f"Parameters - a: {model.a:.4f}, b: {model.b:.4f}")
         print("---")
 
+    # The same predictions for every window at once
+    print("Batch predictions:", model.predict_batch(initial_prices + new_prices)[len(initial_prices) - model.window_size:])
+
 # Run simulation
 if __name__ == "__main__":
-    simulate_market_feed()
\ No newline at end of file
+    simulate_market_feed()
@@ -0,0 +1,142 @@
+import cProfile, pstats, io, time, functools
+from collections import Counter
+from typing import Dict, Optional
+'''
+Opt-in hot path instrumentation of one Engine run : Engine.start(profiler=Profiler()).
+attach() wraps the stage methods on the instances (exchange, futures, strategies) and the data iterators
+with perf_counter_ns timers and call counts, detach() removes the wrappers again. Nothing is patched
+without a profiler, so a normal run pays nothing.
+Stage times are inclusive : exchange.place_order contains future.place_order, update_cur_price and process_trade_data.
+In batch mode history trades skip place_order : engine.replay_block contains exchange.replay_history, which
+contains the future.replay_history runs of the book, on_tick and the place_order calls of algo orders.
+The data stage counts trades, also when the data comes in blocks.
+Every sample_every calls of update_cur_price the book depth (levels per side) and the number of orders
+queued at the best levels are added to power of two histograms.
+'''
+
+STAGES = ['data', 'engine.replay_block', 'exchange.replay_history', 'future.replay_history',
+          'exchange.place_order', 'future.place_order', 'future.snapshot',
+          'update_cur_price', 'process_trade_data', 'on_tick']
+
+class Profiler:
+    def __init__(self, cprofile_file: Optional[str] = None, sample_every: int = 1000):
+        self.cprofile_file = cprofile_file
+        self.sample_every = sample_every
+        self.calls: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.ns: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.book_levels = Counter() # power of two bucket -> samples
+        self.queue_lengths = Counter()
+        self.wall_ns = 0
+        self.patched = [] # (object, attribute name)
+        self.engine = None
+        self.cprofile = None
+
+    def _timed(self, stage: str, func):
+        calls, ns, perf = self.calls, self.ns, time.perf_counter_ns
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t = perf()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                ns[stage] += perf() - t
+                calls[stage] += 1
+        return wrapper
+
+    def _timed_iter(self, stage: str, it, count=None):
+        # count(item) is the number of calls an item stands for, one by default
+        perf = time.perf_counter_ns
+        end = object()
+        while True:
+            t = perf()
+            item = next(it, end)
+            self.ns[stage] += perf() - t
+            if item is end:
+                return
+            self.calls[stage] += 1 if count is None else count(item)
+            yield item
+
+    def _patch(self, obj, name: str, wrapper):
+        # an instance attribute shadows the class method, deleting it restores the method
+        setattr(obj, name, wrapper)
+        self.patched.append((obj, name))
+
+    def _sampled_price(self, func):
+        exchange = self.engine.exchange
+        counter = [0]
+
+        def update_cur_price(symbol):
+            price = func(symbol)
+            counter[0] += 1
+            if counter[0] >= self.sample_every:
+                counter[0] = 0
+                self._sample_book(exchange.futures[symbol])
+            return price
+        return self._timed('update_cur_price', update_cur_price)
+
+    def _sample_book(self, future):
+        for book, key in ((future.buy_book, -1), (future.sell_book, 0)):
+            self.book_levels[bucket(len(book))] += 1
+            if book:
+                level = book.get(book.keys()[key])
+                if level is not None:
+                    self.queue_lengths[bucket(len(level.queue) + len(level.next_orders))] += 1
+
+    def attach(self, engine):
+        self.engine = engine
+        exchange = engine.exchange
+        self._patch(engine, 'replay_block', self._timed('engine.replay_block', engine.replay_block))
+        self._patch(exchange, 'replay_history', self._timed('exchange.replay_history', exchange.replay_history))
+        self._patch(exchange, 'place_order', self._timed('exchange.place_order', exchange.place_order))
+        self._patch(exchange, 'update_cur_price', self._sampled_price(exchange.update_cur_price))
+        self._patch(exchange, 'process_trade_data', self._timed('process_trade_data', exchange.process_trade_data))
+        for future in exchange.futures.values():
+            self._patch(future, 'replay_history', self._timed('future.replay_history', future.replay_history))
+            self._patch(future, 'place_order', self._timed('future.place_order', future.place_order))
+            self._patch(future, 'snapshot', self._timed('future.snapshot', future.snapshot))
+        for strategy in engine.strategies:
+            self._patch(strategy, 'on_tick', self._timed('on_tick', strategy.on_tick))
+        self.iters = (engine.order_iter, engine.block_iter)
+        engine.order_iter = self._timed_iter('data', engine.order_iter)
+        engine.block_iter = self._timed_iter('data', engine.block_iter, len)
+        if self.cprofile_file is not None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.wall_ns = -time.perf_counter_ns()
+
+    def detach(self):
+        self.wall_ns += time.perf_counter_ns()
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_file)
+        for obj, name in reversed(self.patched):
+            delattr(obj, name)
+        self.patched = []
+        self.engine.order_iter, self.engine.block_iter = self.iters
+
+    def report(self, top: int = 15) -> str:
+        out = io.StringIO()
+        wall = max(self.wall_ns, 1)
+        out.write(f'{"stage":<24}{"calls":>12}{"total ms":>12}{"ns/call":>10}{"% wall":>8}\n')
+        for stage in STAGES:
+            calls, ns = self.calls[stage], self.ns[stage]
+            if calls:
+                out.write(f'{stage:<24}{calls:>12}{ns / 1e6:>12.1f}{ns // calls:>10}{100 * ns / wall:>8.1f}\n')
+        out.write(f'{"wall":<24}{"":>12}{wall / 1e6:>12.1f}\n')
+        for name, hist in (('book levels per side', self.book_levels), ('orders at best level', self.queue_lengths)):
+            if hist:
+                out.write(f'{name}: ' + ', '.join(f'{bucket_range(b)}: {hist[b]}' for b in sorted(hist)) + '\n')
+        if self.cprofile is not None:
+            stats = pstats.Stats(self.cprofile_file, stream=out)
+            stats.sort_stats('tottime').print_stats(top)
+        return out.getvalue()
+
+def bucket(n: int) -> int:
+    # 0, 1, 2-3, 4-7, ... -> 0, 1, 2, 3, ...
+    return n.bit_length()
+
+def bucket_range(b: int) -> str:
+    if b <= 1:
+        return str(b)
+    return f'{1 << (b - 1)}-{(1 << b) - 1}'
@@ -0,0 +1,210 @@
+import os, time, logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+from engine import Engine
+from data_loader import DataLoader, TradeTape
+from grid_trading import GridTrading
+from simulator import Exchange, Ledger
+logger = logging.getLogger('sharding')
+'''
+Time-sharded backtest of one trade tape:
+1. seed : an Engine checkpoint at the start of every shard
+   'replay'     : history-only sequential replay (no strategy), the book built from trades is exact
+                  because historical orders never interact with algo orders
+   'checkpoint' : full sequential run with the strategy, shards reproduce it exactly
+   'ob500'      : book seeded from the last ob500 L2 snapshot before the shard, no sequential pass
+2. shards run in parallel, each one with a fresh account (except 'checkpoint') and strategy
+3. results are stitched and every shard boundary is reconciled : position and resting algo orders
+   that were not carried into the next shard, mid price gap between the end of a shard and the
+   start of the next one, and (reference = True) PnL against a sequential run of the same window
+'''
+
+def shard_bounds(timestamps: np.ndarray, n_shards: int) -> List[int]:
+    '''
+    split sorted timestamps into n_shards equal time spans, returns n_shards + 1 trade indices.
+    trades with the same timestamp always fall in the same shard
+    '''
+    if len(timestamps) == 0:
+        return [0, 0]
+    edges = np.linspace(timestamps[0], timestamps[-1], n_shards + 1)[1:-1]
+    return [0, *np.searchsorted(timestamps, edges, side='left').tolist(), len(timestamps)]
+
+def new_engine(symbol: str, balance: float, strategy_cls = None, params: Dict[str, Any] = {}) -> Engine:
+    engine = Engine()
+    engine.symbol = symbol
+    engine.init_exchange()
+    if strategy_cls is not None:
+        engine.exchange.add_account('test', balance)
+        st = strategy_cls(**params)
+        st.set_engine(engine)
+        engine.set_strategy(st)
+    return engine
+
+def account_value(engine: Engine, symbol: str) -> float:
+    account = engine.exchange.accounts['test']
+    position = account.position[symbol]
+    return account.balance + (position['long'] - position['short']) * engine.exchange.cur_price.get(symbol, 0)
+
+def replay_checkpoints(tape: TradeTape, bounds: List[int], symbol: str, balance: float,
+                       strategy_cls = None, params: Dict[str, Any] = {}, chunk_size: int = 100000) -> Tuple[List[bytes], List[float]]:
+    """
+    Sequential replay taking a checkpoint at the start of every shard.
+    Without strategy_cls only historical trades are replayed, returns (checkpoints, account value at every bound)
+    """
+    engine = new_engine(symbol, balance, strategy_cls, params)
+    checkpoints, values = [], []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        checkpoints.append(engine.checkpoint())
+        values.append(account_value(engine, symbol) if strategy_cls is not None else None)
+        for block in tape.take(slice(lo, hi)).iter_blocks(chunk_size):
+            engine.replay_block(block)
+    values.append(account_value(engine, symbol) if strategy_cls is not None else None)
+    return checkpoints, values
+
+def ob500_checkpoints(ob_file: str, tape: TradeTape, bounds: List[int], symbol: str, max_depth: int = 5) -> List[bytes]:
+    """
+    Seed every shard from the last ob500 snapshot at or before its first trade,
+    shards starting before the first snapshot get the default empty book of Engine.init_exchange()
+    """
+    starts = [int(tape.timestamp[lo]) if lo < len(tape) else None for lo in bounds[:-1]]
+    ticks = [None] * len(starts)
+    for tick in DataLoader().iter_order_book(ob_file, max_depth):
+        for i, ts in enumerate(starts):
+            if ts is not None and tick.timestamp <= ts:
+                ticks[i] = tick
+    checkpoints = []
+    for tick in ticks:
+        engine = new_engine(symbol, 0)
+        if tick is not None:
+            tick.symbol = symbol
+            engine.set_exchange(Exchange({symbol: tick}, max_depth))
+            if tick.bid_volume.any() and tick.ask_volume.any():
+                engine.exchange.update_cur_price(symbol)
+        checkpoints.append(engine.checkpoint())
+    return checkpoints
+
+def run_shard(task) -> Tuple[Dict[str, Any], Ledger]:
+    '''
+    replay one shard from its checkpoint, task = (shard, checkpoint, tape path, opts, lo, hi, symbol, strategy class, params, balance)
+    returns the shard summary and its account history
+    '''
+    shard, checkpoint, tape_path, opts, lo, hi, symbol, strategy_cls, params, balance = task
+    t = time.time()
+    engine = Engine()
+    engine.symbol = symbol
+    engine.restore(checkpoint)
+    if 'test' not in engine.exchange.accounts: # history-only seed: fresh account and strategy
+        engine.exchange.add_account('test', balance)
+        st = strategy_cls(**params)
+        st.set_engine(engine)
+        engine.set_strategy(st)
+    engine.exchange.trade_history['test'] = Ledger()
+    start_price = engine.exchange.cur_price.get(symbol)
+    start_value = account_value(engine, symbol)
+
+    tape = TradeTape.open(tape_path).select(opts).take(slice(lo, hi))
+    for block in tape.iter_blocks(opts.get('chunk_size', 100000)):
+        engine.replay_block(block)
+
+    exchange = engine.exchange
+    position = exchange.accounts['test'].position[symbol]
+    open_orders = [order for order_id, order in exchange.orders.items() if exchange.order_account.get(order_id) == 'test']
+    rows = exchange.trade_history['test']
+    end_value = account_value(engine, symbol)
+    engine.detach() # rows is returned as is, freeing the engine must not add fills to it
+    return {
+        'shard': shard,
+        'start_ts': int(tape.timestamp[0]) if len(tape) else None,
+        'end_ts': int(tape.timestamp[-1]) if len(tape) else None,
+        'trades': len(tape),
+        'fills': len(rows),
+        'start_price': start_price,
+        'end_price': exchange.cur_price.get(symbol),
+        'start_value': start_value,
+        'end_value': end_value,
+        'pnl': end_value - start_value,
+        'long': position['long'],
+        'short': position['short'],
+        'open_orders': len(open_orders),
+        'open_volume': sum(order.remain() for order in open_orders),
+        'runtime': time.time() - t
+    }, rows
+
+def run_sharded(strategy_cls, params: Dict[str, Any], filename: str, symbol: str, opts = {}, n_shards: int = 4,
+                processes: Optional[int] = None, seed: str = 'replay', ob_file: Optional[str] = None,
+                balance: float = 1000000, reference: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run strategy_cls(**params) on n_shards time shards of the trade data in parallel.
+    Returns (account history, reconciliation report). The history has the same columns as
+    account_history.csv plus 'shard', balance / account_value are offset by the PnL of the earlier shards.
+    The report has one row per shard, see run_shard(); mid_gap is the start price of the next shard minus
+    the end price of this one, long / short / open_orders / open_volume are dropped at the boundary.
+    reference = True also runs the whole tape sequentially and adds ref_pnl / pnl_diff per shard.
+    """
+    tape_path = DataLoader().cached_tape_path(filename)
+    opts = {k: v for k, v in opts.items() if k != 'cache'}
+    tape = TradeTape.open(tape_path).select(opts)
+    bounds = shard_bounds(tape.timestamp, n_shards)
+
+    t = time.time()
+    ref_values = None
+    if seed == 'checkpoint' or reference:
+        checkpoints, ref_values = replay_checkpoints(tape, bounds, symbol, balance, strategy_cls, params, opts.get('chunk_size', 100000))
+    if seed == 'replay':
+        checkpoints, _ = replay_checkpoints(tape, bounds, symbol, balance, chunk_size=opts.get('chunk_size', 100000))
+    elif seed == 'ob500':
+        if ob_file is None:
+            print('seed ob500 needs ob_file!')
+            return None
+        checkpoints = ob500_checkpoints(ob_file, tape, bounds, symbol)
+    elif seed != 'checkpoint':
+        print(f'unknown seed {seed}!')
+        return None
+    logger.info(f'{len(checkpoints)} checkpoints ({seed}) in {time.time() - t:.1f}s')
+
+    tasks = [(i, checkpoints[i], tape_path, opts, bounds[i], bounds[i + 1], symbol, strategy_cls, params, balance)
+             for i in range(len(checkpoints))]
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+    t = time.time()
+    if processes <= 1:
+        results = list(map(run_shard, tasks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(run_shard, tasks, chunksize=1)
+    logger.info(f'{len(tasks)} shards in {time.time() - t:.1f}s on {processes} processes')
+
+    report = pd.DataFrame([summary for summary, _ in results])
+    report['mid_gap'] = report['start_price'].shift(-1) - report['end_price']
+    if ref_values is not None:
+        report['ref_pnl'] = np.diff(ref_values)
+        report['pnl_diff'] = report['pnl'] - report['ref_pnl']
+
+    histories = []
+    carried = balance # account value the next shard continues from
+    for summary, rows in results:
+        history = rows.to_frame()
+        offset = carried - summary['start_value']
+        history['balance'] += offset
+        history['account_value'] += offset
+        history['shard'] = summary['shard']
+        histories.append(history)
+        carried += summary['pnl']
+    return pd.concat(histories, ignore_index=True), report
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    history, report = run_sharded(GridTrading, {
+        'symbol': 'BTCUSDT',
+        'low_price': 91000,
+        'high_price': 93000,
+        'step_price': 10,
+        'profit': 10,
+        'amount': 0.1,
+        'min_balance': 200
+    }, '../data/BTCUSDT2024-11-27.csv.gz', 'BTCUSDT', opts = {'head_num': 200000}, n_shards=4, reference=True)
+    print(report.to_string(index=False))
+    print(f'stitched pnl: {report["pnl"].sum()}')
+    history.to_csv('account_history.csv', index=False)
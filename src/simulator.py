@@ -1,35 +1,150 @@
 import pandas as pd
 import numpy as np
-import collections, sortedcontainers, datetime, sys
+import collections, collections.abc, sortedcontainers, datetime, sys, heapq
+from itertools import islice
 from tqdm import tqdm
-from item import TickData, Snapshot, OrderData, Account, TradeData
-from typing import List, Dict, Tuple
-from inspect import isfunction
+from item import TickData, TickRing, Snapshot, OrderData, Account
+from item import BID_PRICE, ASK_PRICE, BID_VOLUME, ASK_VOLUME
+from typing import List, Dict, Tuple, Deque, Callable
 from constant import OrderType, Direction, Offset, Status
-import csv
+from equity_tracker import EquityTracker
 '''
 TODO:
 * consider last trade information(on event generation)
 * visualization
 '''
 
-order_fill_list = []
+FILL_DTYPE = np.dtype([('order_id', np.int64), ('price', np.float64), ('fill_amount', np.float64)])
+
+class FillBuffer:
+    '''
+    fills of algo orders, appended by the matching loop into a preallocated structured array
+    and drained in one batch by Exchange.process_trade_data. One buffer per Exchange.
+    '''
+    data: np.ndarray
+    size: int
+
+    def __init__(self, capacity: int = 64):
+        self.data = np.zeros(capacity, dtype=FILL_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, order_id: int, price: float, fill_amount: float):
+        if self.size == len(self.data):
+            data = np.zeros(2 * len(self.data), dtype=FILL_DTYPE)
+            data[:self.size] = self.data
+            self.data = data
+        self.data[self.size] = (order_id, price, fill_amount)
+        self.size += 1
+
+    def peek(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def drain(self) -> np.ndarray:
+        # copy, the buffer can be refilled while the batch is still being processed
+        batch = self.data[:self.size].copy()
+        self.size = 0
+        return batch
+
+LEDGER_COLUMNS = ['timestamp', 'symbol', 'balance', 'long', 'short', 'account_value', 'price']
+LEDGER_DTYPES = [np.int64, object, np.float64, np.float64, np.float64, np.float64, np.float64]
+
+class Ledger:
+    '''
+    account history of one account, one row per fill : [timestamp, symbol, balance, long, short, account_value, price].
+    Every column is a preallocated array, capacity doubles when full (like FillBuffer)
+    '''
+    size: int
+
+    def __init__(self, capacity: int = 256):
+        self.size = 0
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in zip(LEDGER_COLUMNS, LEDGER_DTYPES)}
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        # only the filled part of the columns goes into a checkpoint
+        return {'size': self.size, 'columns': {name: column[:self.size].copy() for name, column in self.columns.items()}}
+
+    def _reserve(self, n: int):
+        capacity = len(self.columns['timestamp'])
+        if self.size + n <= capacity:
+            return
+        capacity = max(2 * capacity, self.size + n, 1)
+        for name, dtype in zip(LEDGER_COLUMNS, LEDGER_DTYPES):
+            column = np.zeros(capacity, dtype=dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def extend(self, timestamp, symbol, balance, long, short, account_value, price):
+        '''
+        append len(balance) rows, every argument is an array of that length or a scalar shared by all rows
+        '''
+        n = len(balance)
+        self._reserve(n)
+        for name, value in zip(LEDGER_COLUMNS, (timestamp, symbol, balance, long, short, account_value, price)):
+            self.columns[name][self.size:self.size + n] = value
+        self.size += n
+
+    def append(self, timestamp, symbol, balance, long, short, account_value, price):
+        self._reserve(1)
+        for name, value in zip(LEDGER_COLUMNS, (timestamp, symbol, balance, long, short, account_value, price)):
+            self.columns[name][self.size] = value
+        self.size += 1
+
+    def drain(self) -> Dict[str, np.ndarray]:
+        # copy, the columns are reused for the next rows
+        chunk = {name: column[:self.size].copy() for name, column in self.columns.items()}
+        self.size = 0
+        return chunk
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+    def tolist(self) -> List[list]:
+        return [list(row) for row in zip(*(self.column(name).tolist() for name in LEDGER_COLUMNS))]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({name: self.column(name) for name in LEDGER_COLUMNS})
+
+# (direction, offset) -> row of FILL_SIGNS : signs of (balance, long, short) per unit of fill_amount * price / fill_amount
+FILL_SIDES = {
+    (Direction.LONG, Offset.OPEN): 0,
+    (Direction.LONG, Offset.CLOSE): 1,
+    (Direction.SHORT, Offset.OPEN): 2,
+    (Direction.SHORT, Offset.CLOSE): 3,
+}
+FILL_SIGNS = np.array([[-1.0, 1.0, 0.0], [1.0, -1.0, 0.0], [1.0, 0.0, 1.0], [-1.0, 0.0, -1.0], [0.0, 0.0, 0.0]])
+FILL_SIGN_ROWS = FILL_SIGNS.tolist()
+SCALAR_FILLS = 8 # smaller batches (usually one fill) are settled one fill at a time, the array set-up costs more than it saves
+BULK_TRADES = 8 # Exchange.replay_history advances runs of at least this many trades with Future.replay_history
 
 class OrderQueue:
     '''
     in the bid/ask book, there is an order book for each price, consisted of
     all the orders on this price level.
     '''
-    queue: List[Tuple[OrderData, List[OrderData]]]
-    next_orders: List[OrderData]
+    queue: Deque[List]  # [hist_order, Deque[algo orders that arrived before it]]
+    next_orders: Deque[OrderData]
     total_amount_var: float
+    rest_history_var: float # remaining volume of the historical orders behind queue[0]
+    live_algos: int # algo orders in the deques that are neither filled nor cancelled
+    cancelled_algos: int # cancelled algo orders still in the deques, dropped when reached or by _compact()
     price: float
 
-    def __init__(self, price: float):
+    def __init__(self, price: float, index: Dict[int, OrderData] = None, fills: FillBuffer = None):
         self.price = price
-        self.queue = []
-        self.next_orders = []
+        self.index = index # Future.orders, algo orders are removed from it once filled
+        self.fills = fills if fills is not None else FillBuffer()
+        self.queue = collections.deque()
+        self.next_orders = collections.deque()
         self.total_amount_var = 0
+        self.rest_history_var = 0.0
+        self.live_algos = 0
+        self.cancelled_algos = 0
         
 
     def __del__(self):
@@ -37,28 +152,66 @@ class OrderQueue:
 
     def add_order(self, order: OrderData):
         if order.is_history:
+            if len(self.queue) > 0:
+                self.rest_history_var += order.remain()
             self.queue.append([order, self.next_orders])
-            self.next_orders = []
+            self.next_orders = collections.deque()
         else:
             self.next_orders.append(order)
+            self.live_algos += 1
         self.total_amount_var += order.remain()
 
-    def _consume_algo_order_list(self, orders: List[OrderData], amount: float):
-        global order_fill_list
+    def _pop_history_order(self):
+        # only queue[0] is ever partially traded, the orders behind it still have their full volume
+        self.queue.popleft()
+        if len(self.queue) > 1:
+            self.rest_history_var -= self.queue[0][0].remain()
+        else:
+            self.rest_history_var = 0.0
+
+    def _link_algo_orders(self, algo_orders: Deque[OrderData]):
+        '''
+        algo orders still waiting behind a consumed hist order move to the front of the next group,
+        the shorter deque is spliced into the longer one
+        '''
+        if len(self.queue) > 1:
+            group = self.queue[1]
+            following = group[1]
+        else:
+            group = None
+            following = self.next_orders
+        if len(algo_orders) >= len(following):
+            algo_orders.extend(following)
+            following = algo_orders
+        else:
+            following.extendleft(reversed(algo_orders))
+        if group is not None:
+            group[1] = following # 如果下一個hist_order存在,則將algo_orders加到下一個queue的algo_orders
+        else:
+            self.next_orders = following # 如果沒有下一個hist_order,則將algo_orders加到next_orders
+
+    def _consume_algo_order_list(self, orders: Deque[OrderData], amount: float):
         while len(orders) > 0:
             order = orders[0]
+            if order.status == Status.CANCELLED: # cancelled orders are dropped lazily
+                orders.popleft()
+                self.cancelled_algos -= 1
+                continue
             if amount >= order.remain():
                 trade_amount = order.remain()
                 amount -= trade_amount
                 order.traded += trade_amount
                 self.total_amount_var -= trade_amount
-                if hasattr(order, 'callback') and isfunction(order.callback):
+                if callable(order.callback):
                     order.callback()
-                order_fill_list.append(TradeData(order.order_id, self.price, trade_amount))
-                orders.pop(0)
+                self.fills.append(order.order_id, self.price, trade_amount)
+                orders.popleft()
+                self.live_algos -= 1
+                if self.index is not None:
+                    self.index.pop(order.order_id, None)
             else:
                 order.traded += amount
-                order_fill_list.append(TradeData(order.order_id, self.price, amount))
+                self.fills.append(order.order_id, self.price, amount)
                 self.total_amount_var -= amount
                 break
 
@@ -74,11 +227,8 @@ class OrderQueue:
                 amount -= hist_order.remain()
                 self._consume_algo_order_list(algo_orders, hist_order.remain())
                 if len(algo_orders) > 0:
-                    if len(self.queue) > 1:
-                        self.queue[1][1] = algo_orders + self.queue[1][1] # 如果下一個hist_order存在,則將algo_orders加到下一個queue的algo_orders
-                    else:
-                        self.next_orders = algo_orders + self.next_orders # 如果沒有下一個hist_order,則將algo_orders加到next_orders
-                self.queue.pop(0)
+                    self._link_algo_orders(algo_orders)
+                self._pop_history_order()
             else:
                 hist_order.traded += amount
                 self._consume_algo_order_list(algo_orders, amount)
@@ -87,11 +237,33 @@ class OrderQueue:
         self.total_amount_var -= hist_amount - amount
         return amount
 
+    def match_history(self, amount: float) -> float:
+        '''
+        match_order for a level without algo orders (not even cancelled ones) : the same arithmetic on the
+        historical orders, without walking the algo order groups
+        '''
+        hist_amount = amount
+        queue = self.queue
+        while len(queue) > 0:
+            hist_order = queue[0][0]
+            if amount >= hist_order.remain():
+                amount -= hist_order.remain()
+                self._pop_history_order()
+            else:
+                hist_order.traded += amount
+                amount = 0
+                break
+        self.total_amount_var -= hist_amount - amount
+        return amount
+
     def total_amount(self):
         return self.total_amount_var  # total volume of ALL orders (both hist and algo)
 
     def history_amount(self):
-        return sum(map(lambda tp: tp[0].remain(), self.queue)) # sum of remaining volume for ONLY historical orders
+        # remaining volume for ONLY historical orders
+        if len(self.queue) == 0:
+            return 0
+        return self.queue[0][0].remain() + self.rest_history_var
 
     def cancel_data_order(self, amount: float):
         hist_amount = amount
@@ -100,11 +272,8 @@ class OrderQueue:
             if amount >= hist_order.remain():
                 amount -= hist_order.remain()
                 if len(algo_orders) > 0:
-                    if len(self.queue) > 1:
-                        self.queue[1][1] = algo_orders + self.queue[1][1]
-                    else:
-                        self.next_orders = algo_orders + self.next_orders
-                self.queue.pop(0)
+                    self._link_algo_orders(algo_orders)
+                self._pop_history_order()
             else:
                 hist_order.volume -= amount
                 amount = 0
@@ -112,47 +281,77 @@ class OrderQueue:
         self.total_amount_var -= hist_amount - amount
         return amount
 
-    def cancel_algo_order(self, order_id: int):
-        for hist, algos in self.queue:
-            for idx, order in enumerate(algos):
-                if order.order_id == order_id:
-                    self.total_amount_var -= order.remain()
-                    algos.pop(idx)
-                    return
+    def cancel_algo_order(self, order: OrderData):
+        # O(1) amortized: the order is only marked, it is skipped and dropped when the queue reaches it.
+        # Once the marked orders outnumber the live ones (and a quarter of the history groups, which
+        # _compact() has to walk) the deques are rebuilt without them
+        order.status = Status.CANCELLED
+        self.total_amount_var -= order.remain()
+        self.live_algos -= 1
+        self.cancelled_algos += 1
+        if self.cancelled_algos > self.live_algos and self.cancelled_algos * 4 >= len(self.queue):
+            self._compact()
+
+    def _compact(self):
+        live = lambda orders: collections.deque(order for order in orders if order.status != Status.CANCELLED)
+        for group in self.queue:
+            if len(group[1]) > 0:
+                group[1] = live(group[1])
+        self.next_orders = live(self.next_orders)
+        self.cancelled_algos = 0
+
+    def has_algo_orders(self) -> bool:
+        # live (not cancelled) algo orders at this price, deleting the level would fill them in __del__
+        return self.live_algos > 0
 
 class Future:
     symbol: str
     buy_book: Dict[float, OrderQueue]
     sell_book: Dict[float, OrderQueue]
 
-    def __init__(self, symbol: str, tick: TickData, max_depth: int):
+    def __init__(self, symbol: str, tick: TickData, max_depth: int, fills: FillBuffer = None):
         self.symbol = symbol
+        self.fills = fills if fills is not None else FillBuffer()
         self.max_depth = max_depth
         self.buy_book  = sortedcontainers.SortedDict()
         self.sell_book = sortedcontainers.SortedDict()
+        self.ticks = TickRing(symbol, max_depth)
+        self.orders = {} # resting algo orders by order_id, filled orders are removed by their OrderQueue
+        bid_price, bid_volume = tick.bid_price.tolist(), tick.bid_volume.tolist()
+        ask_price, ask_volume = tick.ask_price.tolist(), tick.ask_volume.tolist()
         for idx in range(tick.data_depth):
-            q = OrderQueue(tick.bid_price[idx])
-            q.add_order(OrderData({'volume': tick.bid_volume[idx], 'is_history': True, 'traded': 0}))
-            self.buy_book[tick.bid_price[idx]] = q
-            q = OrderQueue(tick.ask_price[idx])
-            q.add_order(OrderData({'volume': tick.ask_volume[idx], 'is_history': True, 'traded': 0}))
-            self.sell_book[tick.ask_price[idx]] = q
+            q = OrderQueue(bid_price[idx], self.orders, self.fills)
+            q.add_order(OrderData({'volume': bid_volume[idx], 'is_history': True, 'traded': 0}))
+            self.buy_book[bid_price[idx]] = q
+            q = OrderQueue(ask_price[idx], self.orders, self.fills)
+            q.add_order(OrderData({'volume': ask_volume[idx], 'is_history': True, 'traded': 0}))
+            self.sell_book[ask_price[idx]] = q
+
+    def best_bid(self) -> float:
+        # the ends of a SortedDict's key list are reachable without copying it.
+        # keys() is used rather than peekitem(): while a level is being deleted its key is still
+        # in the sorted list but not in the dict, and OrderQueue.__del__ callbacks may run in between
+        return self.buy_book.keys()[-1] if self.buy_book else None
+
+    def best_ask(self) -> float:
+        return self.sell_book.keys()[0] if self.sell_book else None
 
     def place_order(self, order: OrderData):
-        global order_fill_list
         if order.volume == 0:
             return
         if order.order_type == OrderType.LIMIT:
             # 限價單 : 只在 <= order.price 的價格下單
             if order.direction == Direction.LONG and order.offset == Offset.OPEN or order.direction == Direction.SHORT and order.offset == Offset.CLOSE:
                 # BUY : open LONG posotion or close SHORT position
-                sell_prices = list(self.sell_book.keys())
-                for sp in sell_prices:
+                # walk ask levels from the best one, consumed levels are deleted so the best is always at index 0
+                # (no local reference to the level is kept, OrderQueue.__del__ must run as soon as it is deleted)
+                while self.sell_book:
+                    sp = self.sell_book.keys()[0]
                     if sp > order.price:
                         break
                     if not order.is_history: # completed Algo Order, no need to match against order book (can't either)
-                        order.callback() if hasattr(order, 'callback') else None
-                        order_fill_list.append(TradeData(order.order_id, sp, order.volume))
+                        order.callback() if order.callback is not None else None
+                        self.fills.append(order.order_id, sp, order.volume)
                         order.volume = 0
                         break
                     order.volume = self.sell_book[sp].match_order(order.volume) # Hist Order match against order book
@@ -161,18 +360,16 @@ class Future:
                     else:
                         break
                 if order.volume > 0: # if order is not completed, add to order book
-                    if order.price not in self.buy_book:
-                        self.buy_book[order.price] = OrderQueue(order.price)
-                    self.buy_book[order.price].add_order(order)
+                    self._add_to_book(self.buy_book, order)
             elif order.direction == Direction.SHORT and order.offset == Offset.OPEN or order.direction == Direction.LONG and order.offset == Offset.CLOSE:
                 # SELL : open SHORT position or close LONG position
-                buy_prices = list(reversed(self.buy_book.keys()))
-                for bp in buy_prices:
+                while self.buy_book:
+                    bp = self.buy_book.keys()[-1]
                     if bp < order.price:
                         break
                     if not order.is_history: 
-                        order.callback() if hasattr(order, 'callback') else None
-                        order_fill_list.append(TradeData(order.order_id, bp, order.volume))
+                        order.callback() if order.callback is not None else None
+                        self.fills.append(order.order_id, bp, order.volume)
                         order.volume = 0
                         break
                     order.volume = self.buy_book[bp].match_order(order.volume) 
@@ -181,26 +378,110 @@ class Future:
                     else:
                         break
                 if order.volume > 0:
-                    if order.price not in self.sell_book:
-                        self.sell_book[order.price] = OrderQueue(order.price)
-                    self.sell_book[order.price].add_order(order)
+                    self._add_to_book(self.sell_book, order)
         elif order.order_type == OrderType.MARKET:
             if order.is_history:
                 # not possible
                 return
             if order.direction == Direction.LONG and order.offset == Offset.OPEN or order.direction == Direction.SHORT and order.offset == Offset.CLOSE:
-                sell_prices = list(self.sell_book.keys())
-                order.callback() if hasattr(order, 'callback') else None
-                order_fill_list.append(TradeData(order.order_id, sell_prices[0], order.volume))
+                order.callback() if order.callback is not None else None
+                self.fills.append(order.order_id, self.best_ask(), order.volume)
                 order.volume = 0
             elif order.direction == Direction.SHORT and order.offset == Offset.OPEN or order.direction == Direction.LONG and order.offset == Offset.CLOSE:
-                buy_prices = list(reversed(self.buy_book.keys()))
-                order.callback() if hasattr(order, 'callback') else None
-                order_fill_list.append(TradeData(order.order_id, buy_prices[0], order.volume))
+                order.callback() if order.callback is not None else None
+                self.fills.append(order.order_id, self.best_bid(), order.volume)
                 order.volume = 0
         else:
             pass
 
+    def replay_history(self, timestamps: List[int], prices: List[float], sizes: List[float], buys: List[bool],
+                       start: int, end: int, stop_time: float = float('inf'), lo: float = float('-inf'), hi: float = float('inf')) -> int:
+        '''
+        advance the book over the historical trades [start, end) in one call, returns the index of the first trade
+        that was not processed. Levels are matched with the same arithmetic as place_order, trades that are consumed
+        completely never become an OrderData, only their order id is used. A trade that can reach a level with live
+        algo orders is only taken as the first trade of a call, it goes to place_order and the call returns right
+        after it, so the caller settles its fills. It also stops before a trade that could empty the other side of the book (cur_price would need the mid before it)
+        and one at or after stop_time (pending latency requests, equity samples), those are left to place_order.
+        With a band [lo, hi) it also stops after the first trade that moves the mid price out of it.
+        '''
+        buy_book, sell_book = self.buy_book, self.sell_book
+        bid_keys, ask_keys = buy_book.keys(), sell_book.keys()
+        watch_mid = lo > float('-inf') or hi < float('inf')
+        if watch_mid and not (buy_book and sell_book): # the mid would be the previous price, leave it to place_order
+            return start
+        # the deepest level of each side, a trade that reaches it could empty the side (-inf / inf : stop at any cross)
+        worst_ask = ask_keys[-1] if sell_book else float('-inf')
+        worst_bid = bid_keys[0] if buy_book else float('inf')
+        new_order = OrderData.history
+        i = start
+        while i < end:
+            timestamp, price, volume, buy = timestamps[i], prices[i], sizes[i], buys[i]
+            if timestamp >= stop_time:
+                break
+            if buy:
+                if price >= worst_ask and sell_book:
+                    break
+                book, keys = sell_book, ask_keys
+            else:
+                if price <= worst_bid and buy_book:
+                    break
+                book, keys = buy_book, bid_keys
+            if volume == 0: # place_order ignores it
+                OrderData.order_count += 1
+                i += 1
+                continue
+            # a trade that can reach a level with live algo orders goes through place_order : the fills run callbacks
+            # of strategies, which have to see the exchange as after the previous trade, so it has to be the first.
+            # The levels in front of it are only passed if the trade can exhaust them (with a margin for rounding)
+            reach, k, ahead = False, 0, 0.0
+            while k < len(book) and ahead <= volume * (1 + 1e-9):
+                level_price = keys[k] if buy else keys[-1 - k]
+                if (level_price > price) if buy else (level_price < price):
+                    break
+                level = book[level_price]
+                if level.live_algos:
+                    reach = True
+                    break
+                ahead += level.history_amount()
+                k += 1
+            level = None
+            if reach:
+                if i > start:
+                    break
+                self.place_order(new_order(self.symbol, price, volume, Direction.LONG if buy else Direction.SHORT, timestamp))
+                i += 1
+                break
+            # walk the other side from its best level, exhausted levels are deleted
+            while book:
+                level_price = keys[0] if buy else keys[-1]
+                if (level_price > price) if buy else (level_price < price):
+                    break
+                level = book[level_price]
+                if level.cancelled_algos: # only cancelled algo orders left, match_order drops them
+                    volume = level.match_order(volume)
+                else:
+                    volume = level.match_history(volume)
+                exhausted = level.history_amount() <= 0
+                level = None
+                if not exhausted:
+                    break
+                del book[level_price]
+            if volume > 0:
+                self._add_to_book(buy_book if buy else sell_book, new_order(self.symbol, price, volume, Direction.LONG if buy else Direction.SHORT, timestamp))
+                if buy:
+                    worst_bid = min(worst_bid, price)
+                else:
+                    worst_ask = max(worst_ask, price)
+            else: # fully matched, only its order id is taken
+                OrderData.order_count += 1
+            i += 1
+            if watch_mid: # same mid as Exchange.update_cur_price
+                mid = float((float(ask_keys[0]) + float(bid_keys[-1])) / 2)
+                if not lo <= mid < hi:
+                    break
+        return i
+
     def cancel_data_order(self, price: float, volume: float):
         # 在sell_book和buy_book中找到price，並取消volume的訂單,如果訂單取消後，history_amount為0，則刪除該price的訂單
         # 在 historical orders 中，order_id 並不重要，只要將相對應的 volume 減去即可
@@ -213,147 +494,520 @@ class Future:
             if self.buy_book[price].history_amount() == 0:
                 del self.buy_book[price]
 
-    def cancel_order(self, order_id: int):
-        order = OrderData.get_order(order_id)
-        if order.price in self.sell_book:
-            self.sell_book[order.price].cancel_algo_order(order_id)
-            if self.sell_book[order.price].history_amount() == 0:
-                del self.sell_book[order.price]
-        if order.price in self.buy_book:
-            self.buy_book[order.price].cancel_algo_order(order_id)
-            if self.buy_book[order.price].history_amount() == 0:
-                del self.buy_book[order.price]
-
-    def snapshot(self) -> TickData:
-        sps = list(self.sell_book.keys())[:5]
-        bps = list(reversed(self.buy_book.keys()))[:5]
-        depth = min(len(sps), len(bps), self.max_depth)
-        tick = TickData({'symbol': self.symbol})
+    def _add_to_book(self, book: Dict[float, OrderQueue], order: OrderData):
+        if order.price not in book:
+            book[order.price] = OrderQueue(order.price, self.orders, self.fills)
+        book[order.price].add_order(order)
+        if not order.is_history:
+            self.orders[order.order_id] = order
+
+    def _order_book(self, order: OrderData) -> Dict[float, OrderQueue]:
+        if order.direction == Direction.LONG and order.offset == Offset.OPEN or order.direction == Direction.SHORT and order.offset == Offset.CLOSE:
+            return self.buy_book
+        return self.sell_book
+
+    def get_order(self, order_id: int) -> OrderData:
+        # resting algo order, None if it is filled, cancelled or never rested in the book
+        return self.orders.get(order_id)
+
+    def cancel_order(self, order_id: int) -> bool:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+        book = self._order_book(order)
+        if order.price in book:
+            book[order.price].cancel_algo_order(order)
+            # only an empty level is removed, other algo orders resting at this price stay in the book
+            if book[order.price].history_amount() == 0 and not book[order.price].has_algo_orders():
+                del book[order.price]
+        return True
+
+    def reduce_order(self, order_id: int, volume: float) -> bool:
+        '''
+        shrink a resting algo order to volume (total, including traded) without losing its queue position
+        '''
+        order = self.orders.get(order_id)
+        if order is None or volume > order.volume or volume <= order.traded:
+            return False
+        book = self._order_book(order)
+        book[order.price].total_amount_var -= order.volume - volume
+        order.volume = volume
+        return True
+
+    def snapshot(self, depth: int = None) -> TickData:
+        # only walk the levels that will be copied, depth defaults to max_depth
+        depth = self.max_depth if depth is None else min(depth, self.max_depth)
+        sps = list(islice(self.sell_book, depth))
+        bps = list(islice(reversed(self.buy_book), depth))
+        depth = min(len(sps), len(bps))
+        tick = self.ticks.next() # reuse a preallocated tick instead of allocating one per snapshot
         tick.set_data_depth(depth)
+        buf = tick.buffer
         for i in range(depth):
-            tick.bid_price[i] = bps[i]
-            tick.bid_volume[i] = self.buy_book[bps[i]].total_amount()
-            tick.ask_price[i] = sps[i]
-            tick.ask_volume[i] = self.sell_book[sps[i]].total_amount()
+            buf[BID_PRICE, i] = bps[i]
+            buf[BID_VOLUME, i] = self.buy_book[bps[i]].total_amount()
+            buf[ASK_PRICE, i] = sps[i]
+            buf[ASK_VOLUME, i] = self.sell_book[sps[i]].total_amount()
         return tick
 
 
+class LazySnapshot(collections.abc.Mapping):
+    '''
+    exchange snapshot that only builds the TickData of a symbol when a strategy reads it,
+    it reflects the order book at the time of the first read.
+    '''
+    def __init__(self, exchange: 'Exchange', depth: int = None):
+        self.exchange = exchange
+        self.depth = depth
+        self.ticks = {}
+
+    def __getitem__(self, symbol: str) -> TickData:
+        tick = self.ticks.get(symbol)
+        if tick is None:
+            tick = self.ticks[symbol] = self.exchange.futures[symbol].snapshot(self.depth)
+        return tick
+
+    def __iter__(self):
+        return iter(self.exchange.futures)
+
+    def __len__(self):
+        return len(self.exchange.futures)
+
 class Exchange:
     accounts: Dict[str, Account]
+    orders: Dict[int, OrderData]
     order_account: Dict[int, str]
     futures: Dict[str, Future]
 
-    def __init__(self, snapshot: Snapshot, max_depth: int):
+    def __init__(self, snapshot: Snapshot, max_depth: int, latency = 0):
+        '''
+        latency : delay of algo order submissions / cancels / amends in timestamp units, either a number
+        or a function latency(order) -> number that is sampled per request. 0 places orders immediately.
+        '''
+        self.latency = latency
+        self.pending = [] # heap of (activation time, seq, kind, args), released by advance_time()
+        self.pending_seq = 0
+        self.pending_orders = {} # order_id -> submitted algo orders that have not reached the book yet
+        self.current_time = 0
+        self.fills = FillBuffer()
+        self.fill_count = 0 # fills processed so far, read by subscription.Fills
+        self.fill_subscribers = []
         self.futures = {}
         for k in snapshot.keys():
-            self.futures[k] = Future(k, snapshot[k], max_depth)
+            self.futures[k] = Future(k, snapshot[k], max_depth, self.fills)
         self.accounts = {}
+        self.orders = {} # live algo orders that belong to an account, dropped once filled or cancelled
         self.order_account = {}
         self.cur_price = {}
         self.prev_non_zero_price = {}
         self.trade_history = {}
+        self.history_sink = None # history_sink.HistorySink, ledgers are streamed to it in chunks
+        self.equity_trackers = {} # account name -> EquityTracker
+        self.equity_next = float('inf') # earliest next sample time of the trackers
+
+    def __getstate__(self):
+        # fill subscribers and the history sink belong to the process that registered them, they are not part of a checkpoint
+        state = self.__dict__.copy()
+        state['fill_subscribers'] = []
+        state['history_sink'] = None
+        return state
+
+    def set_history_sink(self, sink):
+        '''
+        stream the account history to sink : a ledger is handed to sink.write() once it has sink.chunk_rows rows,
+        flush_trade_history() hands over the rest. None keeps the whole history in self.trade_history
+        '''
+        self.history_sink = sink
+
+    def track_equity(self, account_name: str, interval: int = 1000000, **kwargs) -> EquityTracker:
+        '''
+        sample the mark-to-market equity of account_name every interval time units, see equity_tracker
+        '''
+        tracker = EquityTracker(account_name, interval, **kwargs)
+        self.equity_trackers[account_name] = tracker
+        self.equity_next = float('-inf')
+        return tracker
+
+    def _sample_equity(self):
+        now = self.current_time
+        for name, tracker in self.equity_trackers.items():
+            if now >= tracker.next_time:
+                tracker.sample(self.accounts[name], self.cur_price, now)
+        self.equity_next = min(tracker.next_time for tracker in self.equity_trackers.values())
+
+    def flush_trade_history(self):
+        if self.history_sink is None:
+            return
+        for ledger in self.trade_history.values():
+            self.history_sink.write(ledger.drain())
 
     def add_account(self, name: str, balance: float = 0):
         self.accounts[name] = Account(name, balance, self.futures.keys())
-        self.trade_history[name] = []
+        self.trade_history[name] = Ledger()
     
+    def subscribe_fills(self, callback: Callable[[np.ndarray], None]):
+        '''
+        callback(fills) receives every drained batch of fills (structured array with
+        order_id, price, fill_amount) after accounting, never from inside the matching loop
+        '''
+        self.fill_subscribers.append(callback)
+
     def get_accounts(self):
         return self.accounts
     
     def get_account(self, name):
         return self.accounts[name]
 
+    def order_latency(self, order: OrderData) -> float:
+        return self.latency(order) if callable(self.latency) else self.latency
+
+    def _submit(self, activation_time: float, kind: str, args: tuple):
+        heapq.heappush(self.pending, (activation_time, self.pending_seq, kind, args))
+        self.pending_seq += 1
+
+    def advance_time(self, now: int):
+        '''
+        move the exchange clock to now, releasing every pending request with activation time <= now in time order
+        '''
+        self.current_time = now
+        pending = self.pending
+        while pending and pending[0][0] <= now:
+            activation_time, _, kind, args = heapq.heappop(pending)
+            if kind == 'place':
+                order, account_name = args
+                if self.pending_orders.pop(order.order_id, None) is None: # cancelled while in flight
+                    continue
+                order.timestamp = activation_time
+                self._place_order(order, account_name)
+            elif kind == 'cancel':
+                self._cancel_order(*args)
+            elif kind == 'amend':
+                self._amend_order(*args)
+
     def place_order(self, d, account_name = None) -> OrderData:
         if 'is_history' not in d:
             d['is_history'] = False
 
         order = OrderData(d)
-        # simulate latency
         order.traded = 0
         order.status = Status.SUBMITTING
-        symbol = order.symbol
-
-        if symbol in self.futures:
-            self.futures[symbol].place_order(order)
-        else:
-            print(f'future {symbol} not exist!')
+        if order.symbol not in self.futures:
+            print(f'future {order.symbol} not exist!')
             return
 
-        if account_name is not None:
+        # simulate latency : algo orders reach the book after order_latency(order)
+        if not order.is_history and self.latency:
+            delay = self.order_latency(order)
+            if delay > 0:
+                submit_time = order.timestamp if getattr(order, 'timestamp', None) is not None else self.current_time
+                self.pending_orders[order.order_id] = order
+                self._submit(submit_time + delay, 'place', (order, account_name))
+                return order
+        return self._place_order(order, account_name)
+
+    def _place_order(self, order: OrderData, account_name = None) -> OrderData:
+        symbol = order.symbol
+        self.futures[symbol].place_order(order)
+
+        if account_name is not None and not order.is_history: # historical orders never produce fills
             if account_name not in self.accounts:
                 print(f'account {account_name} not exist!')
             else:
+                self.orders[order.order_id] = order
                 self.order_account[order.order_id] = account_name
 
         price = self.update_cur_price(symbol)
         self.process_trade_data(price, order.timestamp)
         return order
 
+    def replay_history(self, symbols: List[str], timestamps: List[int], prices: List[float], sizes: List[float], buys: List[bool],
+                       after_trade: Callable[[str, int], None] = None, quiet: Callable[[str], Tuple[float, float, float]] = None):
+        '''
+        place a run of historical trades in one call, same result as calling place_order(d) for each of them.
+        Arguments are parallel lists (timestamps in engine time units), symbols[i] is the symbol of trade i.
+        after_trade(symbol, timestamp) is called after every trade, quiet(symbol) returns a band (lo, hi, until)
+        in which calling it would change nothing : the mid price of symbol stays in [lo, hi) and the timestamp
+        is before until (None : it has to see every trade, see Subscription.band).
+        Runs of BULK_TRADES or more are advanced by Future.replay_history one symbol segment at a time, with one
+        update_cur_price (and after_trade) per segment, a segment ends after a trade that filled algo orders and
+        accounting runs for it. The trades it stops at (a side that could be emptied, pending latency requests,
+        equity samples, a band left) go through Future.place_order one by one.
+        '''
+        futures = self.futures
+        fills = self.fills
+        pending = self.pending
+        new_order = OrderData.history
+        n = len(symbols)
+        bulk = n >= BULK_TRADES and (after_trade is None or quiet is not None)
+        i = end = 0
+        while i < n:
+            symbol = symbols[i]
+            band = (float('-inf'), float('inf'), float('inf')) if quiet is None else quiet(symbol) if bulk else None
+            if bulk and symbol in futures and band is not None:
+                # the segment of this symbol, the Future stops earlier at trades it cannot advance over
+                if i >= end:
+                    end = i + 1
+                    while end < n and symbols[end] == symbol:
+                        end += 1
+                lo, hi, until = band
+                self.current_time = timestamps[i] # the first trade may fill algo orders, callbacks read the time
+                stop_time = min(pending[0][0] if pending else float('inf'), self.equity_next, until)
+                j = futures[symbol].replay_history(timestamps, prices, sizes, buys, i, end, stop_time, lo, hi)
+                if j > i:
+                    timestamp = self.current_time = timestamps[j - 1]
+                    price = self.update_cur_price(symbol)
+                    if len(fills): # only the last trade can have filled algo orders
+                        self.process_trade_data(price, timestamp)
+                    if after_trade is not None:
+                        after_trade(symbol, timestamp)
+                    i = j
+                    continue
+            timestamp, price, size, buy = timestamps[i], prices[i], sizes[i], buys[i]
+            i += 1
+            self.current_time = timestamp
+            if pending and pending[0][0] <= timestamp:
+                self.advance_time(timestamp)
+            if symbol not in futures:
+                print(f'future {symbol} not exist!')
+                continue
+            futures[symbol].place_order(new_order(symbol, price, size, Direction.LONG if buy else Direction.SHORT, timestamp))
+            price = self.update_cur_price(symbol)
+            if len(fills):
+                self.process_trade_data(price, timestamp)
+            if after_trade is not None:
+                after_trade(symbol, timestamp)
+
     def cancel_data_order(self, future: str, price: float, volume: float):
         self.futures[future].cancel_data_order(price, volume)
 
-    def snapshot(self) -> Snapshot:
+    def cancel_order(self, symbol: str, order_id: int) -> bool:
+        '''
+        with latency the cancel is only queued, returns whether the order is still live when it is sent
+        '''
+        if self.latency:
+            order = self.pending_orders.get(order_id) or self.futures[symbol].get_order(order_id)
+            if order is None:
+                return False
+            delay = self.order_latency(order)
+            if delay > 0:
+                self._submit(self.current_time + delay, 'cancel', (symbol, order_id))
+                return True
+        return self._cancel_order(symbol, order_id)
+
+    def _cancel_order(self, symbol: str, order_id: int) -> bool:
+        order = self.pending_orders.pop(order_id, None)
+        if order is not None: # still in flight, it never reaches the book
+            order.status = Status.CANCELLED
+            self._forget_order(order_id)
+            return True
+        if not self.futures[symbol].cancel_order(order_id):
+            return False
+        self._forget_order(order_id)
+        return True
+
+    def _forget_order(self, order_id: int):
+        self.orders.pop(order_id, None)
+        self.order_account.pop(order_id, None)
+
+    def amend_order(self, symbol: str, order_id: int, price: float = None, volume: float = None, timestamp: int = None) -> OrderData:
+        '''
+        cancel-replace a resting algo order, volume is the new total volume of the order.
+        Shrinking the volume at the same price keeps the queue position, anything else
+        cancels the order and places the remaining volume as a new order.
+        With latency the amend is only queued and the order is returned as it is now.
+        '''
+        if self.latency:
+            order = self.pending_orders.get(order_id) or self.futures[symbol].get_order(order_id)
+            if order is None:
+                print(f'order {order_id} is not resting in {symbol}')
+                return None
+            delay = self.order_latency(order)
+            if delay > 0:
+                self._submit(self.current_time + delay, 'amend', (symbol, order_id, price, volume, timestamp))
+                return order
+        return self._amend_order(symbol, order_id, price, volume, timestamp)
+
+    def _amend_order(self, symbol: str, order_id: int, price: float = None, volume: float = None, timestamp: int = None) -> OrderData:
+        order = self.pending_orders.get(order_id)
+        if order is not None: # still in flight, amended before it reaches the book
+            order.price = order.price if price is None else price
+            order.volume = order.volume if volume is None else volume
+            return order
+        future = self.futures[symbol]
+        order = future.get_order(order_id)
+        if order is None:
+            print(f'order {order_id} is not resting in {symbol}')
+            return None
+        if price is None or price == order.price:
+            if volume is None or future.reduce_order(order_id, volume):
+                return order
+        account_name = self.order_account.get(order_id)
+        future.cancel_order(order_id)
+        self._forget_order(order_id)
+        remain = (order.volume if volume is None else volume) - order.traded
+        if remain <= 0:
+            return order
+        return self._place_order(OrderData({
+            'symbol': symbol,
+            'price': order.price if price is None else price,
+            'volume': remain,
+            'is_history': False,
+            'order_type': order.order_type,
+            'direction': order.direction,
+            'offset': order.offset,
+            'callback': getattr(order, 'callback', None),
+            'timestamp': order.timestamp if timestamp is None else timestamp
+        }), account_name)
+
+    def snapshot(self, depth: int = None) -> Snapshot:
         ss = {}
         for symbol in self.futures:
-            ss[symbol] = self.futures[symbol].snapshot()
+            ss[symbol] = self.futures[symbol].snapshot(depth)
         return ss
 
+    def lazy_snapshot(self, depth: int = None) -> LazySnapshot:
+        return LazySnapshot(self, depth)
+
     def update_cur_price(self, symbol: str) -> float:
         # cur_price[symobl] is the mean of the lowest ask price and the highest bid price
-        if len(self.futures[symbol].sell_book.keys()) > 0 and len(self.futures[symbol].buy_book.keys()) > 0:
-            best_ask = float(list(self.futures[symbol].sell_book.keys())[0])
-            best_bid = float(list(self.futures[symbol].buy_book.keys())[-1])
+        future = self.futures[symbol]
+        if future.sell_book and future.buy_book:
+            best_ask = float(future.best_ask())
+            best_bid = float(future.best_bid())
             self.cur_price[symbol] = float((best_ask + best_bid) / 2)
             self.prev_non_zero_price[symbol] = self.cur_price[symbol]
         else:
             self.cur_price[symbol] = self.prev_non_zero_price[symbol]
+        if self.current_time >= self.equity_next:
+            self._sample_equity()
         return self.cur_price[symbol]
 
     def process_trade_data(self, price: float, timestamp: int): # position management
-        global order_fill_list
-        for fill in order_fill_list:
-            order_id = fill.order_id
-            if order_id in self.order_account:
-                account = self.accounts[self.order_account[order_id]] # get account from order id
-                order = OrderData.get_order(order_id)
-                # print(f"----------timestamp: {timestamp} ----------")
-                if order.direction == Direction.LONG and order.offset == Offset.OPEN:
-                    # print(f'long open, balance - {fill.fill_amount * fill.price}')
-                    account.balance -= fill.fill_amount * fill.price
-                    account.position[order.symbol]['long'] += fill.fill_amount
-                    # account.position[order.symbol]['long'] = round(account.position[order.symbol]['long'], 10)
-                elif order.direction == Direction.LONG and order.offset == Offset.CLOSE:
-                    # print(f'long close, balance + {fill.fill_amount * fill.price}')
-                    account.balance += fill.fill_amount * fill.price
-                    account.position[order.symbol]['long'] -= fill.fill_amount
-                    # account.position[order.symbol]['long'] = round(account.position[order.symbol]['long'], 10)
-                elif order.direction == Direction.SHORT and order.offset == Offset.OPEN:
-                    # print(f'short open, balance + {fill.fill_amount * fill.price}')
-                    account.balance += fill.fill_amount * fill.price
-                    account.position[order.symbol]['short'] += fill.fill_amount
-                    # account.position[order.symbol]['short'] = round(account.position[order.symbol]['short'], 10)
-                elif order.direction == Direction.SHORT and order.offset == Offset.CLOSE:
-                    # print(f'short close, balance - {fill.fill_amount * fill.price}')
-                    account.balance -= fill.fill_amount * fill.price
-                    account.position[order.symbol]['short'] -= fill.fill_amount
-                    # account.position[order.symbol]['short'] = round(account.position[order.symbol]['short'], 10)
-
-                account_value = account.balance + (account.position[order.symbol]['long'] - account.position[order.symbol]['short']) * price
-                # print(f"account balance: {account.balance}")
-                # print(f"long: {account.position[order.symbol]['long']}, short: {account.position[order.symbol]['short']}")
-                # print(f"account value: {account_value}")
-                # print(f"mid price: {price}")
-                # print('--------------------------------')
-                # [timestamp, symbol, balance, long, short, account_value, price]
-                self.trade_history[account.name].append([timestamp, order.symbol, account.balance, account.position[order.symbol]['long'], account.position[order.symbol]['short'], account_value, price])
-        order_fill_list = []
+        '''
+        account the drained batch of fills : the orders are looked up once (_fill_orders), batches of SCALAR_FILLS
+        fills or more are settled with array ops (_settle_fill_arrays), smaller ones one fill at a time (_settle_fills),
+        both give the same results
+        '''
+        if len(self.fills) == 0:
+            return
+        fills = self.fills.drain()
+        self.fill_count += len(fills)
+        rows = fills.tolist()
+        done, keep, sides, groups = self._fill_orders(rows)
+        if len(keep) < SCALAR_FILLS:
+            self._settle_fills(rows, keep, sides, groups, price, timestamp)
+        else:
+            self._settle_fill_arrays(fills, keep, sides, groups, price, timestamp)
+        for order_id in done:
+            self._forget_order(order_id)
+        for callback in self.fill_subscribers:
+            callback(fills)
+
+    def _fill_orders(self, rows: List[tuple]) -> Tuple[List[int], List[int], List[int], List[Tuple[str, str]]]:
+        '''
+        the order of every fill, shared by both settlements. Returns the ids of the filled orders and, for every fill
+        of an order that belongs to an account : its index in the batch, its FILL_SIGNS row and (account, symbol)
+        '''
+        done, keep, sides, groups = [], [], [], []
+        for i, (order_id, _, _) in enumerate(rows):
+            name = self.order_account.get(order_id)
+            if name is None:
+                continue
+            order = self.orders[order_id]
+            if order_id not in self.futures[order.symbol].orders: # no longer resting : filled
+                done.append(order_id)
+            keep.append(i)
+            sides.append(FILL_SIDES.get((order.direction, order.offset), 4))
+            groups.append((name, order.symbol))
+        return done, keep, sides, groups
+
+    def _settle_fills(self, rows: List[tuple], keep: List[int], sides: List[int], groups: List[Tuple[str, str]], price: float, timestamp: int):
+        '''
+        one fill at a time (see _fill_orders for keep, sides, groups)
+        '''
+        notional = {} # account name -> traded notional of the batch, added to its EquityTracker once like the array path
+        for i, side, (name, symbol) in zip(keep, sides, groups):
+            _, fill_price, fill_amount = rows[i]
+            sign_cash, sign_long, sign_short = FILL_SIGN_ROWS[side]
+            cash = sign_cash * (fill_amount * fill_price)
+            account = self.accounts[name]
+            account.balance += cash
+            position = account.position[symbol]
+            position['long'] += sign_long * fill_amount
+            position['short'] += sign_short * fill_amount
+            if name in self.equity_trackers:
+                notional[name] = notional.get(name, 0.0) + abs(cash)
+            self.trade_history[name].append(timestamp, symbol, account.balance, position['long'], position['short'],
+                                            account.balance + (position['long'] - position['short']) * price, price)
+            self._flush_ledger(name)
+        for name, value in notional.items():
+            self.equity_trackers[name].add_fills(value)
+
+    def _settle_fill_arrays(self, fills: np.ndarray, keep: List[int], sides: List[int], groups: List[Tuple[str, str]], price: float, timestamp: int):
+        '''
+        the whole batch at once (see _fill_orders for keep, sides, groups) : balance and positions are running sums
+        (np.cumsum, the same additions in the same order as one fill at a time) and every account gets one block of ledger rows
+        '''
+        batch = fills[keep] if len(keep) < len(fills) else fills
+        signs = FILL_SIGNS[sides]
+        cash = signs[:, 0] * (batch['fill_amount'] * batch['price'])
+        long_delta = signs[:, 1] * batch['fill_amount']
+        short_delta = signs[:, 2] * batch['fill_amount']
+        if groups.count(groups[0]) == len(groups): # usually one account and one symbol
+            name, symbol = groups[0]
+            self._account_fills(name, slice(None), symbol, cash, long_delta, short_delta, price, timestamp)
+        else:
+            names = np.array([name for name, _ in groups], dtype=object)
+            symbols = np.array([symbol for _, symbol in groups], dtype=object)
+            for name in dict.fromkeys(names.tolist()):
+                rows = names == name
+                self._account_fills(name, rows, symbols[rows], cash, long_delta, short_delta, price, timestamp)
+
+    def _account_fills(self, name: str, rows, symbols, cash: np.ndarray, long_delta: np.ndarray, short_delta: np.ndarray,
+                       price: float, timestamp: int):
+        '''
+        apply the fills rows of the batch to account name and add them to its ledger,
+        symbols is the symbol of every fill, or one symbol shared by all of them
+        '''
+        account = self.accounts[name]
+        if name in self.equity_trackers:
+            self.equity_trackers[name].add_fills(float(np.abs(cash[rows]).sum()))
+        balance = np.cumsum(np.concatenate(([account.balance], cash[rows])))[1:]
+        account.balance = float(balance[-1])
+        long_delta, short_delta = long_delta[rows], short_delta[rows]
+        if isinstance(symbols, str):
+            long, short = self._position_fills(account.position[symbols], long_delta, short_delta)
+        else:
+            long, short = np.empty(len(balance)), np.empty(len(balance))
+            for symbol in dict.fromkeys(symbols.tolist()):
+                same = symbols == symbol
+                long[same], short[same] = self._position_fills(account.position[symbol], long_delta[same], short_delta[same])
+        account_value = balance + (long - short) * price
+        self.trade_history[name].extend(timestamp, symbols, balance, long, short, account_value, price)
+        self._flush_ledger(name)
+
+    def _flush_ledger(self, name: str):
+        # hand a full chunk of the ledger of account name to the history sink
+        ledger = self.trade_history[name]
+        if self.history_sink is not None and len(ledger) >= self.history_sink.chunk_rows:
+            self.history_sink.write(ledger.drain())
+
+    @staticmethod
+    def _position_fills(position: Dict[str, float], long_delta: np.ndarray, short_delta: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        long = np.cumsum(np.concatenate(([position['long']], long_delta)))[1:]
+        short = np.cumsum(np.concatenate(([position['short']], short_delta)))[1:]
+        position['long'], position['short'] = float(long[-1]), float(short[-1])
+        return long, short
 
     def save_trade_history(self, filename: str):
-        with open(filename, 'w') as f:
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'symbol', 'balance', 'long', 'short', 'account_value', 'price'])
-            for account in self.trade_history:
-                writer.writerows(self.trade_history[account])
+        '''
+        write the account history (.csv, .npy or .parquet, see history_sink) and clear it
+        '''
+        from history_sink import open_sink
+        sink = open_sink(filename, background=False)
+        for ledger in self.trade_history.values():
+            sink.write(ledger.drain())
+        sink.close()
         self.trade_history = {}
     
 if __name__ == '__main__':
@@ -364,8 +1018,8 @@ if __name__ == '__main__':
     order_queue.add_order(OrderData({'volume': 100, 'is_history': True, 'traded': 0}))
     order_queue.match_order(30)
     order_queue.match_order(50)
-    print(order_fill_list[0].fill_amount)
-    print(order_fill_list[1].fill_amount)
+    print(order_queue.fills.peek()[0]['fill_amount'])
+    print(order_queue.fills.peek()[1]['fill_amount'])
     print(order_queue.total_amount())
     print(order_queue.history_amount())
     """
@@ -408,8 +1062,8 @@ if __name__ == '__main__':
         print(f'bid_price: {tick.bid_price[i]}, bid_volume: {tick.bid_volume[i]}')
     
     # traded amount
-    if len(order_fill_list) > 0:
-        print(f"Traded amount: {order_fill_list[0].fill_amount}")
+    if len(future.fills) > 0:
+        print(f"Traded amount: {future.fills.peek()[0]['fill_amount']}")
 
     """
 
@@ -438,7 +1092,6 @@ if __name__ == '__main__':
 
     # Now let's match 800 shares
     remaining = order_queue.match_order(800)
-    if len(order_fill_list) > 0:
-        for trade in order_fill_list:
-            print(f"Traded price: {trade.price}, traded amount: {trade.fill_amount}")
+    for trade in order_queue.fills.peek():
+        print(f"Traded price: {trade['price']}, traded amount: {trade['fill_amount']}")
     
\ No newline at end of file
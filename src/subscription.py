@@ -0,0 +1,117 @@
+from bisect import bisect_right
+from typing import List, Optional
+'''
+Strategy wake-up conditions. A strategy returns a list of subscriptions from subscriptions(),
+Engine polls them after every order of the market and calls on_tick only when one of them fires.
+poll() is called for every order, so each check is a few comparisons on state kept from the last call.
+A strategy without subscriptions is polled the old way (every >= 10 time units).
+band() lets Engine.replay_block skip the polls of a run of trades that cannot fire.
+'''
+
+QUIET = (float('-inf'), float('inf'), float('inf'))
+
+class Subscription:
+    symbol: Optional[str] # None = orders of every symbol
+
+    def __init__(self, symbol: str = None):
+        self.symbol = symbol
+
+    def poll(self, exchange, symbol: str, timestamp: int) -> bool:
+        raise NotImplementedError
+
+    def band(self, exchange, symbol: str):
+        '''
+        (lo, hi, until) : while the mid price of symbol stays in [lo, hi) and timestamps are before until,
+        poll() returns False and keeps its state, so the orders in between need not be polled.
+        None : every order has to be polled.
+        '''
+        return None
+
+class PriceCross(Subscription):
+    '''
+    fires when the mid price of symbol moves into another interval of the sorted levels (and on the first price)
+    '''
+    levels: List[float]
+
+    def __init__(self, symbol: str, levels: List[float]):
+        super().__init__(symbol)
+        self.set_levels(levels)
+
+    def set_levels(self, levels: List[float]):
+        self.levels = sorted(levels)
+        self.lo, self.hi = float('inf'), float('-inf') # empty interval, the next price always fires
+
+    def poll(self, exchange, symbol: str, timestamp: int) -> bool:
+        if symbol != self.symbol:
+            return False
+        price = exchange.cur_price.get(symbol)
+        if price is None or self.lo <= price < self.hi:
+            return False
+        idx = bisect_right(self.levels, price)
+        self.lo = self.levels[idx - 1] if idx > 0 else float('-inf')
+        self.hi = self.levels[idx] if idx < len(self.levels) else float('inf')
+        return True
+
+    def band(self, exchange, symbol: str):
+        return (self.lo, self.hi, float('inf')) if symbol == self.symbol else QUIET
+
+class Timer(Subscription):
+    '''
+    fires on the first order at or after every interval time units
+    '''
+    def __init__(self, interval: int, symbol: str = None):
+        super().__init__(symbol)
+        self.interval = interval
+        self.next_time = None
+
+    def poll(self, exchange, symbol: str, timestamp: int) -> bool:
+        if self.symbol is not None and symbol != self.symbol:
+            return False
+        if self.next_time is not None and timestamp < self.next_time:
+            return False
+        self.next_time = timestamp + self.interval
+        return True
+
+    def band(self, exchange, symbol: str):
+        if self.symbol is not None and symbol != self.symbol:
+            return QUIET
+        return (float('-inf'), float('inf'), float('-inf') if self.next_time is None else self.next_time)
+
+class Fills(Subscription):
+    '''
+    fires after the exchange has processed fills of algo orders
+    '''
+    def __init__(self):
+        super().__init__(None)
+        self.fill_count = 0
+
+    def poll(self, exchange, symbol: str, timestamp: int) -> bool:
+        if exchange.fill_count == self.fill_count:
+            return False
+        self.fill_count = exchange.fill_count
+        return True
+
+    def band(self, exchange, symbol: str):
+        # the bulk replay never fills algo orders, fills of a crossing order placed in on_tick fire on the next order
+        return QUIET if exchange.fill_count == self.fill_count else None
+
+class TopOfBook(Subscription):
+    '''
+    fires when the best bid or best ask price of symbol changes
+    '''
+    def __init__(self, symbol: str):
+        super().__init__(symbol)
+        self.best = (None, None)
+
+    def poll(self, exchange, symbol: str, timestamp: int) -> bool:
+        if symbol != self.symbol:
+            return False
+        future = exchange.futures[symbol]
+        best = (future.best_bid(), future.best_ask())
+        if best == self.best:
+            return False
+        self.best = best
+        return True
+
+    def band(self, exchange, symbol: str):
+        return None if symbol == self.symbol else QUIET
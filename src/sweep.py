@@ -0,0 +1,81 @@
+import itertools, os, time, logging
+import multiprocessing
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from engine import Engine
+from data_loader import DataLoader
+from grid_trading import GridTrading
+logger = logging.getLogger('sweep')
+
+def param_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    '''
+    every combination of the values in grid, e.g. {'a': [1, 2], 'b': [3]} -> [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]
+    '''
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[k] for k in keys])]
+
+def run_config(task) -> Dict[str, Any]:
+    '''
+    run one backtest in the current process, task = (strategy class, params, tape path, symbol, opts, balance, batch)
+    '''
+    strategy_cls, params, tape_path, symbol, opts, balance, batch = task
+    t = time.time()
+    engine = Engine()
+    engine.symbol = symbol # init_exchange() builds the Future of engine.symbol
+    engine.init_exchange()
+    engine.exchange.add_account('test', balance)
+    engine.load_data(tape_path, symbol, opts) # memory-mapped, the page cache is shared by all workers
+    st = strategy_cls(**params)
+    st.set_engine(engine)
+    engine.set_strategy(st)
+    engine.start(batch=batch, history_file=None, progress_bar=False)
+
+    account = engine.exchange.accounts['test']
+    position = account.position[symbol]
+    price = engine.exchange.cur_price.get(symbol, 0)
+    return {
+        **params,
+        'balance': account.balance,
+        'long': position['long'],
+        'short': position['short'],
+        'account_value': account.balance + (position['long'] - position['short']) * price,
+        'fills': len(engine.exchange.trade_history['test']),
+        'runtime': time.time() - t
+    }
+
+def sweep(strategy_cls, grid: Dict[str, List[Any]], filename: str, symbol: str, opts = {},
+          balance: float = 1000000, processes: Optional[int] = None, batch: bool = True) -> pd.DataFrame:
+    """
+    Run strategy_cls(**params) for every params in param_grid(grid) on a process pool.
+    The trade data is converted to a TradeTape once (or filename is already one), every worker
+    opens the same tape with np.memmap instead of parsing the CSV again.
+    Returns one row per config: params, balance, long, short, account_value, fills, runtime
+    """
+    tape_path = DataLoader().cached_tape_path(filename)
+    tape_opts = {k: v for k, v in opts.items() if k != 'cache'}
+    tasks = [(strategy_cls, params, tape_path, symbol, tape_opts, balance, batch) for params in param_grid(grid)]
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+
+    t = time.time()
+    if processes <= 1:
+        results = list(map(run_config, tasks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(run_config, tasks, chunksize=1)
+    logger.info(f'{len(tasks)} configs in {time.time() - t:.1f}s on {processes} processes')
+    return pd.DataFrame(results)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    result = sweep(GridTrading, {
+        'symbol': ['BTCUSDT'],
+        'low_price': [91000],
+        'high_price': [93000],
+        'step_price': [10, 20, 50],
+        'profit': [10, 20],
+        'amount': [0.1],
+        'min_balance': [200]
+    }, '../data/BTCUSDT2024-11-27.csv.gz', 'BTCUSDT', opts = {'head_num': 200000})
+    print(result.sort_values('account_value', ascending=False).to_string(index=False))
+    result.to_csv('sweep_result.csv', index=False)
@@ -0,0 +1,3 @@
+import os, sys
+# modules in src/ import each other by their flat names (from simulator import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,34 @@
+from constant import Direction, Offset, OrderType
+from item import TickData
+from simulator import Exchange
+
+SYMBOL = 'BTCUSDT'
+
+def make_exchange(balance: float = 1000, bid: float = 90, ask: float = 101, latency = 0) -> Exchange:
+    '''
+    exchange with one symbol, one unit of history volume at bid and at ask, and an account 'test'
+    '''
+    tick = TickData({'symbol': SYMBOL, 'bid_price': [bid], 'bid_volume': [1], 'ask_price': [ask], 'ask_volume': [1], 'data_depth': 1})
+    exchange = Exchange({SYMBOL: tick}, 5, latency)
+    exchange.add_account('test', balance)
+    return exchange
+
+def place(exchange: Exchange, price: float, volume: float, direction: Direction, offset: Offset = Offset.OPEN,
+          account: str = 'test', timestamp: int = 1):
+    return exchange.place_order({'symbol': SYMBOL, 'price': price, 'volume': volume, 'direction': direction, 'offset': offset,
+                                 'order_type': OrderType.LIMIT, 'timestamp': timestamp}, account)
+
+def trade(exchange: Exchange, price: float, volume: float, direction: Direction, timestamp: int = 1):
+    # historical trade, like Engine.step
+    return exchange.place_order({'symbol': SYMBOL, 'price': price, 'volume': volume, 'direction': direction, 'offset': Offset.OPEN,
+                                 'order_type': OrderType.LIMIT, 'is_history': True, 'timestamp': timestamp}, 'test')
+
+def write_trade_csv(path: str, tape) -> str:
+    '''
+    write a TradeTape as a Bybit trade CSV (timestamp in seconds), read back by DataLoader.iter_trade_chunks
+    '''
+    with open(path, 'w') as f:
+        f.write('timestamp,symbol,side,size,price,tickDirection\n')
+        for t in tape.iter_trades():
+            f.write(f'{t.timestamp / 1000:.3f},{t.symbol},{t.side},{t.size},{t.price},ZeroPlusTick\n')
+    return path
@@ -0,0 +1,42 @@
+import numpy as np
+import benchmark
+from benchmark import build_future, synthetic_trades, compare, SYMBOL, START_PRICE, TICK
+from data_loader import TAPE_COLUMNS
+
+def test_generators_are_seeded():
+    a, b, c = synthetic_trades(500, seed=1), synthetic_trades(500, seed=1), synthetic_trades(500, seed=2)
+    for k in TAPE_COLUMNS:
+        assert np.array_equal(getattr(a, k), getattr(b, k))
+    assert not np.array_equal(a.price, c.price)
+    assert a.symbols == [SYMBOL] and (np.diff(a.timestamp) >= 0).all() and a.side[0] == -1
+
+def test_build_future():
+    future = build_future(5, 4)
+    assert len(future.buy_book) == len(future.sell_book) == 5
+    assert future.best_bid() == round(START_PRICE - TICK, 1) and future.best_ask() == round(START_PRICE + TICK, 1)
+    assert len(future.orders) == 10 # one algo order per level and side
+    level = future.sell_book[future.best_ask()]
+    assert len(level.queue) == 4 and level.has_algo_orders()
+    assert len(build_future(5, 4, algo=False).orders) == 0
+
+def test_micro_benchmarks_count_their_ops():
+    assert benchmark.bench_match(10, 10, 1)['ops'] == benchmark.rounds(100) * 100
+    assert benchmark.bench_cancel(10, 1, 1)['ops'] == benchmark.rounds(20) * 20
+    assert benchmark.bench_snapshot(10, 1, 1, n=10)['ops'] == 10
+
+def test_quick_replay_step_and_batch_agree():
+    current = benchmark.run(quick=True, repeat=1, select='replay/')
+    results = current['results']
+    assert set(results) == {'replay/step', 'replay/batch'}
+    assert results['replay/step']['balance'] == results['replay/batch']['balance'] != 1000000
+    assert all(result['ops'] == 20000 and result['ns_per_op'] > 0 for result in results.values())
+    assert compare(current, current) == []
+
+def test_compare_flags_slowdowns_and_balance_changes():
+    machine = benchmark.machine()
+    def results(**cases):
+        return {'machine': machine, 'quick': True, 'results': cases}
+    baseline = results(a={'ns_per_op': 100}, b={'ns_per_op': 100}, c={'ns_per_op': 100, 'balance': 1.0})
+    current = results(a={'ns_per_op': 115}, b={'ns_per_op': 50}, c={'ns_per_op': 100, 'balance': 2.0}, d={'ns_per_op': 1})
+    assert compare(current, baseline) == ['a', 'c'] # faster and new benchmarks are not regressions
+    assert compare(current, baseline, tolerance=0.2) == ['c']
@@ -0,0 +1,162 @@
+import gc
+import numpy as np
+import pytest
+import simulator
+from constant import Direction, Offset, OrderType
+from data_loader import TradeTape
+from engine import Engine
+from item import OrderData
+from grid_trading import GridTrading
+from subscription import PriceCross, Timer, TopOfBook
+from helpers import SYMBOL, make_exchange, place, trade
+from benchmark import synthetic_trades
+
+def book(future):
+    return ({price: q.total_amount() for price, q in future.buy_book.items()},
+            {price: q.total_amount() for price, q in future.sell_book.items()})
+
+def state(exchange, orders=()):
+    return ({name: (account.balance, {s: dict(p) for s, p in account.position.items()}) for name, account in exchange.accounts.items()},
+            {name: ledger.tolist() for name, ledger in exchange.trade_history.items()},
+            {symbol: book(future) for symbol, future in exchange.futures.items()},
+            dict(exchange.cur_price), exchange.fill_count,
+            [(order.traded, order.status) for order in orders])
+
+def sweep_exchange():
+    # asks 101..110 of history volume, algo asks in the middle of them at 104 and 107
+    exchange = make_exchange(balance=10000)
+    for price in range(102, 111):
+        trade(exchange, price, 1, Direction.SHORT)
+    orders = [place(exchange, 104, 0.5, Direction.SHORT), place(exchange, 107, 2, Direction.SHORT)]
+    return exchange, orders
+
+TRADES = [(108, 5.5, True), (103, 0.2, False), (109, 3, True), (95, 2, False), (100, 0.5, True), (111, 8, True)]
+
+def test_sweep_through_algo_levels_matches_place_order(monkeypatch):
+    exchange, orders = sweep_exchange()
+    n = len(TRADES) * 3
+    trades = TRADES * 3
+    timestamps = list(range(10, 10 + n))
+    count = OrderData.order_count
+    exchange.replay_history([SYMBOL] * n, timestamps, [p for p, _, _ in trades], [s for _, s, _ in trades], [b for _, _, b in trades])
+    bulk, bulk_ids = state(exchange, orders), OrderData.order_count - count
+
+    exchange, orders = sweep_exchange()
+    count = OrderData.order_count
+    for t, (price, size, buy) in zip(timestamps, trades):
+        exchange.place_order({'symbol': SYMBOL, 'price': price, 'volume': size, 'direction': Direction.LONG if buy else Direction.SHORT,
+                              'order_type': OrderType.LIMIT, 'offset': Offset.OPEN, 'is_history': True, 'timestamp': t}, 'test')
+    assert bulk == state(exchange, orders)
+    assert bulk_ids == OrderData.order_count - count # every trade takes an order id
+    assert orders[0].traded == 0.5 and orders[1].traded == 2
+
+@pytest.mark.parametrize('size,processed', [(1.5, 3), (3.5, 2)])
+def test_bulk_kernel_stops_before_algo_levels(size, processed):
+    exchange, orders = sweep_exchange()
+    future = exchange.futures[SYMBOL]
+    # 101 is consumed by the first two buys, the third can only reach the algo ask at 104 if it exhausts 102 and 103
+    # (the history volume at 104 is in front of the algo ask)
+    j = future.replay_history([0, 0, 0], [102, 103, 104], [0.5, 0.5, size], [True] * 3, 0, 3)
+    assert j == processed
+    assert orders[0].traded == 0 and 101 not in future.sell_book
+    if processed == 3:
+        assert 102 not in future.sell_book and future.sell_book[103].total_amount() == 0.5
+        return
+    assert future.sell_book[102].total_amount() == 1
+    # as the first trade of a call it goes through place_order, behind the history volume at 104 it fills the algo ask
+    assert future.replay_history([0], [104], [size], [True], 0, 1) == 1
+    assert orders[0].traded == 0.5 and len(exchange.fills) == 1
+
+class Quoter:
+    # polling strategy that keeps an algo bid and ask a few ticks inside the history book
+    symbol = SYMBOL
+    data_depth = 0
+
+    def __init__(self, engine, offset):
+        self.engine, self.offset, self.orders = engine, offset, []
+
+    def on_tick(self, snapshot, cur_price, timestamp):
+        exchange = self.engine.exchange
+        for order in self.orders:
+            exchange.cancel_order(SYMBOL, order.order_id)
+        self.orders = [self.engine.place_order({'symbol': SYMBOL, 'price': round(cur_price + sign * self.offset, 1), 'volume': 0.05,
+                                                'direction': direction, 'order_type': OrderType.LIMIT, 'offset': Offset.OPEN,
+                                                'timestamp': timestamp}, 'test')
+                       for sign, direction in ((-1, Direction.LONG), (1, Direction.SHORT))]
+
+class Watcher:
+    # event strategy that only records its wake-ups
+    data_depth = 0
+
+    def __init__(self, subscriptions, symbol=SYMBOL):
+        self.subs, self.symbol, self.seen = subscriptions, symbol, []
+
+    def subscriptions(self):
+        return self.subs
+
+    def on_tick(self, snapshot, cur_price, timestamp):
+        self.seen.append((timestamp, cur_price))
+
+def two_symbol_tape(n, seed):
+    a, b = synthetic_trades(n, seed, 'A'), synthetic_trades(n, seed + 1, 'B', start_price=3000.0)
+    order = np.argsort(np.concatenate([a.timestamp, b.timestamp]), kind='stable')
+    columns = {name: np.concatenate([getattr(a, name), getattr(b, name)])[order] for name in ('timestamp', 'price', 'size', 'side')}
+    columns['symbol'] = np.concatenate([np.zeros(n, dtype=np.int16), np.ones(n, dtype=np.int16)])[order]
+    return TradeTape(columns, ['A', 'B'])
+
+def run(batch, make_strategies, tape, latency=0, track=False, chunk=997):
+    engine = Engine()
+    engine.init_exchange(latency, symbols=tape.symbols)
+    engine.exchange.add_account('test', 1000000)
+    trackers = [engine.exchange.track_equity('test', interval=50000)] if track else []
+    strategies = make_strategies(engine)
+    for strategy in strategies:
+        engine.add_strategy(strategy)
+    engine.order_iter, engine.block_iter = tape.iter_trades(chunk), tape.iter_blocks(chunk)
+    gc.collect() # levels of earlier engines fill their algo orders when they are freed, taking order ids
+    count = OrderData.order_count
+    engine.start(batch=batch, history_file=None, progress_bar=False)
+    return (state(engine.exchange), OrderData.order_count - count, [getattr(s, 'seen', None) for s in strategies],
+            [(t.curve, t.mean, t.m2, t.max_drawdown, t.traded_notional) for t in trackers])
+
+def grid(engine, symbol=SYMBOL, mode='long', step=1):
+    strategy = GridTrading(symbol, 91000, 93000, step, step, 0.01, 200, mode=mode)
+    strategy.set_engine(engine)
+    return strategy
+
+CASES = {
+    'history only': lambda engine: [],
+    'polling quotes': lambda engine: [Quoter(engine, 0.3)],
+    'event grid long': lambda engine: [grid(engine)],
+    'event grid neutral': lambda engine: [grid(engine, mode='neutral')],
+    'event grid wide': lambda engine: [grid(engine, step=10)], # the benchmark grid
+    'grid and quotes': lambda engine: [grid(engine, mode='short'), Quoter(engine, 0.5)],
+    'subscriptions': lambda engine: [grid(engine), Watcher([PriceCross(SYMBOL, [91990 + i for i in range(20)]), Timer(3000)]),
+                                     Watcher([TopOfBook(SYMBOL)])],
+}
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_replay_block_matches_step(case):
+    tape = synthetic_trades(3000, seed=3, symbol=SYMBOL)
+    batch = run(True, CASES[case], tape)
+    assert batch == run(False, CASES[case], tape)
+    assert batch[0][4] > 0 or case == 'history only' # algo orders were filled on the way
+
+@pytest.mark.parametrize('latency,track', [(5, False), (0, True), (5000, True)])
+def test_latency_and_equity_samples(latency, track):
+    tape = synthetic_trades(3000, seed=4, symbol=SYMBOL)
+    make = CASES['grid and quotes']
+    assert run(True, make, tape, latency, track) == run(False, make, tape, latency, track)
+
+def test_two_symbols():
+    tape = two_symbol_tape(1500, seed=5)
+    make = lambda engine: [grid(engine, 'A', mode='neutral'), Watcher([TopOfBook('B'), PriceCross('A', [92000])], 'A')]
+    assert run(True, make, tape) == run(False, make, tape)
+
+def test_bulk_path_is_taken(monkeypatch):
+    calls = []
+    replay = simulator.Future.replay_history
+    monkeypatch.setattr(simulator.Future, 'replay_history', lambda self, *args: calls.append(replay(self, *args) - args[4]) or args[4] + calls[-1])
+    tape = synthetic_trades(3000, seed=3, symbol=SYMBOL)
+    (accounts, ledgers, books, prices, fill_count, _), *_ = run(True, CASES['event grid wide'], tape)
+    assert fill_count > 0 and sum(calls) > 2000 # most trades never become an OrderData
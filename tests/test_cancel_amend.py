@@ -0,0 +1,120 @@
+import pytest
+from constant import Direction, Status
+from item import OrderData
+from simulator import OrderQueue
+from helpers import SYMBOL, make_exchange, place, trade
+from test_order_queue import random_ops
+
+def settle(exchange, timestamp: int = 2):
+    exchange.process_trade_data(exchange.update_cur_price(SYMBOL), timestamp)
+
+def test_cancel_keeps_other_algo_orders_at_the_level():
+    # two algo bids at 95 with no history volume there, the market never trades at 95
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    b = place(exchange, 95, 1, Direction.LONG)
+    assert exchange.cancel_order(SYMBOL, a.order_id)
+    settle(exchange)
+    account = exchange.accounts['test']
+    assert account.balance == 1000
+    assert account.position[SYMBOL]['long'] == 0
+    assert b.traded == 0
+    future = exchange.futures[SYMBOL]
+    assert 95 in future.buy_book
+    assert future.get_order(b.order_id) is b
+    assert future.buy_book[95].total_amount() == 1
+
+def test_cancel_last_algo_order_removes_the_level():
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    b = place(exchange, 95, 1, Direction.LONG)
+    assert exchange.cancel_order(SYMBOL, a.order_id)
+    assert exchange.cancel_order(SYMBOL, b.order_id)
+    settle(exchange)
+    assert 95 not in exchange.futures[SYMBOL].buy_book
+    assert exchange.accounts['test'].balance == 1000
+    assert not exchange.orders and not exchange.order_account
+
+def test_cancelled_order_is_skipped_by_matching():
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    b = place(exchange, 95, 1, Direction.LONG)
+    trade(exchange, 95, 1, Direction.LONG) # history bid behind the algo orders
+    exchange.cancel_order(SYMBOL, a.order_id)
+    assert a.status == Status.CANCELLED
+    assert not exchange.cancel_order(SYMBOL, a.order_id)
+    trade(exchange, 95, 0.5, Direction.SHORT, timestamp=2) # fills the algo orders in front of the history bid first
+    assert a.traded == 0
+    assert b.traded == 0.5
+    assert exchange.accounts['test'].position[SYMBOL]['long'] == 0.5
+
+def test_amend_shrink_keeps_queue_position():
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    trade(exchange, 95, 1, Direction.LONG) # history bid behind a
+    amended = exchange.amend_order(SYMBOL, a.order_id, volume=0.4)
+    assert amended is a
+    assert exchange.futures[SYMBOL].buy_book[95].total_amount() == 1.4
+    trade(exchange, 95, 0.4, Direction.SHORT, timestamp=2)
+    assert a.traded == 0.4
+
+def test_amend_price_forgets_the_old_order():
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    amended = exchange.amend_order(SYMBOL, a.order_id, price=96)
+    assert amended is not a
+    assert amended.price == 96 and amended.volume == 1
+    assert a.order_id not in exchange.orders
+    assert a.order_id not in exchange.order_account
+    assert exchange.order_account[amended.order_id] == 'test'
+    assert set(exchange.orders) == {amended.order_id}
+    assert 95 not in exchange.futures[SYMBOL].buy_book
+
+def queued_algo_orders(q):
+    return list(q.next_orders) + [order for _, algo_orders in q.queue for order in algo_orders]
+
+def test_requoting_does_not_pile_up_cancelled_orders():
+    exchange = make_exchange()
+    trade(exchange, 95, 1, Direction.LONG) # history bid keeps the level alive
+    keep = place(exchange, 95, 1, Direction.LONG)
+    for i in range(1000): # re-quote at the same price every tick
+        quote = place(exchange, 95, 1, Direction.LONG, timestamp=i)
+        exchange.cancel_order(SYMBOL, quote.order_id)
+    q = exchange.futures[SYMBOL].buy_book[95]
+    assert q.live_algos == 1 and q.has_algo_orders()
+    assert len(queued_algo_orders(q)) <= 3
+    assert keep in queued_algo_orders(q)
+    exchange.cancel_order(SYMBOL, keep.order_id)
+    assert not q.has_algo_orders()
+
+def test_live_count_follows_fills():
+    exchange = make_exchange()
+    a = place(exchange, 95, 1, Direction.LONG)
+    b = place(exchange, 95, 1, Direction.LONG)
+    trade(exchange, 95, 2, Direction.LONG)
+    q = exchange.futures[SYMBOL].buy_book[95]
+    assert q.live_algos == 2
+    trade(exchange, 95, 1.5, Direction.SHORT, timestamp=2) # a filled, b partially, the history bid keeps the level
+    assert a.traded == 1 and b.traded == 0.5
+    assert q.live_algos == 1 and q.has_algo_orders()
+
+@pytest.mark.parametrize('seed', range(100))
+def test_live_count_matches_the_queue(seed):
+    # random_ops of the OrderQueue equivalence test, the counters are checked after every op
+    q, algos = OrderQueue(100), []
+    for op, arg in random_ops(seed, steps=300):
+        if op in ('history', 'algo'):
+            order = OrderData({'volume': arg, 'is_history': op == 'history', 'traded': 0})
+            if op == 'algo':
+                algos.append(order)
+            q.add_order(order)
+        elif op == 'match':
+            q.match_order(arg)
+        elif op == 'cancel_data':
+            q.cancel_data_order(arg)
+        elif algos[arg].status != Status.CANCELLED and algos[arg] in queued_algo_orders(q): # Future.orders only holds queued orders
+            q.cancel_algo_order(algos[arg])
+        queued = queued_algo_orders(q)
+        live = [order for order in queued if order.status != Status.CANCELLED]
+        assert q.live_algos == len(live)
+        assert q.cancelled_algos == len(queued) - len(live)
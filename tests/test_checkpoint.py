@@ -0,0 +1,59 @@
+import gc
+from benchmark import synthetic_trades
+from engine import Engine
+from grid_trading import GridTrading
+from item import OrderData
+
+TAPE = synthetic_trades(6000, seed=1, symbol='BTCUSDT')
+SPLIT = 3000
+
+def new_engine() -> Engine:
+    engine = Engine()
+    engine.init_exchange()
+    engine.exchange.add_account('test', 1000000)
+    strategy = GridTrading('BTCUSDT', 91000, 93000, 10, 10, 0.1, 200)
+    strategy.set_engine(engine)
+    engine.set_strategy(strategy)
+    return engine
+
+def result(engine: Engine):
+    account = engine.exchange.accounts['test']
+    ledger = engine.exchange.trade_history['test']
+    return account.balance, dict(account.position['BTCUSDT']), ledger.column('balance').tolist(), ledger.column('timestamp').tolist()
+
+def uninterrupted():
+    engine = new_engine()
+    engine.replay_block(TAPE)
+    return result(engine)
+
+def checkpoint_at_split() -> bytes:
+    engine = new_engine()
+    engine.replay_block(TAPE.take(slice(0, SPLIT)))
+    return engine.checkpoint()
+
+def test_restore_continues_like_uninterrupted_run():
+    expected = uninterrupted()
+    assert len(expected[2]) > 0 # the grid traded
+    engine = Engine()
+    engine.restore(checkpoint_at_split())
+    engine.replay_block(TAPE.take(slice(SPLIT, len(TAPE))))
+    assert result(engine) == expected
+
+def test_restore_into_used_engine():
+    expected = uninterrupted()
+    engine = new_engine()
+    engine.replay_block(TAPE.take(slice(0, SPLIT)))
+    data = engine.checkpoint()
+    engine.replay_block(TAPE.take(slice(SPLIT, len(TAPE)))) # run past the checkpoint, algo orders rest in the old books
+    assert any(future.orders for future in engine.exchange.futures.values())
+    old_strategy = engine.strategy
+    gc.collect() # engines left by other tests trade when they are freed, keep them out of the count
+    order_count = OrderData.order_count
+    engine.restore(data)
+    gc.collect()
+    # freeing the old books must not make the old strategy trade in the restored exchange
+    assert OrderData.order_count == order_count
+    assert old_strategy.eng is None
+    assert engine.strategy is not old_strategy and engine.strategy.eng is engine
+    engine.replay_block(TAPE.take(slice(SPLIT, len(TAPE))))
+    assert result(engine) == expected
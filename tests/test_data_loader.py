@@ -0,0 +1,103 @@
+import heapq
+import os
+from operator import attrgetter
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_trades
+from data_loader import TAPE_COLUMNS, DataLoader, TradeTape, merge_trade_blocks
+from helpers import write_trade_csv
+
+TAPE = synthetic_trades(500, seed=3, symbol='BTCUSDT')
+
+@pytest.fixture
+def csv_file(tmp_path):
+    return write_trade_csv(str(tmp_path / 'BTCUSDT2024-11-27.csv'), TAPE)
+
+def read_whole(filename, opts):
+    # DataLoader.load_data before chunked reading : read everything, then head / filter
+    df = pd.read_csv(filename).head(opts.get('head_num', 10))
+    df['timestamp'] = (round(df['timestamp'] * 1000)).astype(int)
+    if 'start_timestamp' in opts:
+        df = df[df['timestamp'] > opts['start_timestamp']]
+    if 'end_timestamp' in opts:
+        df = df[df['timestamp'] < opts['end_timestamp']]
+    return df
+
+OPTS = [{}, {'head_num': 300}, {'head_num': 300, 'chunk_size': 7},
+        {'head_num': 500, 'chunk_size': 64, 'start_timestamp': int(TAPE.timestamp[40]), 'end_timestamp': int(TAPE.timestamp[350])},
+        {'head_num': 500, 'chunk_size': 1000, 'end_timestamp': int(TAPE.timestamp[0])}]
+
+@pytest.mark.parametrize('opts', OPTS)
+def test_chunked_load_matches_whole_file(csv_file, opts):
+    expected = read_whole(csv_file, opts)
+    df = DataLoader().load_data(csv_file, 'BTCUSDT', opts)
+    assert len(df) == len(expected)
+    for column in ['timestamp', 'symbol', 'side', 'size', 'price']:
+        assert df[column].tolist() == expected[column].tolist()
+
+@pytest.mark.parametrize('opts', OPTS)
+def test_iter_trades_matches_chunks(csv_file, opts):
+    trades = list(DataLoader().iter_trades(csv_file, 'BTCUSDT', opts))
+    expected = read_whole(csv_file, opts)
+    assert [t.timestamp for t in trades] == expected['timestamp'].tolist()
+    assert [(t.side, t.size, t.price) for t in trades] == list(zip(expected['side'], expected['size'], expected['price']))
+
+def test_reading_stops_at_end_timestamp(csv_file):
+    # the file is in time order, chunks after end_timestamp are never parsed (the broken last row would raise)
+    with open(csv_file, 'a') as f:
+        f.write('not a number,BTCUSDT,Buy,x,y,ZeroPlusTick\n')
+    loader = DataLoader()
+    chunks = loader.iter_trade_chunks(csv_file, 'BTCUSDT', {'head_num': None, 'chunk_size': 50, 'end_timestamp': int(TAPE.timestamp[60])})
+    assert sum(len(df) for df in chunks) == 60
+
+def test_tape_save_open_round_trip(tmp_path):
+    path = TAPE.save(str(tmp_path / 'bench.tape'))
+    tape = TradeTape.open(path)
+    assert len(tape) == len(TAPE) and tape.symbols == TAPE.symbols and tape.is_sorted
+    for column in TAPE_COLUMNS:
+        assert np.array_equal(getattr(tape, column), getattr(TAPE, column))
+    assert list(tape.iter_trades(chunk_size=64)) == list(TAPE.iter_trades())
+
+@pytest.mark.parametrize('opts', OPTS)
+def test_cached_tape_matches_csv(csv_file, opts):
+    loader = DataLoader()
+    from_csv = list(loader.iter_trades(csv_file, 'BTCUSDT', opts))
+    from_tape = list(loader.iter_trades(csv_file, 'BTCUSDT', {**opts, 'cache': True}))
+    assert from_tape == from_csv
+    blocks = list(loader.iter_trade_blocks(csv_file, 'BTCUSDT', {**opts, 'cache': True}))
+    assert sum(len(block) for block in blocks) == len(from_csv)
+
+def test_cache_is_rebuilt_when_the_csv_changes(csv_file, monkeypatch):
+    loader = DataLoader()
+    conversions = []
+    convert = loader.convert_trade_tape
+    monkeypatch.setattr(loader, 'convert_trade_tape', lambda *args: conversions.append(args) or convert(*args))
+    opts = {'head_num': None, 'cache': True}
+    assert len(loader.load_trade_tape(csv_file, opts)) == len(TAPE)
+    assert len(loader.load_trade_tape(csv_file, opts)) == len(TAPE)
+    assert len(conversions) == 1 # reused
+    other = synthetic_trades(200, seed=4, symbol='BTCUSDT')
+    write_trade_csv(csv_file, other) # new content and size
+    tape = loader.load_trade_tape(csv_file, opts)
+    assert len(conversions) == 2
+    assert np.array_equal(tape.price, other.price)
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9)) # same size, touched
+    loader.load_trade_tape(csv_file, opts)
+    assert len(conversions) == 3
+
+def tied_tape(n, seed, symbol, coarse):
+    # timestamps rounded to coarse ms, so the streams share many timestamps
+    tape = synthetic_trades(n, seed, symbol)
+    columns = {k: getattr(tape, k) for k in TAPE_COLUMNS}
+    columns['timestamp'] = columns['timestamp'] // coarse * coarse
+    return TradeTape(columns, tape.symbols)
+
+@pytest.mark.parametrize('chunks', [(1, 1, 1), (7, 50, 3), (1000, 1000, 1000), (64, 5, 200)])
+def test_merge_trade_blocks_matches_heapq_merge(chunks):
+    tapes = [tied_tape(400, 1, 'A', 50), tied_tape(300, 2, 'B', 200), tied_tape(100, 3, 'C', 1).take(slice(0, 0)), tied_tape(250, 4, 'D', 1000)]
+    merged = [trade for block in merge_trade_blocks([tape.iter_blocks(c) for tape, c in zip(tapes, chunks + (9,))])
+              for trade in block.iter_trades()]
+    expected = list(heapq.merge(*[tape.iter_trades() for tape in tapes], key=attrgetter('timestamp')))
+    assert merged == expected
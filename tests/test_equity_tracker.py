@@ -0,0 +1,32 @@
+import math
+from types import SimpleNamespace
+import pytest
+from equity_tracker import EquityTracker
+
+def account(balance, long=0.0, short=0.0):
+    return SimpleNamespace(balance=balance, position={'BTCUSDT': {'long': long, 'short': short}})
+
+def test_drawdown_and_sharpe_by_hand():
+    tracker = EquityTracker('test', interval=1000, periods_per_year=4)
+    # (timestamp, equity) : 100 in interval 0, 110 in 1, nothing in 2, 99 in 3, nothing in 4 and 5, 108.9 in 6
+    samples = [(500, account(100.0)), (1200, account(10.0, long=1)), (3100, account(0.0, long=1)), (6000, account(-1.1, long=1))]
+    prices = {500: 100.0, 1200: 100.0, 3100: 99.0, 6000: 110.0}
+    for timestamp, acc in samples:
+        assert timestamp >= tracker.next_time
+        tracker.sample(acc, {'BTCUSDT': prices[timestamp]}, timestamp)
+    # returns 0.1, 0, -0.1, 0, 0, 0.1 : the skipped intervals are counted by interval boundaries, not by elapsed time
+    assert tracker.returns == 6
+    mean = 0.1 / 6
+    std = math.sqrt((0.03 - 6 * mean ** 2) / 5)
+    assert tracker.mean == pytest.approx(mean)
+    assert tracker.sharpe == pytest.approx(mean / std * 2)
+    assert tracker.curve == [(500, 100.0), (1200, 110.0), (3100, 99.0), (6000, pytest.approx(108.9))]
+    report = tracker.report()
+    assert report['peak'] == 110.0 and report['equity'] == pytest.approx(108.9)
+    assert report['max_drawdown'] == pytest.approx(11.0) and report['max_drawdown_pct'] == pytest.approx(0.1)
+
+def test_flat_equity_has_no_sharpe():
+    tracker = EquityTracker('test', interval=10)
+    for timestamp in (0, 10, 50):
+        tracker.sample(account(100.0), {}, timestamp)
+    assert tracker.returns == 5 and tracker.sharpe == 0.0 and tracker.max_drawdown == 0.0
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from gm_strategy import GMPositionSizer
+
+def inverse_gm11(data):
+    # the textbook GM(1,1) : AGO, least squares through inv(B.T @ B), inverse AGO of f(n)
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    x1 = np.cumsum(data)
+    z1 = 0.5 * (x1[:-1] + x1[1:])
+    B = np.column_stack((-z1, np.ones(n - 1)))
+    a, b = np.linalg.inv(B.T @ B) @ B.T @ data[1:]
+    return (data[0] - b / a) * np.exp(-a * n) + b / a - x1[-1]
+
+def sizer(history_length=10):
+    return GMPositionSizer('BTCUSDT', history_length, 0.5, [0.1, 0.5, 1.0], 200)
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('history_length', [4, 10, 50])
+def test_prediction_matches_the_inverse(seed, history_length):
+    rng = np.random.default_rng(seed)
+    prices = 92000 + np.cumsum(rng.normal(0, 5, 300))
+    s = sizer(history_length)
+    for i, price in enumerate(prices):
+        s.get_optimal_position_size('buy', price, 1e9, 0)
+        if i + 1 >= history_length:
+            assert s.predict_gm11() == pytest.approx(inverse_gm11(prices[i + 1 - history_length:i + 1]), rel=1e-6)
+
+def test_short_history_returns_the_last_price():
+    s = sizer(3)
+    for price in (100.0, 101.0, 103.0):
+        s.get_optimal_position_size('buy', price, 1e9, 0)
+    assert s.predict_gm11() == 103.0
+
+def test_constant_price_returns_the_last_price():
+    s = sizer(5)
+    for _ in range(8):
+        result = s.get_optimal_position_size('sell', 100.0, 1e9, 10)
+    assert s.predict_gm11() == 100.0 # singular normal equations, no exception
+    assert result['action'] == 'sell'
+
+def test_best_option_follows_the_prediction():
+    s = sizer(10)
+    rising = [100.0 * 1.01 ** i for i in range(10)]
+    for price in rising[:-1]:
+        s.get_optimal_position_size('buy', price, 1e9, 0)
+    result = s.get_optimal_position_size('buy', rising[-1], 1e9, 0)
+    assert s.predict_gm11() > rising[-1]
+    assert result['action'] == 'buy' and result['amount'] in s.trading_options
+    assert s.get_optimal_position_size('buy', rising[-1], 0, 0) is None # nothing affordable
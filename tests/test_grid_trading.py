@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+import pytest
+from engine import Engine
+from grid_trading import GridTrading, IDLE, COVER, LONG, SHORT
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+
+class Paper(GridTrading):
+    # records the orders instead of sending them, fills are triggered by the test
+    def __init__(self, mode):
+        super().__init__(SYMBOL, 100, 110, 2, 1, 0.5, 200, mode=mode) # lines 100, 102, ..., 110, five cells
+        self.sent, self.callbacks = [], {}
+
+    def get_account(self):
+        return SimpleNamespace(balance=1e9)
+
+    def send(self, kind, price, callback):
+        self.sent.append((kind, price))
+        order = SimpleNamespace(order_id=len(self.sent))
+        self.callbacks[order.order_id] = callback
+        return order
+
+    def buy(self, symbol, price, volume, timestamp, callback=None):
+        return self.send('buy', price, callback)
+
+    def sell(self, symbol, price, volume, timestamp, callback=None):
+        return self.send('sell', price, callback)
+
+    def short(self, symbol, price, volume, timestamp, callback=None):
+        return self.send('short', price, callback)
+
+    def cover(self, symbol, price, volume, timestamp, callback=None):
+        return self.send('cover', price, callback)
+
+    def fill(self, cell):
+        self.callbacks.pop(int(self.order_id[cell]))()
+
+    def tick(self, price):
+        start = len(self.sent)
+        self.on_tick(None, price, 0)
+        return self.sent[start:]
+
+def test_long_grid():
+    grid = Paper('long')
+    assert grid.tick(100.5) == [('buy', 100.0)]
+    assert grid.tick(107) == [('buy', 102.0), ('buy', 104.0), ('buy', 106.0)] # every crossed cell, in price order
+    grid.fill(0)
+    assert grid.sent[-1] == ('sell', 101.0) and grid.state[0] == COVER
+    grid.fill(0)
+    assert grid.state[0] == IDLE and grid.order_id[0] == -1
+    assert grid.tick(100.5) == [('buy', 100.0)] # the idle cell is entered again
+    assert grid.tick(99) == grid.tick(113) == [] # out of range
+
+def test_short_grid():
+    grid = Paper('short')
+    assert grid.tick(100.5) == [('short', 102.0)]
+    assert grid.tick(107) == [('short', 104.0), ('short', 106.0), ('short', 108.0)]
+    grid.fill(3)
+    assert grid.sent[-1] == ('cover', 107.0)
+    assert (grid.side == SHORT).all()
+
+def test_neutral_grid():
+    grid = Paper('neutral')
+    assert grid.tick(100.5) == [('buy', 100.0)] # no direction yet
+    assert grid.tick(107) == [('short', 104.0), ('short', 106.0), ('short', 108.0)] # rising through cells 1..3
+    for cell in (1, 2):
+        grid.fill(cell)
+    assert grid.sent[-2:] == [('cover', 103.0), ('cover', 105.0)]
+    for cell in (1, 2):
+        grid.fill(cell)
+    assert grid.tick(100.5) == [('buy', 104.0), ('buy', 102.0)] # falling, closest cell first
+    assert grid.side.tolist() == [LONG, LONG, LONG, SHORT, LONG]
+    grid.fill(2)
+    assert grid.sent[-1] == ('sell', 105.0)
+
+@pytest.mark.parametrize('mode', ['long', 'short', 'neutral'])
+def test_positions_follow_the_covered_cells(mode):
+    engine = Engine()
+    engine.symbol = SYMBOL
+    engine.init_exchange()
+    engine.exchange.add_account('test', 1000000)
+    tape = synthetic_trades(5000, seed=9)
+    engine.order_iter, engine.block_iter = tape.iter_trades(1000), tape.iter_blocks(1000)
+    grid = GridTrading(SYMBOL, START_PRICE - 500, START_PRICE + 500, 5, 5, 0.01, 200, mode=mode)
+    grid.set_engine(engine)
+    engine.set_strategy(grid)
+    engine.start(batch=True, history_file=None, progress_bar=False)
+    position = engine.exchange.accounts['test'].position[SYMBOL]
+    covered = grid.state == COVER # entry filled, exit resting
+    assert position['long'] == pytest.approx(0.01 * (covered & (grid.side == LONG)).sum(), abs=1e-9)
+    assert position['short'] == pytest.approx(0.01 * (covered & (grid.side == SHORT)).sum(), abs=1e-9)
+    assert len(engine.exchange.trade_history['test']) > 2 * covered.sum() # cells went round trip
+    if mode == 'long':
+        assert position['short'] == 0 and position['long'] > 0
+    elif mode == 'short':
+        assert position['long'] == 0 and position['short'] > 0
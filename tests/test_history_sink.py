@@ -0,0 +1,127 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+import history_sink
+from history_sink import CSVSink, NpySink, HistorySink, open_sink
+from simulator import LEDGER_COLUMNS
+from engine import Engine
+from grid_trading import GridTrading
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+
+def chunk(rows, start=0):
+    i = np.arange(start, start + rows)
+    return {'timestamp': i * 1000, 'symbol': np.array(['BTCUSDT' if k % 3 else 'ETHUSDT' for k in i], dtype=object),
+            'balance': 1000 + i / 7, 'long': i * 0.1, 'short': i * 0.01, 'account_value': 1000 + i / 3, 'price': 90000 + i / 11}
+
+def concat(chunks):
+    return {name: np.concatenate([c[name] for c in chunks]) for name in LEDGER_COLUMNS}
+
+def read_back(path):
+    if path.endswith('.csv'):
+        frame = pd.read_csv(path, float_precision='round_trip') # csv.writer writes repr(float)
+    elif path.endswith('.npy'):
+        frame = pd.DataFrame(np.load(path))
+    else:
+        frame = pd.read_parquet(path)
+    assert list(frame.columns) == LEDGER_COLUMNS
+    return {name: frame[name].to_numpy() for name in LEDGER_COLUMNS}
+
+EXTS = ['.csv', '.npy', pytest.param('.parquet', marks=pytest.mark.skipif(history_sink.pyarrow is None, reason='needs pyarrow'))]
+
+@pytest.mark.parametrize('background', [True, False])
+@pytest.mark.parametrize('ext', EXTS)
+def test_round_trip(tmp_path, ext, background):
+    path = str(tmp_path / f'history{ext}')
+    chunks = [chunk(5), chunk(0, 5), chunk(1, 5), chunk(37, 6)]
+    sink = open_sink(path, background=background, max_pending=2)
+    for c in chunks:
+        sink.write(c)
+    sink.close()
+    assert sink.rows == 43
+    expected, got = concat(chunks), read_back(path)
+    for name in LEDGER_COLUMNS:
+        if name == 'symbol':
+            assert got[name].tolist() == expected[name].tolist()
+        else:
+            assert np.array_equal(got[name], expected[name]) # bit for bit
+
+@pytest.mark.parametrize('rows', [0, 1, 1000])
+def test_npy_header_is_rewritten_on_close(tmp_path, rows):
+    path = str(tmp_path / 'history.npy')
+    sink = NpySink(path, background=False)
+    sink.write(chunk(rows))
+    sink.close()
+    with open(path, 'rb') as f:
+        assert np.lib.format.read_magic(f) == (1, 0)
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        assert f.tell() == sink.header_size and sink.header_size % 64 == 0
+    assert shape == (rows,) and not fortran and dtype == history_sink.NPY_DTYPE
+    assert len(np.load(path)) == rows
+
+class SlowSink(HistorySink):
+    # the writer thread waits for release before it writes anything
+    def __init__(self, **kwargs):
+        self.release = threading.Event()
+        self.written = []
+        super().__init__('slow', **kwargs)
+
+    def _write(self, chunk):
+        self.release.wait()
+        self.written.append(len(chunk['timestamp']))
+
+def test_full_queue_blocks_the_writer():
+    sink = SlowSink(max_pending=2)
+    for i in range(3): # one chunk taken by the writer thread, two queued
+        sink.write(chunk(i + 1))
+    blocked = threading.Thread(target=sink.write, args=(chunk(4),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive() and sink.waits >= 1
+    sink.release.set()
+    blocked.join()
+    sink.close()
+    assert sink.written == [1, 2, 3, 4]
+
+def test_unbounded_queue_never_blocks():
+    sink = SlowSink(max_pending=None)
+    for i in range(50):
+        sink.write(chunk(1))
+    assert sink.waits == 0
+    sink.release.set()
+    sink.close()
+    assert len(sink.written) == 50
+    with pytest.raises(ValueError):
+        SlowSink(max_pending=0)
+
+def test_writer_errors_are_raised_on_close(tmp_path):
+    class Broken(CSVSink):
+        def _write(self, chunk):
+            raise OSError('disk full')
+    sink = Broken(str(tmp_path / 'history.csv'), max_pending=1)
+    for i in range(5): # the writer keeps draining, write() does not hang
+        sink.write(chunk(2))
+    with pytest.raises(OSError, match='disk full'):
+        sink.close()
+
+@pytest.mark.parametrize('ext', ['.csv', '.npy'])
+def test_streamed_history_matches_the_ledger(tmp_path, ext):
+    def run(history_file):
+        engine = Engine()
+        engine.symbol = SYMBOL
+        engine.init_exchange()
+        engine.exchange.add_account('test', 1000000)
+        tape = synthetic_trades(3000, seed=6)
+        engine.block_iter = tape.iter_blocks(500)
+        strategy = GridTrading(SYMBOL, START_PRICE - 1000, START_PRICE + 1000, 10, 10, 0.1, 200)
+        strategy.set_engine(engine)
+        engine.set_strategy(strategy)
+        engine.start(batch=True, history_file=history_file, progress_bar=False)
+        return engine
+    ledger = run(None).exchange.trade_history['test'].drain()
+    path = str(tmp_path / f'history{ext}')
+    run(open_sink(path, chunk_rows=7))
+    got = read_back(path)
+    assert len(ledger['timestamp']) > 7 # several chunks
+    for name in LEDGER_COLUMNS:
+        assert got[name].tolist() == ledger[name].tolist()
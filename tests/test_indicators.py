@@ -0,0 +1,111 @@
+import math
+import numpy as np
+import pytest
+from indicators import SMA, EMA, RollingStd, ReturnStd, VWAP
+from metabolic_gm11 import MetabolicGM11, gm11_params
+from gm_strategy import GMPositionSizer
+from gm_debug import GMStrategy
+
+def prices(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    return (92000 + np.cumsum(rng.normal(0, 20, n))).tolist()
+
+def feed(indicator, values):
+    return [indicator.update(x) for x in values]
+
+# resync = 7 also checks that recomputing the sums from the buffer changes nothing
+@pytest.mark.parametrize('resync', [7, 1000])
+@pytest.mark.parametrize('period', [1, 5, 30])
+def test_sma(period, resync):
+    xs = prices()
+    got = feed(SMA(period, resync), xs)
+    for i, value in enumerate(got):
+        if i + 1 < period:
+            assert value is None
+        else:
+            assert value == pytest.approx(np.mean(xs[i + 1 - period:i + 1]), rel=1e-12)
+
+@pytest.mark.parametrize('period', [1, 5, 30])
+def test_ema(period):
+    xs = prices()
+    alpha, expected = 2 / (period + 1), xs[0]
+    for i, value in enumerate(feed(EMA(period), xs)):
+        if i:
+            expected = alpha * xs[i] + (1 - alpha) * expected
+        assert value == pytest.approx(expected, rel=1e-12)
+
+@pytest.mark.parametrize('resync', [7, 1000])
+@pytest.mark.parametrize('period', [1, 5, 30])
+def test_rolling_std(period, resync):
+    xs = prices()
+    for i, value in enumerate(feed(RollingStd(period, resync), xs)):
+        if i + 1 < period:
+            assert value is None
+        else:
+            assert value == pytest.approx(np.std(xs[i + 1 - period:i + 1]), rel=1e-6, abs=1e-9)
+
+def test_rolling_std_nan_enters_and_leaves_the_window():
+    xs = prices(60)
+    xs[20], xs[25] = math.nan, math.inf
+    got = feed(RollingStd(5), xs)
+    for i in range(4, 60):
+        with np.errstate(invalid='ignore'): # inf - inf
+            expected = np.std(xs[i - 4:i + 1])
+        assert math.isnan(got[i]) if math.isnan(expected) else got[i] == pytest.approx(expected, rel=1e-6)
+
+@pytest.mark.parametrize('period', [1, 9])
+def test_return_std(period):
+    xs = prices()
+    got = feed(ReturnStd(period), xs)
+    assert got[0] is None
+    for i in range(period, len(xs)):
+        window = np.array(xs[i - period:i + 1])
+        assert got[i] == pytest.approx(np.std(np.diff(window) / window[:-1]), rel=1e-6, abs=1e-9)
+
+@pytest.mark.parametrize('resync', [7, 1000])
+def test_vwap(resync):
+    rng = np.random.default_rng(1)
+    xs, vs = prices(), rng.lognormal(0, 1, 400).tolist()
+    vwap = VWAP(10, resync)
+    for i, (p, v) in enumerate(zip(xs, vs)):
+        value = vwap.update(p, v)
+        if i >= 9:
+            assert value == pytest.approx(np.dot(xs[i - 9:i + 1], vs[i - 9:i + 1]) / sum(vs[i - 9:i + 1]), rel=1e-12)
+
+def inverse_params(window):
+    # least squares through inv(B.T @ B), the reference for the closed form
+    window = np.asarray(window, dtype=np.float64)
+    x1 = np.cumsum(window)
+    z = 0.5 * (x1[:-1] + x1[1:])
+    B = np.column_stack((-z, np.ones(len(window) - 1)))
+    return np.linalg.inv(B.T @ B) @ B.T @ window[1:]
+
+@pytest.mark.parametrize('resync', [5, 1000])
+@pytest.mark.parametrize('window_size', [4, 12])
+def test_metabolic_gm11(window_size, resync):
+    xs = prices(200, seed=3)
+    gm = MetabolicGM11(window_size, resync)
+    batch = gm.predict_batch(xs)
+    a, b = gm11_params(np.lib.stride_tricks.sliding_window_view(np.array(xs), window_size))
+    for i, x in enumerate(xs):
+        prediction = gm.update(x)
+        if i + 1 < window_size:
+            continue
+        ref_a, ref_b = inverse_params(xs[i + 1 - window_size:i + 1])
+        assert (gm.a, gm.b) == pytest.approx((ref_a, ref_b), rel=1e-6)
+        assert (a[i + 1 - window_size], b[i + 1 - window_size]) == pytest.approx((ref_a, ref_b), rel=1e-6)
+        # (x0 - b/a) * (exp(-ak) - exp(-a(k-1))) magnifies the rounding of a
+        assert prediction == pytest.approx(batch[i + 1 - window_size], rel=1e-6)
+
+@pytest.mark.parametrize('history_length', [0, 1])
+def test_gm_history_length_is_validated(history_length):
+    with pytest.raises(ValueError):
+        GMPositionSizer('BTCUSDT', history_length, 0.5, [0.1], 200)
+    with pytest.raises(ValueError):
+        GMStrategy('BTCUSDT', history_length, 0.5, [0.1], 200, short_ma_period=1, long_ma_period=1)
+
+def test_gm_smallest_history_length():
+    s = GMPositionSizer('BTCUSDT', 2, 0.5, [0.1], 200)
+    assert s.get_optimal_position_size('buy', 100.0, 1e6, 0) is None
+    assert s.get_optimal_position_size('buy', 101.0, 1e6, 0)['action'] == 'buy'
+    assert s.calculate_risk() == 0.0 # the std of a single return
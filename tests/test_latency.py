@@ -0,0 +1,76 @@
+from constant import Direction, Status
+from helpers import SYMBOL, make_exchange, place, trade
+
+def test_order_reaches_the_book_after_latency():
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    future = exchange.futures[SYMBOL]
+    assert future.get_order(order.order_id) is None
+    assert order.order_id in exchange.pending_orders
+    exchange.advance_time(1099)
+    assert future.get_order(order.order_id) is None
+    exchange.advance_time(1100)
+    assert future.get_order(order.order_id) is order
+    assert order.timestamp == 1100 # stamped with its activation time
+    assert exchange.order_account[order.order_id] == 'test'
+    assert not exchange.pending_orders
+
+def test_cancel_in_flight_never_reaches_the_book():
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    exchange.current_time = 1050
+    assert exchange.cancel_order(SYMBOL, order.order_id)
+    exchange.advance_time(1100) # the order is released, the cancel is still in flight
+    assert exchange.futures[SYMBOL].get_order(order.order_id) is order
+    exchange.advance_time(1150)
+    assert exchange.futures[SYMBOL].get_order(order.order_id) is None
+    assert order.status == Status.CANCELLED
+    assert order.order_id not in exchange.orders
+
+def test_cancel_before_release_drops_the_order():
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    exchange._cancel_order(SYMBOL, order.order_id) # a cancel that arrives before the order
+    exchange.advance_time(2000)
+    assert order.status == Status.CANCELLED
+    assert exchange.futures[SYMBOL].get_order(order.order_id) is None
+    assert 95 not in exchange.futures[SYMBOL].buy_book
+
+def test_requests_are_released_in_time_order():
+    delays = {}
+    exchange = make_exchange(latency=lambda order: delays[order.price])
+    delays[95] = 300
+    late = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    delays[94] = 100
+    early = place(exchange, 94, 1, Direction.LONG, timestamp=1000)
+    released = []
+    future = exchange.futures[SYMBOL]
+    for now in (1100, 1300):
+        exchange.advance_time(now)
+        released.append([o.order_id for o in (late, early) if future.get_order(o.order_id) is not None])
+    assert released == [[early.order_id], [late.order_id, early.order_id]]
+
+def test_amend_in_flight_changes_the_submitted_order():
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    exchange._amend_order(SYMBOL, order.order_id, price=96, volume=0.5)
+    exchange.advance_time(1100)
+    assert exchange.futures[SYMBOL].buy_book[96].total_amount() == 0.5
+
+def test_replayed_trades_release_pending_orders():
+    # the bid is released at 1100 before the sell at 1100 is matched, the sell trades through its level
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    exchange.replay_history([SYMBOL], [1099], [96], [0.5], [False]) # rests as an ask above the bid
+    assert order.traded == 0
+    exchange.replay_history([SYMBOL], [1100], [95], [0.5], [False])
+    assert order.traded == 1
+    assert exchange.accounts['test'].position[SYMBOL]['long'] == 1
+
+def test_released_order_is_matched_by_later_trades():
+    exchange = make_exchange(latency=100)
+    order = place(exchange, 95, 1, Direction.LONG, timestamp=1000)
+    exchange.advance_time(1100)
+    trade(exchange, 95, 1, Direction.SHORT, timestamp=1100)
+    assert order.traded == 1
+    assert exchange.accounts['test'].position[SYMBOL]['long'] == 1
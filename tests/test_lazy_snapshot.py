@@ -0,0 +1,81 @@
+from constant import Direction
+from engine import Engine
+from item import TickData
+from simulator import Exchange
+from helpers import trade
+from benchmark import synthetic_trades
+
+def two_symbol_exchange() -> Exchange:
+    tick = lambda symbol: TickData({'symbol': symbol, 'bid_price': [90, 89], 'bid_volume': [1, 2], 'ask_price': [101, 102],
+                                    'ask_volume': [3, 4], 'data_depth': 2})
+    return Exchange({'BTCUSDT': tick('BTCUSDT'), 'ETHUSDT': tick('ETHUSDT')}, 5)
+
+def count_snapshots(exchange, monkeypatch):
+    built = []
+    for symbol, future in exchange.futures.items():
+        snapshot = future.snapshot
+        monkeypatch.setattr(future, 'snapshot', lambda depth=None, symbol=symbol, snapshot=snapshot: built.append(symbol) or snapshot(depth))
+    return built
+
+def test_only_read_symbols_are_built(monkeypatch):
+    exchange = two_symbol_exchange()
+    built = count_snapshots(exchange, monkeypatch)
+    snapshot = exchange.lazy_snapshot()
+    assert built == []
+    assert sorted(snapshot) == ['BTCUSDT', 'ETHUSDT'] and len(snapshot) == 2 # iterating does not build ticks
+    assert built == []
+    tick = snapshot['ETHUSDT']
+    assert snapshot['ETHUSDT'] is tick
+    assert built == ['ETHUSDT']
+
+def test_tick_reflects_the_book_at_first_read():
+    exchange = two_symbol_exchange()
+    exchange.add_account('test')
+    snapshot = exchange.lazy_snapshot()
+    trade(exchange, 95, 1, Direction.LONG) # a new best bid before the first read
+    tick = snapshot['BTCUSDT']
+    assert tick.bid_price.tolist() == [95, 90]
+    trade(exchange, 96, 1, Direction.LONG) # after the first read the tick does not change
+    assert snapshot['BTCUSDT'].bid_price.tolist() == [95, 90]
+    assert exchange.lazy_snapshot()['BTCUSDT'].bid_price.tolist() == [96, 95]
+
+class Recorder:
+    # polling strategy that keeps what it reads from the snapshot
+    data_depth = 3
+
+    def __init__(self, read: bool):
+        self.read = read
+        self.seen = []
+
+    def on_tick(self, snapshot, cur_price, timestamp):
+        if self.read:
+            tick = snapshot['BTCUSDT']
+            self.seen.append((timestamp, cur_price, tick.bid_price.tolist(), tick.ask_price.tolist(), tick.ask_volume.tolist()))
+        else:
+            self.seen.append((timestamp, cur_price))
+
+def run_steps(monkeypatch, read: bool, lazy: bool):
+    engine = Engine()
+    engine.init_exchange()
+    engine.exchange.add_account('test')
+    tape = synthetic_trades(400, seed=7, symbol='BTCUSDT')
+    engine.streams = {}
+    engine.order_iter = tape.iter_trades()
+    if not lazy: # an eager snapshot of every symbol, as Engine.step did before
+        monkeypatch.setattr(engine.exchange, 'lazy_snapshot', engine.exchange.snapshot)
+    built = count_snapshots(engine.exchange, monkeypatch)
+    strategy = Recorder(read)
+    engine.set_strategy(strategy)
+    while engine.step() is not None:
+        pass
+    return strategy.seen, built
+
+def test_lazy_steps_match_eager_snapshots(monkeypatch):
+    lazy, lazy_built = run_steps(monkeypatch, True, True)
+    eager, eager_built = run_steps(monkeypatch, True, False)
+    assert lazy == eager and len(lazy) > 0
+    assert len(lazy_built) == len(lazy) < len(eager_built) # built only for the wake-ups
+
+def test_no_snapshot_when_the_strategy_does_not_read(monkeypatch):
+    seen, built = run_steps(monkeypatch, False, True)
+    assert len(seen) > 0 and built == []
@@ -0,0 +1,59 @@
+import json, os
+import pytest
+from benchmark import synthetic_ob500
+from data_loader import DataLoader
+
+REAL_FEED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '2024-11-27_BTCUSDT_ob500_truncated.data')
+
+def reference_book(file_path, data_depth):
+    '''
+    the feed replayed with plain dicts and a full sort after every message, as process_order_book did before
+    '''
+    bids, asks, ticks = {}, {}, []
+    with open(file_path) as f:
+        for line in f:
+            data = json.loads(line)
+            if data['type'] == 'snapshot':
+                bids.clear()
+                asks.clear()
+            for side, book in ((bids, data['data']['b']), (asks, data['data']['a'])):
+                for p, v in book:
+                    if float(v) == 0:
+                        side.pop(float(p), None)
+                    else:
+                        side[float(p)] = float(v)
+            top_bids = sorted(bids, reverse=True)[:data_depth]
+            top_asks = sorted(asks)[:data_depth]
+            ticks.append((data['ts'], top_bids, [bids[p] for p in top_bids], top_asks, [asks[p] for p in top_asks]))
+    return ticks
+
+def pad(values, data_depth):
+    return values + [0.0] * (data_depth - len(values))
+
+@pytest.mark.parametrize('data_depth', [1, 5, 60])
+def test_feed_matches_full_sort(tmp_path, data_depth):
+    path = str(tmp_path / 'ob.data')
+    synthetic_ob500(path, 300, seed=2, levels=50)
+    expected = reference_book(path, data_depth)
+    loader = DataLoader()
+    ticks = [(t.timestamp, t.bid_price.tolist(), t.bid_volume.tolist(), t.ask_price.tolist(), t.ask_volume.tolist())
+             for t in loader.iter_order_book(path, data_depth)]
+    assert ticks == [(ts, *(pad(v, data_depth) for v in values)) for ts, *values in expected]
+    assert loader.order_book_stats['messages'] == len(expected)
+
+def test_gzip_feed_matches_plain(tmp_path):
+    plain, packed = str(tmp_path / 'ob.data'), str(tmp_path / 'ob.data.gz')
+    synthetic_ob500(plain, 100, seed=5, levels=30)
+    synthetic_ob500(packed, 100, seed=5, levels=30)
+    loader = DataLoader()
+    as_rows = lambda ticks: [(t.timestamp, t.bid_price.tolist(), t.ask_price.tolist(), t.ask_volume.tolist()) for t in ticks]
+    assert as_rows(loader.iter_order_book(packed)) == as_rows(loader.process_order_book(plain))
+
+def test_real_feed_matches_full_sort():
+    expected = reference_book(REAL_FEED, 5)
+    ticks = DataLoader().process_order_book(REAL_FEED, 5)
+    assert len(ticks) == len(expected)
+    for tick, (ts, bid_price, bid_volume, ask_price, ask_volume) in zip(ticks, expected):
+        assert tick.timestamp == ts
+        assert tick.bid_price.tolist() == pad(bid_price, 5) and tick.ask_price.tolist() == pad(ask_price, 5)
+        assert tick.bid_volume.tolist() == pad(bid_volume, 5) and tick.ask_volume.tolist() == pad(ask_volume, 5)
@@ -0,0 +1,147 @@
+import random
+import pytest
+from constant import Status
+from item import OrderData
+from simulator import OrderQueue
+
+class ReferenceQueue:
+    '''
+    list based OrderQueue as it was before the deque rewrite : history_amount() sums the queue,
+    algo orders are removed from their list on cancel instead of being marked
+    '''
+    def __init__(self, price: float):
+        self.price = price
+        self.queue = []
+        self.next_orders = []
+        self.total_amount_var = 0
+        self.fills = []
+
+    def add_order(self, order: OrderData):
+        if order.is_history:
+            self.queue.append([order, self.next_orders])
+            self.next_orders = []
+        else:
+            self.next_orders.append(order)
+        self.total_amount_var += order.remain()
+
+    def _consume_algo_order_list(self, orders, amount: float):
+        while len(orders) > 0:
+            order = orders[0]
+            if amount >= order.remain():
+                trade_amount = order.remain()
+                amount -= trade_amount
+                order.traded += trade_amount
+                self.total_amount_var -= trade_amount
+                self.fills.append((order.order_id, self.price, trade_amount))
+                orders.pop(0)
+            else:
+                order.traded += amount
+                self.fills.append((order.order_id, self.price, amount))
+                self.total_amount_var -= amount
+                break
+
+    def _link_algo_orders(self, algo_orders):
+        if len(self.queue) > 1:
+            self.queue[1][1] = algo_orders + self.queue[1][1]
+        else:
+            self.next_orders = algo_orders + self.next_orders
+
+    def match_order(self, amount: float) -> float:
+        hist_amount = amount
+        while len(self.queue) > 0:
+            hist_order, algo_orders = self.queue[0]
+            if amount >= hist_order.remain():
+                amount -= hist_order.remain()
+                self._consume_algo_order_list(algo_orders, hist_order.remain())
+                if len(algo_orders) > 0:
+                    self._link_algo_orders(algo_orders)
+                self.queue.pop(0)
+            else:
+                hist_order.traded += amount
+                self._consume_algo_order_list(algo_orders, amount)
+                amount = 0
+                break
+        self.total_amount_var -= hist_amount - amount
+        return amount
+
+    def total_amount(self):
+        return self.total_amount_var
+
+    def history_amount(self):
+        return sum(hist.remain() for hist, _ in self.queue)
+
+    def cancel_data_order(self, amount: float):
+        hist_amount = amount
+        while len(self.queue) > 0:
+            hist_order, algo_orders = self.queue[0]
+            if amount >= hist_order.remain():
+                amount -= hist_order.remain()
+                if len(algo_orders) > 0:
+                    self._link_algo_orders(algo_orders)
+                self.queue.pop(0)
+            else:
+                hist_order.volume -= amount
+                amount = 0
+                break
+        self.total_amount_var -= hist_amount - amount
+        return amount
+
+    def cancel_algo_order(self, order: OrderData):
+        for algos in [algos for _, algos in self.queue] + [self.next_orders]:
+            for idx, o in enumerate(algos):
+                if o.order_id == order.order_id:
+                    self.total_amount_var -= o.remain()
+                    algos.pop(idx)
+                    return
+
+def random_ops(seed: int, steps: int = 200):
+    rnd = random.Random(seed)
+    ops, algos = [], 0
+    for _ in range(steps):
+        r = rnd.random()
+        if r < 0.35:
+            ops.append(('history', rnd.randint(1, 5) / 10))
+        elif r < 0.6:
+            ops.append(('algo', rnd.randint(1, 5) / 10))
+            algos += 1
+        elif r < 0.8:
+            ops.append(('match', rnd.randint(1, 9) / 10))
+        elif r < 0.9:
+            ops.append(('cancel_data', rnd.randint(1, 9) / 10))
+        elif algos:
+            ops.append(('cancel_algo', rnd.randrange(algos)))
+    return ops
+
+def replay(q, ops):
+    '''
+    apply ops to q, returns the observable state after every op; orders are named by creation index
+    '''
+    algos, names, log = [], {}, []
+    for op, arg in ops:
+        if op in ('history', 'algo'):
+            order = OrderData({'volume': arg, 'is_history': op == 'history', 'traded': 0})
+            names[order.order_id] = len(names)
+            if op == 'algo':
+                algos.append(order)
+            q.add_order(order)
+        elif op == 'match':
+            log.append(q.match_order(arg))
+        elif op == 'cancel_data':
+            log.append(q.cancel_data_order(arg))
+        elif algos[arg].status != Status.CANCELLED and algos[arg].remain() > 0:
+            q.cancel_algo_order(algos[arg])
+            algos[arg].status = Status.CANCELLED
+        log.append((round(q.history_amount(), 9), round(q.total_amount(), 9)))
+    return log, names
+
+@pytest.mark.parametrize('seed', range(300))
+def test_order_queue_matches_reference(seed):
+    ops = random_ops(seed)
+    new = OrderQueue(100)
+    ref = ReferenceQueue(100)
+    new_log, new_names = replay(new, ops)
+    ref_log, ref_names = replay(ref, ops)
+    assert new_log == ref_log
+    new_fills = [(new_names[int(i)], p, round(a, 9)) for i, p, a in new.fills.drain().tolist()]
+    ref_fills = [(ref_names[i], p, round(a, 9)) for i, p, a in ref.fills]
+    assert new_fills == ref_fills
@@ -0,0 +1,41 @@
+import pytest
+from engine import Engine
+from grid_trading import GridTrading
+from profiler import Profiler, STAGES
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+
+def run(batch, n=3000):
+    engine = Engine()
+    engine.symbol = SYMBOL
+    engine.init_exchange()
+    engine.exchange.add_account('test', 1000000)
+    tape = synthetic_trades(n, seed=7)
+    engine.order_iter, engine.block_iter = tape.iter_trades(500), tape.iter_blocks(500)
+    strategy = GridTrading(SYMBOL, START_PRICE - 1000, START_PRICE + 1000, 10, 10, 0.1, 200)
+    strategy.set_engine(engine)
+    engine.set_strategy(strategy)
+    profiler = Profiler(sample_every=100)
+    engine.start(batch=batch, history_file=None, progress_bar=False, profiler=profiler)
+    return engine, profiler
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_stages(batch):
+    engine, profiler = run(batch)
+    calls = profiler.calls
+    assert calls['data'] == 3000 # trades, not blocks
+    assert calls['on_tick'] > 0 and calls['process_trade_data'] > 0
+    if batch:
+        assert calls['engine.replay_block'] == 6 and calls['exchange.replay_history'] >= 6
+        assert calls['future.replay_history'] > 0
+        assert calls['exchange.place_order'] < 3000 # only algo orders and the trades that reach them
+        assert profiler.ns['engine.replay_block'] >= profiler.ns['exchange.replay_history'] >= profiler.ns['future.replay_history']
+    else:
+        assert calls['engine.replay_block'] == calls['exchange.replay_history'] == calls['future.replay_history'] == 0
+        assert calls['exchange.place_order'] >= 3000
+    assert sum(profiler.book_levels.values()) > 0
+    report = profiler.report()
+    for stage in STAGES:
+        assert (stage in report) == (calls[stage] > 0)
+    # detach() restores the methods and the iterators
+    for obj in [engine, engine.exchange, engine.strategy] + list(engine.exchange.futures.values()):
+        assert not {'replay_block', 'replay_history', 'place_order', 'snapshot', 'update_cur_price', 'process_trade_data', 'on_tick'} & vars(obj).keys()
@@ -0,0 +1,81 @@
+import random
+import pytest
+import simulator
+from constant import Direction, Offset
+from helpers import SYMBOL, make_exchange, place
+
+SIDES = [(Direction.LONG, Offset.OPEN), (Direction.LONG, Offset.CLOSE), (Direction.SHORT, Offset.OPEN), (Direction.SHORT, Offset.CLOSE)]
+
+def resting(exchange, direction, offset, account='test', level=0):
+    # an algo order alone on its level below the bid / above the ask (LONG CLOSE sells, SHORT CLOSE buys),
+    # its fills are appended by hand
+    buy = (direction == Direction.LONG) == (offset == Offset.OPEN)
+    price = 80 - level if buy else 110 + level
+    return place(exchange, price, 1000, direction, offset, account=account)
+
+def settle(exchange, fills, price=100.0, timestamp=1):
+    for order, fill_price, amount in fills:
+        exchange.fills.append(order.order_id, fill_price, amount)
+    exchange.process_trade_data(price, timestamp)
+
+@pytest.mark.parametrize('threshold', [0, 100]) # array path / one fill at a time
+def test_fill_sides(monkeypatch, threshold):
+    monkeypatch.setattr(simulator, 'SCALAR_FILLS', threshold)
+    exchange = make_exchange(balance=1000)
+    orders = [resting(exchange, direction, offset, level=i) for i, (direction, offset) in enumerate(SIDES)]
+    position = exchange.accounts['test'].position[SYMBOL]
+    settle(exchange, [(orders[0], 80.0, 2)])
+    assert exchange.accounts['test'].balance == 840 and position['long'] == 2
+    settle(exchange, [(orders[1], 80.0, 1)])
+    assert exchange.accounts['test'].balance == 920 and position['long'] == 1
+    settle(exchange, [(orders[2], 110.0, 3)])
+    assert exchange.accounts['test'].balance == 1250 and position['short'] == 3
+    settle(exchange, [(orders[3], 110.0, 1)], price=105.0, timestamp=7)
+    assert exchange.accounts['test'].balance == 1140 and position['short'] == 2
+    assert exchange.trade_history['test'].tolist()[-1] == [7, SYMBOL, 1140.0, 1.0, 2.0, 1140.0 + (1 - 2) * 105.0, 105.0]
+    assert exchange.fill_count == 4
+
+@pytest.mark.parametrize('threshold', [0, 100])
+def test_filled_order_is_forgotten(monkeypatch, threshold):
+    monkeypatch.setattr(simulator, 'SCALAR_FILLS', threshold)
+    exchange = make_exchange()
+    order = resting(exchange, Direction.LONG, Offset.OPEN)
+    exchange.futures[SYMBOL].orders.pop(order.order_id) # filled : no longer resting
+    settle(exchange, [(order, 80.0, 1000)])
+    assert order.order_id not in exchange.orders and order.order_id not in exchange.order_account
+
+def run(seed, threshold, batches):
+    '''
+    random batches of fills over two accounts and all four sides, returns everything settlement touches
+    '''
+    simulator.SCALAR_FILLS = threshold
+    rnd = random.Random(seed)
+    exchange = make_exchange(balance=10000)
+    exchange.add_account('other', 5000)
+    trackers = {name: exchange.track_equity(name) for name in ('test', 'other')}
+    orders = [resting(exchange, direction, offset, account, 2 * i + j) for i, (direction, offset) in enumerate(SIDES)
+              for j, account in enumerate(('test', 'other'))]
+    index = {order.order_id: i for i, order in enumerate(orders)} # order ids differ between runs
+    received = []
+    exchange.fill_subscribers.append(lambda fills: received.append([(index[int(i)], p, a) for i, p, a in fills.tolist()]))
+    for timestamp, size in enumerate(batches):
+        fills = [(rnd.choice(orders), rnd.randint(800, 1200) / 10, rnd.randint(1, 30) / 10) for _ in range(size)]
+        settle(exchange, fills, rnd.randint(800, 1200) / 10, timestamp)
+    return ({name: (account.balance, dict(account.position[SYMBOL])) for name, account in exchange.accounts.items()},
+            {name: ledger.tolist() for name, ledger in exchange.trade_history.items()},
+            {name: tracker.traded_notional for name, tracker in trackers.items()},
+            received)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_scalar_and_array_settlement_agree(monkeypatch, seed):
+    monkeypatch.setattr(simulator, 'SCALAR_FILLS', simulator.SCALAR_FILLS)
+    batches = [random.Random(seed).randint(1, simulator.SCALAR_FILLS - 1) for _ in range(50)]
+    assert run(seed, 0, batches) == run(seed, 100, batches) # bit for bit, not approximately
+
+def test_large_batches_agree_with_one_fill_at_a_time(monkeypatch):
+    monkeypatch.setattr(simulator, 'SCALAR_FILLS', simulator.SCALAR_FILLS)
+    accounts, ledgers, notional, received = run(1, 0, [40] * 10)
+    scalar_accounts, scalar_ledgers, scalar_notional, scalar_received = run(1, 100, [40] * 10)
+    assert (accounts, ledgers, received) == (scalar_accounts, scalar_ledgers, scalar_received)
+    # np.sum adds pairwise over a long batch, the traded notional may differ in the last bits
+    assert notional == pytest.approx(scalar_notional, rel=1e-12)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+from data_loader import TradeTape
+from grid_trading import GridTrading
+from sharding import shard_bounds, new_engine, run_sharded
+
+PARAMS = {'symbol': SYMBOL, 'low_price': START_PRICE - 1000, 'high_price': START_PRICE + 1000, 'step_price': 10,
+          'profit': 10, 'amount': 0.1, 'min_balance': 200}
+OPTS = {'head_num': None, 'chunk_size': 700}
+
+@pytest.fixture
+def tape_path(tmp_path):
+    return synthetic_trades(6000, seed=10).save(str(tmp_path / 'bench.tape'), 'synthetic')
+
+def single_run(tape, lo=0, hi=None):
+    engine = new_engine(SYMBOL, 1000000, GridTrading, PARAMS)
+    for block in tape.take(slice(lo, hi)).iter_blocks(OPTS['chunk_size']):
+        engine.replay_block(block)
+    return engine.exchange.trade_history['test'].to_frame()
+
+def test_shard_bounds_keep_equal_timestamps_together():
+    timestamps = np.array([0, 0, 1, 5, 5, 5, 6, 9, 9, 10])
+    bounds = shard_bounds(timestamps, 3)
+    assert bounds[0] == 0 and bounds[-1] == len(timestamps) and bounds == sorted(bounds)
+    for b in bounds[1:-1]:
+        assert timestamps[b - 1] != timestamps[b]
+    assert shard_bounds(np.array([], dtype=np.int64), 4) == [0, 0]
+
+def test_checkpoint_seed_stitches_to_the_single_run(tape_path):
+    history, report = run_sharded(GridTrading, PARAMS, tape_path, SYMBOL, OPTS, n_shards=4, processes=1,
+                                  seed='checkpoint', reference=True)
+    expected = single_run(TradeTape.open(tape_path))
+    assert len(report) == 4 and report['trades'].sum() == 6000 and report['fills'].sum() == len(expected) > 0
+    assert (report['pnl_diff'] == 0).all()
+    assert history['shard'].is_monotonic_increasing
+    for column in ('timestamp', 'symbol', 'long', 'short', 'price'):
+        assert history[column].tolist() == expected[column].tolist()
+    for column in ('balance', 'account_value'): # offset by the carried PnL, a float sum
+        assert history[column].to_numpy() == pytest.approx(expected[column].to_numpy(), rel=1e-12)
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_replay_seed_shards_start_flat(tape_path, processes):
+    history, report = run_sharded(GridTrading, PARAMS, tape_path, SYMBOL, OPTS, n_shards=3, processes=processes, reference=True)
+    tape = TradeTape.open(tape_path)
+    bounds = shard_bounds(tape.timestamp, 3)
+    assert report['trades'].tolist() == np.diff(bounds).tolist()
+    # the first shard starts from the same empty book and fresh account as the single run
+    first = history[history['shard'] == 0]
+    expected = single_run(tape, 0, bounds[1])
+    for column in ('timestamp', 'balance', 'long', 'short', 'account_value'):
+        assert first[column].tolist() == expected[column].tolist()
+    assert (report['start_value'] == 1000000).all() # fresh account per shard
+    assert report['mid_gap'].iloc[:-1].notna().all() and np.isnan(report['mid_gap'].iloc[-1])
+    assert report['ref_pnl'].sum() == pytest.approx(report['pnl'].sum() - report['pnl_diff'].sum())
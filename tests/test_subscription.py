@@ -0,0 +1,91 @@
+from bisect import bisect_right
+from types import SimpleNamespace
+import pytest
+from engine import Engine
+from grid_trading import GridTrading
+from subscription import Subscription, PriceCross, Timer, Fills, TopOfBook
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+
+class Always(Subscription):
+    # fires on every order, records what the other subscriptions see
+    def __init__(self):
+        super().__init__(None)
+        self.trace = []
+
+    def poll(self, exchange, symbol, timestamp):
+        future = exchange.futures[symbol]
+        self.trace.append((timestamp, exchange.cur_price.get(symbol), (future.best_bid(), future.best_ask()), exchange.fill_count))
+        return True
+
+class Watcher:
+    data_depth = 0
+
+    def __init__(self, subscription):
+        self.subscription, self.symbol, self.seen = subscription, SYMBOL, []
+
+    def subscriptions(self):
+        return [self.subscription]
+
+    def on_tick(self, snapshot, cur_price, timestamp):
+        self.seen.append(timestamp)
+
+LEVELS = [START_PRICE + 5 * i for i in range(-40, 41)]
+
+def expected_price_cross(trace):
+    seen, interval = [], None
+    for timestamp, price, _, _ in trace:
+        if price is not None and bisect_right(LEVELS, price) != interval:
+            interval = bisect_right(LEVELS, price)
+            seen.append(timestamp)
+    return seen
+
+def expected_timer(trace, interval):
+    seen = []
+    for timestamp, _, _, _ in trace:
+        if not seen or timestamp >= seen[-1] + interval:
+            seen.append(timestamp)
+    return seen
+
+def expected_change(trace, column, start):
+    seen, last = [], start
+    for row in trace:
+        if row[column] != last:
+            last = row[column]
+            seen.append(row[0])
+    return seen
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_every_subscription_fires_when_its_condition_changes(batch):
+    engine = Engine()
+    engine.symbol = SYMBOL
+    engine.init_exchange()
+    engine.exchange.add_account('test', 1000000)
+    tape = synthetic_trades(3000, seed=8)
+    engine.order_iter, engine.block_iter = tape.iter_trades(500), tape.iter_blocks(500)
+    recorder = Watcher(Always())
+    watchers = {name: Watcher(subscription) for name, subscription in
+                [('price', PriceCross(SYMBOL, LEVELS)), ('timer', Timer(50000)), ('fills', Fills()), ('top', TopOfBook(SYMBOL))]}
+    grid = GridTrading(SYMBOL, START_PRICE - 1000, START_PRICE + 1000, 10, 10, 0.01, 200) # added last, makes the fills
+    grid.set_engine(engine)
+    for strategy in [recorder, *watchers.values(), grid]:
+        engine.add_strategy(strategy)
+    engine.start(batch=batch, history_file=None, progress_bar=False)
+    trace = recorder.subscription.trace
+    assert len(trace) == 3000 and recorder.seen == [row[0] for row in trace]
+    assert watchers['price'].seen == expected_price_cross(trace)
+    assert watchers['timer'].seen == expected_timer(trace, 50000)
+    assert watchers['fills'].seen == expected_change(trace, 3, 0)
+    assert watchers['top'].seen == expected_change(trace, 2, (None, None))
+    for watcher in watchers.values():
+        assert 1 < len(watcher.seen) < 3000 # fired, but not on every order
+
+def test_other_symbols_are_ignored():
+    exchange = SimpleNamespace(cur_price={'A': 100.0, 'B': 100.0})
+    cross, timer = PriceCross('A', [99.0, 101.0]), Timer(10, 'A')
+    assert not cross.poll(exchange, 'B', 0) and not timer.poll(exchange, 'B', 0)
+    assert cross.poll(exchange, 'A', 0) and timer.poll(exchange, 'A', 0)
+    exchange.cur_price['A'] = 100.5
+    assert not cross.poll(exchange, 'A', 20) # same interval
+    assert timer.poll(exchange, 'A', 20) and not timer.poll(exchange, 'A', 29)
+    exchange.cur_price['A'] = 101.0 # a level belongs to the interval above it
+    assert cross.poll(exchange, 'A', 30) and cross.band(exchange, 'A') == (101.0, float('inf'), float('inf'))
@@ -0,0 +1,37 @@
+import pytest
+from engine import Engine
+from grid_trading import GridTrading
+from sweep import param_grid, sweep
+from benchmark import synthetic_trades, SYMBOL, START_PRICE
+
+GRID = {'symbol': [SYMBOL], 'low_price': [START_PRICE - 1000], 'high_price': [START_PRICE + 1000],
+        'step_price': [10, 50], 'profit': [10, 20], 'amount': [0.1], 'min_balance': [200]}
+
+def direct(tape_path, params, balance=1000000):
+    # the same backtest without sweep
+    engine = Engine()
+    engine.symbol = SYMBOL
+    engine.init_exchange()
+    engine.exchange.add_account('test', balance)
+    engine.load_data(tape_path, SYMBOL, opts={'head_num': None})
+    strategy = GridTrading(**params)
+    strategy.set_engine(engine)
+    engine.set_strategy(strategy)
+    engine.start(history_file=None, progress_bar=False)
+    account = engine.exchange.accounts['test']
+    return account.balance, dict(account.position[SYMBOL]), len(engine.exchange.trade_history['test'])
+
+def test_param_grid():
+    assert param_grid({'a': [1, 2], 'b': [3]}) == [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_sweep_on_a_non_default_symbol(tmp_path, processes):
+    tape_path = str(tmp_path / 'bench.tape')
+    synthetic_trades(3000, seed=2).save(tape_path, 'synthetic')
+    result = sweep(GridTrading, GRID, tape_path, SYMBOL, opts={'head_num': None}, processes=processes)
+    assert len(result) == 4
+    for row, params in zip(result.to_dict('records'), param_grid(GRID)):
+        assert {k: row[k] for k in params} == params
+        balance, position, fills = direct(tape_path, params)
+        assert (row['balance'], row['long'], row['short'], row['fills']) == (balance, position['long'], position['short'], fills)
+    assert result['fills'].min() > 0 and result['balance'].nunique() > 1 # every config traded, and not all the same way
@@ -0,0 +1,65 @@
+import numpy as np
+from constant import Direction
+from item import TickData, TickRing
+from simulator import Exchange
+from helpers import SYMBOL, trade
+
+def book_exchange(levels: int = 5) -> Exchange:
+    tick = TickData({'symbol': SYMBOL, 'bid_price': [90 - i for i in range(levels)], 'bid_volume': [1 + i for i in range(levels)],
+                     'ask_price': [101 + i for i in range(levels)], 'ask_volume': [2 + i for i in range(levels)], 'data_depth': levels})
+    return Exchange({SYMBOL: tick}, 5)
+
+def reference_snapshot(future):
+    # Future.snapshot before the preallocated ticks : a new TickData from the first levels of both books
+    sps = list(future.sell_book.keys())[:5]
+    bps = list(reversed(future.buy_book.keys()))[:5]
+    depth = min(len(sps), len(bps), future.max_depth)
+    return ([float(p) for p in bps[:depth]], [future.buy_book[p].total_amount() for p in bps[:depth]],
+            [float(p) for p in sps[:depth]], [future.sell_book[p].total_amount() for p in sps[:depth]])
+
+def as_lists(tick):
+    return tick.bid_price.tolist(), tick.bid_volume.tolist(), tick.ask_price.tolist(), tick.ask_volume.tolist()
+
+def test_rows_are_views_of_one_buffer():
+    tick = TickData({'bid_price': [3, 2, 1], 'ask_price': [4, 5, 6], 'data_depth': 3})
+    assert tick.data_depth == 3 and tick.buffer.shape == (4, 3)
+    tick.bid_price[0] = 7
+    assert tick.buffer[0, 0] == 7
+    assert tick.ask_price.tolist() == [4, 5, 6] and tick.ask_volume.tolist() == [0, 0, 0]
+
+def test_set_data_depth_reuses_the_buffer():
+    tick = TickData({'data_depth': 5})
+    buffer = tick.buffer
+    tick.bid_price[:] = 1
+    tick.set_data_depth(2)
+    assert tick.buffer is buffer and tick.bid_price.tolist() == [0, 0] # the visible part is reset
+    tick.set_data_depth(5)
+    assert tick.buffer is buffer and tick.bid_price.tolist() == [0] * 5 # and nothing stale shows up again
+    tick.set_data_depth(8)
+    assert tick.buffer is not buffer and tick.buffer.shape == (4, 8)
+
+def test_ring_hands_out_the_same_ticks_again():
+    ring = TickRing(SYMBOL, 5, size=3)
+    ticks = [ring.next() for _ in range(7)]
+    assert len({id(t) for t in ticks[:3]}) == 3
+    assert ticks[3] is ticks[0] and ticks[4] is ticks[1] and ticks[6] is ticks[0]
+    assert all(t.symbol == SYMBOL and t.buffer.shape == (4, 5) for t in ticks)
+
+def test_snapshot_matches_reference_while_trading():
+    exchange = book_exchange()
+    future = exchange.futures[SYMBOL]
+    rnd = np.random.default_rng(0)
+    for i in range(200):
+        price = int(rnd.integers(85, 106))
+        trade(exchange, price, float(rnd.integers(1, 4)), Direction.LONG if rnd.random() < 0.5 else Direction.SHORT, timestamp=i)
+        assert as_lists(future.snapshot()) == reference_snapshot(future)
+
+def test_snapshot_reuses_ring_ticks():
+    exchange = book_exchange()
+    future = exchange.futures[SYMBOL]
+    ring_size = len(future.ticks.ticks)
+    ticks = [future.snapshot() for _ in range(ring_size + 1)]
+    assert len({id(t) for t in ticks[:ring_size]}) == ring_size # valid until the ring wraps around
+    assert ticks[ring_size] is ticks[0]
+    shallow = future.snapshot(2)
+    assert shallow.data_depth == 2 and as_lists(shallow) == tuple(values[:2] for values in reference_snapshot(future))